@@ -0,0 +1,432 @@
+-- =====================================================
+-- AGREGADOS POR PK: Resumen incremental de la historia
+-- =====================================================
+-- Fecha: 2025-12-29
+-- Objetivo: Una fila por (muro, sector, pk) con el resumen de toda su
+-- historia, para que los dashboards no tengan que recorrer
+-- vista_revanchas_georreferenciadas en todas las fechas.
+--
+-- La tabla la mantiene carga_masiva.py (agregados_pk.py) en cada carga:
+-- fusionar_agregados_pks() suma al resumen guardado las filas del archivo
+-- nuevo (O(PKs del archivo), sin releer la historia). Solo cuando se
+-- recarga una fecha ya aplicada se recalcula el muro desde las mediciones.
+-- La función recalcular_agregados_pk() la reconstruye desde cero.
+--
+-- Cada PK se agrupa por el PK del maestro (pk_maestro, emparejar_pks.py)
+-- si lo tiene, igual que la vista: "0+060" y "0.0599..." suman en la
+-- misma fila. Requiere CORREGIR_VISTAS_REVANCHAS.sql (columna pk_maestro).
+-- =====================================================
+
+
+-- PASO 1: Crear tabla revanchas_agregados_pk
+-- =====================================================
+-- Por cada métrica: último valor, mínimo, máximo y pendiente (m/año)
+-- de las últimas 10 mediciones (guardadas en las columnas ventana_*).
+
+CREATE TABLE IF NOT EXISTS revanchas_agregados_pk (
+    muro VARCHAR(50) NOT NULL,
+    sector VARCHAR(10) NOT NULL,
+    pk TEXT NOT NULL, -- PK del maestro; si no lo tiene, el de la planilla (puede no tener formato km+m)
+    
+    total_mediciones INTEGER NOT NULL DEFAULT 0,
+    fecha_primera DATE,
+    fecha_ultima DATE,
+    ventana_fechas DATE[] NOT NULL DEFAULT '{}',
+    
+    -- Revancha
+    revancha_ultimo DECIMAL(10, 3),
+    revancha_min DECIMAL(10, 3),
+    revancha_max DECIMAL(10, 3),
+    revancha_pendiente DECIMAL(10, 4), -- m/año
+    ventana_revancha DECIMAL(10, 3)[] NOT NULL DEFAULT '{}',
+    
+    -- Ancho
+    ancho_ultimo DECIMAL(10, 3),
+    ancho_min DECIMAL(10, 3),
+    ancho_max DECIMAL(10, 3),
+    ancho_pendiente DECIMAL(10, 4), -- m/año
+    ventana_ancho DECIMAL(10, 3)[] NOT NULL DEFAULT '{}',
+    
+    -- Distancia geomembrana - lama
+    dist_geo_lama_ultimo DECIMAL(10, 3),
+    dist_geo_lama_min DECIMAL(10, 3),
+    dist_geo_lama_max DECIMAL(10, 3),
+    dist_geo_lama_pendiente DECIMAL(10, 4), -- m/año
+    ventana_dist_geo_lama DECIMAL(10, 3)[] NOT NULL DEFAULT '{}',
+    
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    
+    CONSTRAINT revanchas_agregados_pk_pkey PRIMARY KEY (muro, sector, pk),
+    CONSTRAINT check_muro_agregados CHECK (muro IN ('Principal', 'Este', 'Oeste'))
+);
+
+-- Tablas creadas con pk VARCHAR(20): los PKs irregulares sin PK del
+-- maestro (emparejar_pks.py) pueden ser más largos
+ALTER TABLE revanchas_agregados_pk ALTER COLUMN pk TYPE TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_agregados_muro_fecha_ultima
+    ON revanchas_agregados_pk (muro, fecha_ultima);
+
+-- Fecha de cada muro ya sumada a los agregados y el archivo que la aportó.
+-- Si llega otro archivo con la misma fecha (recarga), sus valores antiguos
+-- ya están en los agregados: se recalcula el muro en vez de sumar.
+CREATE TABLE IF NOT EXISTS revanchas_agregados_fechas (
+    muro VARCHAR(50) NOT NULL,
+    fecha_medicion DATE NOT NULL,
+    archivo_id BIGINT NOT NULL,
+    aplicado TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    CONSTRAINT revanchas_agregados_fechas_pkey PRIMARY KEY (muro, fecha_medicion)
+);
+
+-- Recálculo por PK del maestro (recargas y reconstrucción)
+CREATE INDEX IF NOT EXISTS idx_mediciones_sector_pk_efectivo
+    ON revanchas_mediciones (sector, (COALESCE(pk_maestro, pk)));
+
+COMMENT ON TABLE revanchas_agregados_pk IS
+'Resumen por PK de la historia de revanchas (conteo, fechas, último/mín/máx y pendiente móvil). Actualizada incrementalmente por carga_masiva.py.';
+
+
+-- PASO 2: Mantener updated_at
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION actualizar_updated_at_agregados()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_updated_at_agregados ON revanchas_agregados_pk;
+CREATE TRIGGER trigger_updated_at_agregados
+    BEFORE UPDATE ON revanchas_agregados_pk
+    FOR EACH ROW EXECUTE FUNCTION actualizar_updated_at_agregados();
+
+
+-- PASO 3: Recalcular PKs desde las mediciones
+-- =====================================================
+-- Recorre la historia de los PKs pedidos (p_claves NULL = todo el muro):
+-- fusionar_agregados_pks() lo usa solo cuando se recarga una fecha ya
+-- aplicada (sus valores antiguos no se pueden restar de un mínimo o
+-- máximo). Con el muro completo también rehace revanchas_agregados_fechas.
+-- La pendiente usa regr_slope sobre las últimas p_ventana mediciones.
+-- Usa el índice (sector, COALESCE(pk_maestro, pk)) de revanchas_mediciones.
+
+CREATE OR REPLACE FUNCTION recalcular_agregados_pks(
+    p_muro TEXT,
+    p_claves JSONB DEFAULT NULL,
+    p_ventana INTEGER DEFAULT 10
+)
+RETURNS INTEGER AS $$
+DECLARE
+    total INTEGER;
+BEGIN
+    -- Varios trabajadores (`revanchas.py work`) pueden subir archivos del mismo
+    -- muro a la vez: los recálculos del muro se hacen de a uno, y cada uno lee
+    -- las mediciones ya confirmadas recién después de obtener el lock (sin
+    -- esto, un recálculo con una lectura anterior podía pisar al más nuevo)
+    PERFORM pg_advisory_xact_lock(hashtext('agregados|' || p_muro));
+    
+    WITH claves AS (
+        SELECT c.sector, c.pk
+        FROM jsonb_to_recordset(COALESCE(p_claves, '[]'::JSONB)) AS c(sector TEXT, pk TEXT)
+    ),
+    historia AS (
+        SELECT 
+            ra.muro,
+            rm.sector,
+            COALESCE(rm.pk_maestro, rm.pk) AS pk,
+            ra.fecha_medicion AS fecha,
+            (ra.fecha_medicion - DATE '1970-01-01') AS dia,
+            rm.revancha,
+            rm.ancho,
+            rm.dist_geo_lama,
+            ROW_NUMBER() OVER (
+                PARTITION BY ra.muro, rm.sector, COALESCE(rm.pk_maestro, rm.pk)
+                ORDER BY ra.fecha_medicion DESC
+            ) AS orden
+        FROM revanchas_mediciones rm
+        INNER JOIN revanchas_archivos ra ON rm.archivo_id = ra.id
+        WHERE ra.muro = p_muro
+          AND (p_claves IS NULL OR (rm.sector, COALESCE(rm.pk_maestro, rm.pk)) IN (SELECT sector, pk FROM claves))
+    ),
+    resumen AS (
+        SELECT 
+            muro, sector, pk,
+            COUNT(*) AS total_mediciones,
+            MIN(fecha) AS fecha_primera,
+            MAX(fecha) AS fecha_ultima,
+            MAX(revancha) FILTER (WHERE orden = 1) AS revancha_ultimo,
+            MIN(revancha) AS revancha_min,
+            MAX(revancha) AS revancha_max,
+            MAX(ancho) FILTER (WHERE orden = 1) AS ancho_ultimo,
+            MIN(ancho) AS ancho_min,
+            MAX(ancho) AS ancho_max,
+            MAX(dist_geo_lama) FILTER (WHERE orden = 1) AS dist_geo_lama_ultimo,
+            MIN(dist_geo_lama) AS dist_geo_lama_min,
+            MAX(dist_geo_lama) AS dist_geo_lama_max
+        FROM historia
+        GROUP BY muro, sector, pk
+    ),
+    ventana AS (
+        SELECT 
+            muro, sector, pk,
+            ARRAY_AGG(fecha ORDER BY fecha) AS ventana_fechas,
+            ARRAY_AGG(revancha ORDER BY fecha) AS ventana_revancha,
+            ARRAY_AGG(ancho ORDER BY fecha) AS ventana_ancho,
+            ARRAY_AGG(dist_geo_lama ORDER BY fecha) AS ventana_dist_geo_lama,
+            regr_slope(revancha, dia) * 365.25 AS revancha_pendiente,
+            regr_slope(ancho, dia) * 365.25 AS ancho_pendiente,
+            regr_slope(dist_geo_lama, dia) * 365.25 AS dist_geo_lama_pendiente
+        FROM historia
+        WHERE orden <= p_ventana
+        GROUP BY muro, sector, pk
+    ),
+    -- PKs pedidos que ya no tienen mediciones (archivo reemplazado sin ese PK)
+    eliminados AS (
+        DELETE FROM revanchas_agregados_pk a
+        WHERE a.muro = p_muro
+          AND (p_claves IS NULL OR (a.sector, a.pk) IN (SELECT sector, pk FROM claves))
+          AND NOT EXISTS (SELECT 1 FROM resumen r WHERE r.sector = a.sector AND r.pk = a.pk)
+    )
+    INSERT INTO revanchas_agregados_pk (
+        muro, sector, pk, total_mediciones, fecha_primera, fecha_ultima, ventana_fechas,
+        revancha_ultimo, revancha_min, revancha_max, revancha_pendiente, ventana_revancha,
+        ancho_ultimo, ancho_min, ancho_max, ancho_pendiente, ventana_ancho,
+        dist_geo_lama_ultimo, dist_geo_lama_min, dist_geo_lama_max, dist_geo_lama_pendiente, ventana_dist_geo_lama
+    )
+    SELECT 
+        r.muro, r.sector, r.pk, r.total_mediciones, r.fecha_primera, r.fecha_ultima, v.ventana_fechas,
+        r.revancha_ultimo, r.revancha_min, r.revancha_max, v.revancha_pendiente, v.ventana_revancha,
+        r.ancho_ultimo, r.ancho_min, r.ancho_max, v.ancho_pendiente, v.ventana_ancho,
+        r.dist_geo_lama_ultimo, r.dist_geo_lama_min, r.dist_geo_lama_max, v.dist_geo_lama_pendiente, v.ventana_dist_geo_lama
+    FROM resumen r
+    INNER JOIN ventana v USING (muro, sector, pk)
+    ON CONFLICT (muro, sector, pk) DO UPDATE SET
+        total_mediciones = EXCLUDED.total_mediciones,
+        fecha_primera = EXCLUDED.fecha_primera,
+        fecha_ultima = EXCLUDED.fecha_ultima,
+        ventana_fechas = EXCLUDED.ventana_fechas,
+        revancha_ultimo = EXCLUDED.revancha_ultimo,
+        revancha_min = EXCLUDED.revancha_min,
+        revancha_max = EXCLUDED.revancha_max,
+        revancha_pendiente = EXCLUDED.revancha_pendiente,
+        ventana_revancha = EXCLUDED.ventana_revancha,
+        ancho_ultimo = EXCLUDED.ancho_ultimo,
+        ancho_min = EXCLUDED.ancho_min,
+        ancho_max = EXCLUDED.ancho_max,
+        ancho_pendiente = EXCLUDED.ancho_pendiente,
+        ventana_ancho = EXCLUDED.ventana_ancho,
+        dist_geo_lama_ultimo = EXCLUDED.dist_geo_lama_ultimo,
+        dist_geo_lama_min = EXCLUDED.dist_geo_lama_min,
+        dist_geo_lama_max = EXCLUDED.dist_geo_lama_max,
+        dist_geo_lama_pendiente = EXCLUDED.dist_geo_lama_pendiente,
+        ventana_dist_geo_lama = EXCLUDED.ventana_dist_geo_lama;
+    
+    GET DIAGNOSTICS total = ROW_COUNT;
+    
+    IF p_claves IS NULL THEN
+        DELETE FROM revanchas_agregados_fechas WHERE muro = p_muro;
+        INSERT INTO revanchas_agregados_fechas (muro, fecha_medicion, archivo_id)
+        SELECT muro, fecha_medicion, id FROM revanchas_archivos WHERE muro = p_muro;
+    END IF;
+    
+    RETURN total;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION recalcular_agregados_pks IS
+'Recalcula desde revanchas_mediciones los agregados de los PKs indicados de un muro (p_claves = [{sector, pk}], NULL = todos).';
+
+
+-- PASO 4: Sumar un archivo nuevo (incremental)
+-- =====================================================
+-- carga_masiva.py la llama tras subir cada archivo, con una fila por
+-- (sector, pk) ya reducida en NumPy (agregados_pk.py): cantidad de filas,
+-- último valor y mínimo/máximo del archivo por métrica. Cada PK se
+-- actualiza en O(p_ventana) desde su fila guardada:
+--   total + n, fecha primera/última, mínimo/máximo, último valor (si la
+--   fecha no es anterior a la última), y la ventana con la fecha nueva
+--   insertada en orden y recortada a p_ventana, con su pendiente.
+-- Una fecha ya aplicada con otro archivo (recarga) recalcula el muro; el
+-- mismo archivo dos veces (reintento) no hace nada.
+
+CREATE OR REPLACE FUNCTION fusionar_agregados_pks(
+    p_muro TEXT,
+    p_fecha DATE,
+    p_filas JSONB,
+    p_ventana INTEGER DEFAULT 10
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_archivo_id BIGINT;
+    v_aplicado BIGINT;
+    total INTEGER;
+BEGIN
+    -- Los trabajadores (`revanchas.py work`) del mismo muro se turnan: cada
+    -- fusión lee la fila guardada recién después de obtener el lock
+    PERFORM pg_advisory_xact_lock(hashtext('agregados|' || p_muro));
+    
+    SELECT id INTO v_archivo_id
+    FROM revanchas_archivos WHERE muro = p_muro AND fecha_medicion = p_fecha;
+    IF v_archivo_id IS NULL THEN
+        RAISE EXCEPTION 'No existe archivo de % con fecha %', p_muro, p_fecha;
+    END IF;
+    
+    SELECT archivo_id INTO v_aplicado
+    FROM revanchas_agregados_fechas WHERE muro = p_muro AND fecha_medicion = p_fecha;
+    IF v_aplicado = v_archivo_id THEN
+        RETURN 0;
+    END IF;
+    IF v_aplicado IS NOT NULL THEN
+        -- Recarga: también rehace revanchas_agregados_fechas del muro
+        RETURN recalcular_agregados_pks(p_muro, NULL, p_ventana);
+    END IF;
+    
+    INSERT INTO revanchas_agregados_fechas (muro, fecha_medicion, archivo_id)
+    VALUES (p_muro, p_fecha, v_archivo_id);
+    
+    WITH nuevas AS (
+        SELECT n.*
+        FROM jsonb_to_recordset(p_filas) AS n(
+            sector TEXT, pk TEXT, n INTEGER,
+            revancha NUMERIC, revancha_min NUMERIC, revancha_max NUMERIC,
+            ancho NUMERIC, ancho_min NUMERIC, ancho_max NUMERIC,
+            dist_geo_lama NUMERIC, dist_geo_lama_min NUMERIC, dist_geo_lama_max NUMERIC
+        )
+    ),
+    fusion AS (
+        SELECT 
+            n.*,
+            a.pk IS NULL OR p_fecha >= a.fecha_ultima AS es_ultima,
+            a.total_mediciones, a.fecha_primera, a.fecha_ultima,
+            a.revancha_ultimo, a.revancha_min AS revancha_min_previo, a.revancha_max AS revancha_max_previo,
+            a.ancho_ultimo, a.ancho_min AS ancho_min_previo, a.ancho_max AS ancho_max_previo,
+            a.dist_geo_lama_ultimo, a.dist_geo_lama_min AS dist_geo_lama_min_previo,
+            a.dist_geo_lama_max AS dist_geo_lama_max_previo,
+            w.*
+        FROM nuevas n
+        LEFT JOIN revanchas_agregados_pk a
+            ON a.muro = p_muro AND a.sector = n.sector AND a.pk = n.pk
+        CROSS JOIN LATERAL (
+            SELECT 
+                ARRAY_AGG(v.fecha ORDER BY v.fecha) AS ventana_fechas,
+                ARRAY_AGG(v.revancha ORDER BY v.fecha) AS ventana_revancha,
+                ARRAY_AGG(v.ancho ORDER BY v.fecha) AS ventana_ancho,
+                ARRAY_AGG(v.dist_geo_lama ORDER BY v.fecha) AS ventana_dist_geo_lama,
+                regr_slope(v.revancha, v.fecha - DATE '1970-01-01') * 365.25 AS revancha_pendiente,
+                regr_slope(v.ancho, v.fecha - DATE '1970-01-01') * 365.25 AS ancho_pendiente,
+                regr_slope(v.dist_geo_lama, v.fecha - DATE '1970-01-01') * 365.25 AS dist_geo_lama_pendiente
+            FROM (
+                SELECT u.*
+                FROM (
+                    SELECT * FROM unnest(
+                        COALESCE(a.ventana_fechas, '{}'), COALESCE(a.ventana_revancha, '{}'),
+                        COALESCE(a.ventana_ancho, '{}'), COALESCE(a.ventana_dist_geo_lama, '{}')
+                    ) AS g(fecha, revancha, ancho, dist_geo_lama)
+                    UNION ALL
+                    SELECT p_fecha, n.revancha, n.ancho, n.dist_geo_lama
+                ) u
+                ORDER BY u.fecha DESC
+                LIMIT p_ventana
+            ) v
+        ) w
+    )
+    INSERT INTO revanchas_agregados_pk (
+        muro, sector, pk, total_mediciones, fecha_primera, fecha_ultima, ventana_fechas,
+        revancha_ultimo, revancha_min, revancha_max, revancha_pendiente, ventana_revancha,
+        ancho_ultimo, ancho_min, ancho_max, ancho_pendiente, ventana_ancho,
+        dist_geo_lama_ultimo, dist_geo_lama_min, dist_geo_lama_max, dist_geo_lama_pendiente, ventana_dist_geo_lama
+    )
+    SELECT 
+        p_muro, f.sector, f.pk,
+        COALESCE(f.total_mediciones, 0) + f.n,
+        LEAST(f.fecha_primera, p_fecha),
+        GREATEST(f.fecha_ultima, p_fecha),
+        f.ventana_fechas,
+        CASE WHEN f.es_ultima THEN f.revancha ELSE f.revancha_ultimo END,
+        LEAST(f.revancha_min_previo, f.revancha_min),
+        GREATEST(f.revancha_max_previo, f.revancha_max),
+        f.revancha_pendiente, f.ventana_revancha,
+        CASE WHEN f.es_ultima THEN f.ancho ELSE f.ancho_ultimo END,
+        LEAST(f.ancho_min_previo, f.ancho_min),
+        GREATEST(f.ancho_max_previo, f.ancho_max),
+        f.ancho_pendiente, f.ventana_ancho,
+        CASE WHEN f.es_ultima THEN f.dist_geo_lama ELSE f.dist_geo_lama_ultimo END,
+        LEAST(f.dist_geo_lama_min_previo, f.dist_geo_lama_min),
+        GREATEST(f.dist_geo_lama_max_previo, f.dist_geo_lama_max),
+        f.dist_geo_lama_pendiente, f.ventana_dist_geo_lama
+    FROM fusion f
+    ON CONFLICT (muro, sector, pk) DO UPDATE SET
+        total_mediciones = EXCLUDED.total_mediciones,
+        fecha_primera = EXCLUDED.fecha_primera,
+        fecha_ultima = EXCLUDED.fecha_ultima,
+        ventana_fechas = EXCLUDED.ventana_fechas,
+        revancha_ultimo = EXCLUDED.revancha_ultimo,
+        revancha_min = EXCLUDED.revancha_min,
+        revancha_max = EXCLUDED.revancha_max,
+        revancha_pendiente = EXCLUDED.revancha_pendiente,
+        ventana_revancha = EXCLUDED.ventana_revancha,
+        ancho_ultimo = EXCLUDED.ancho_ultimo,
+        ancho_min = EXCLUDED.ancho_min,
+        ancho_max = EXCLUDED.ancho_max,
+        ancho_pendiente = EXCLUDED.ancho_pendiente,
+        ventana_ancho = EXCLUDED.ventana_ancho,
+        dist_geo_lama_ultimo = EXCLUDED.dist_geo_lama_ultimo,
+        dist_geo_lama_min = EXCLUDED.dist_geo_lama_min,
+        dist_geo_lama_max = EXCLUDED.dist_geo_lama_max,
+        dist_geo_lama_pendiente = EXCLUDED.dist_geo_lama_pendiente,
+        ventana_dist_geo_lama = EXCLUDED.ventana_dist_geo_lama;
+    
+    GET DIAGNOSTICS total = ROW_COUNT;
+    RETURN total;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION fusionar_agregados_pks IS
+'Suma a revanchas_agregados_pk las filas de un archivo nuevo (p_filas = [{sector, pk, n, <métrica>, <métrica>_min, <métrica>_max}]); una recarga de fecha recalcula el muro.';
+
+
+-- PASO 5: Reconstrucción completa
+-- =====================================================
+-- Útil la primera vez (historia ya cargada) o si se borraron archivos.
+
+CREATE OR REPLACE FUNCTION recalcular_agregados_pk(p_ventana INTEGER DEFAULT 10)
+RETURNS INTEGER AS $$
+DECLARE
+    v_muro TEXT;
+    total INTEGER := 0;
+BEGIN
+    DELETE FROM revanchas_agregados_pk;
+    DELETE FROM revanchas_agregados_fechas;
+    
+    FOR v_muro IN SELECT DISTINCT muro FROM revanchas_archivos LOOP
+        total := total + recalcular_agregados_pks(v_muro, NULL, p_ventana);
+    END LOOP;
+    
+    RETURN total;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION recalcular_agregados_pk IS
+'Reconstruye revanchas_agregados_pk desde revanchas_mediciones (p_ventana = mediciones para la pendiente).';
+
+-- Ejecutar una vez tras crear la tabla:
+SELECT recalcular_agregados_pk();
+
+
+-- PASO 6: Consultas de ejemplo
+-- =====================================================
+
+-- PKs que más revancha pierden por año
+SELECT muro, sector, pk, revancha_ultimo, revancha_pendiente, fecha_ultima
+FROM revanchas_agregados_pk
+WHERE revancha_pendiente IS NOT NULL
+ORDER BY revancha_pendiente ASC
+LIMIT 20;
+
+-- Ancho mínimo histórico por muro
+SELECT muro, MIN(ancho_min) AS ancho_minimo, COUNT(*) AS pks
+FROM revanchas_agregados_pk
+GROUP BY muro
+ORDER BY muro;
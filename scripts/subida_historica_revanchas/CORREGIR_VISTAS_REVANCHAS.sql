@@ -5,23 +5,48 @@
 -- Objetivo: Recrear vistas para que funcione la visualización en mapa
 -- =====================================================
 
--- PASO 1: Eliminar PKs con formato incorrecto
+-- PASO 1: PK emparejado por el loader (ya no se eliminan PKs)
 -- =====================================================
--- Estos PKs no pueden hacer match con pks_maestro
--- Ejemplos: "736.45", "0.05999999999994543", "2.75"
+-- PKs como "736.45", "0.05999999999994543" o "2.75" no hacen match exacto
+-- con pks_maestro. Antes se borraban; ahora carga_masiva.py asigna a cada
+-- fila el PK del maestro más cercano por cadenamiento (emparejar_pks.py) y
+-- guarda la distancia. Las filas cargadas antes de este cambio se
+-- completan volviendo a cargar sus archivos.
+--
+-- Las vistas dependen de la columna pk: se eliminan antes de ampliarla.
 
-DELETE FROM revanchas_mediciones
-WHERE pk !~ '^\d+\+\d+';
+DROP VIEW IF EXISTS vista_ultimas_revanchas_geo CASCADE;
+DROP VIEW IF EXISTS vista_revanchas_georreferenciadas CASCADE;
+
+-- El loader ya no trunca los PKs a 20 caracteres: pk y pk_maestro son TEXT
+-- (igual que revanchas_agregados_pk.pk). Si falla con "cannot alter type of
+-- a column used by a view", eliminar también las vistas antiguas de
+-- migracion_revanchas_COMPLETA_FINAL.sql y recrearlas después.
+ALTER TABLE revanchas_mediciones ALTER COLUMN pk TYPE TEXT;
+
+ALTER TABLE revanchas_mediciones
+    ADD COLUMN IF NOT EXISTS pk_maestro TEXT,
+    ADD COLUMN IF NOT EXISTS distancia_pk DECIMAL(8, 3);
+
+-- Instalaciones que ya crearon pk_maestro como VARCHAR(20)
+ALTER TABLE revanchas_mediciones ALTER COLUMN pk_maestro TYPE TEXT;
 
--- Verificar cuántos se eliminaron
--- SELECT COUNT(*) FROM revanchas_mediciones WHERE pk !~ '^\d+\+\d+';
+COMMENT ON COLUMN revanchas_mediciones.pk_maestro IS
+'PK de pks_maestro más cercano por cadenamiento (asignado por el loader; NULL si ninguno dentro de la tolerancia)';
+COMMENT ON COLUMN revanchas_mediciones.distancia_pk IS
+'Distancia en metros entre el PK de la planilla y pk_maestro';
+
+-- PKs fuera del formato estándar, y cuántos tienen PK del maestro
+-- SELECT pk_maestro IS NOT NULL AS emparejado, COUNT(*)
+-- FROM revanchas_mediciones WHERE pk !~ '^\d+\+\d+' GROUP BY 1;
 
 
 -- PASO 2: Recrear vista_revanchas_georreferenciadas
 -- =====================================================
--- Esta vista une mediciones con coordenadas de pks_maestro
-
-DROP VIEW IF EXISTS vista_revanchas_georreferenciadas CASCADE;
+-- Esta vista une mediciones con coordenadas de pks_maestro: por el PK
+-- emparejado si existe; si no, por el PK de la planilla (solo formato km+m).
+-- Ambos lados pasan por normalizar_pk(): pks_maestro.pk no siempre está
+-- guardado normalizado ("0+550.800" y "0+551" son el mismo punto).
 
 CREATE OR REPLACE VIEW vista_revanchas_georreferenciadas AS
 SELECT 
@@ -30,6 +55,8 @@ SELECT
     ra.muro as archivo_muro,
     rm.sector,
     rm.pk,
+    pk.pk as pk_maestro,
+    rm.distancia_pk,
     ra.fecha_medicion,
     
     -- Mediciones
@@ -85,7 +112,10 @@ FROM revanchas_mediciones rm
 INNER JOIN revanchas_archivos ra ON rm.archivo_id = ra.id
 LEFT JOIN pks_maestro pk ON 
     pk.muro = ra.muro 
-    AND normalizar_pk(pk.pk) = normalizar_pk(rm.pk)
+    AND normalizar_pk(pk.pk) = normalizar_pk(COALESCE(
+        rm.pk_maestro,
+        CASE WHEN rm.pk ~ '^\d+\+\d+' THEN rm.pk END
+    ))
     AND pk.activo = true;
 
 COMMENT ON VIEW vista_revanchas_georreferenciadas IS 
@@ -94,20 +124,19 @@ COMMENT ON VIEW vista_revanchas_georreferenciadas IS
 
 -- PASO 3: Recrear vista_ultimas_revanchas_geo
 -- =====================================================
--- Solo las mediciones más recientes de cada PK por muro
-
-DROP VIEW IF EXISTS vista_ultimas_revanchas_geo CASCADE;
+-- Solo las mediciones más recientes de cada PK por muro. Se agrupa por el
+-- PK del maestro: "0+060" y "0.0599..." son el mismo punto del mapa
 
 CREATE OR REPLACE VIEW vista_ultimas_revanchas_geo AS
 WITH ultimas_mediciones AS (
     SELECT 
         archivo_muro,
         sector,
-        pk,
+        pk_maestro,
         MAX(fecha_medicion) as fecha_ultima
     FROM vista_revanchas_georreferenciadas
     WHERE tiene_coordenadas = TRUE
-    GROUP BY archivo_muro, sector, pk
+    GROUP BY archivo_muro, sector, pk_maestro
 )
 SELECT 
     vrg.*
@@ -115,7 +144,7 @@ FROM vista_revanchas_georreferenciadas vrg
 INNER JOIN ultimas_mediciones um ON (
     vrg.archivo_muro = um.archivo_muro
     AND vrg.sector = um.sector 
-    AND vrg.pk = um.pk 
+    AND vrg.pk_maestro = um.pk_maestro 
     AND vrg.fecha_medicion = um.fecha_ultima
 )
 WHERE vrg.tiene_coordenadas = TRUE
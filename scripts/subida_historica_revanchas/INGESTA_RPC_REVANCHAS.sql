@@ -0,0 +1,143 @@
+-- =====================================================
+-- INGESTA RPC: Un archivo de revanchas en una sola llamada
+-- =====================================================
+-- Fecha: 2026-01-05
+-- Objetivo: Reemplazar las 4 llamadas HTTP por archivo de carga_masiva.py
+-- (buscar duplicado, eliminarlo, insertar archivo, insertar mediciones)
+-- por una sola llamada RPC que hace todo en una transacción.
+--
+-- Si algo falla, no queda un archivo sin mediciones ni se pierde el
+-- archivo anterior: la transacción completa se revierte.
+--
+-- Uso desde PostgREST / supabase-py:
+--   POST /rest/v1/rpc/ingestar_revancha
+--   {"p_archivo": {...}, "p_mediciones": [{...}, ...]}
+--
+-- ORDEN: ejecutar DESPUÉS de CORREGIR_VISTAS_REVANCHAS.sql. Las funciones
+-- insertan pk_maestro y distancia_pk, columnas que crea ese script; el
+-- bloque de abajo detiene este script si todavía no existen (PL/pgSQL no
+-- revisa las columnas al crear la función, fallaría recién en cada carga).
+-- =====================================================
+
+
+-- PASO 0: Verificar dependencias
+-- =====================================================
+
+DO $$
+BEGIN
+    IF (SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'revanchas_mediciones'
+          AND column_name IN ('pk_maestro', 'distancia_pk')) < 2 THEN
+        RAISE EXCEPTION 'Faltan revanchas_mediciones.pk_maestro/distancia_pk: ejecutar primero CORREGIR_VISTAS_REVANCHAS.sql';
+    END IF;
+END $$;
+
+
+-- PASO 1: Ingesta de un archivo
+-- =====================================================
+-- p_archivo:    {muro, fecha_medicion, archivo_nombre, archivo_tipo,
+--                total_registros, sectores_incluidos, usuario_id}
+-- p_mediciones: [{sector, pk, pk_maestro, distancia_pk, coronamiento,
+--                 revancha, lama, ancho, geomembrana, dist_geo_lama,
+--                 dist_geo_coronamiento}, ...]
+--               pk_maestro/distancia_pk son opcionales (emparejar_pks.py) y
+--               requieren las columnas de CORREGIR_VISTAS_REVANCHAS.sql
+-- Retorna:      {"id": <nuevo archivo_id>, "reemplazado_id": <id anterior o null>}
+
+CREATE OR REPLACE FUNCTION ingestar_revancha(p_archivo JSONB, p_mediciones JSONB)
+RETURNS JSONB AS $$
+DECLARE
+    v_muro TEXT := p_archivo->>'muro';
+    v_fecha DATE := (p_archivo->>'fecha_medicion')::DATE;
+    v_reemplazado INTEGER;
+    v_id INTEGER;
+BEGIN
+    -- Dos cargas del mismo muro y fecha no se pisan a mitad de camino
+    PERFORM pg_advisory_xact_lock(hashtext(v_muro || '|' || v_fecha::TEXT));
+
+    -- Reemplazar archivo existente (CASCADE elimina sus mediciones)
+    DELETE FROM revanchas_archivos
+    WHERE muro = v_muro AND fecha_medicion = v_fecha
+    RETURNING id INTO v_reemplazado;
+
+    INSERT INTO revanchas_archivos (
+        muro, fecha_medicion, archivo_nombre, archivo_tipo,
+        total_registros, sectores_incluidos, usuario_id
+    )
+    VALUES (
+        v_muro,
+        v_fecha,
+        p_archivo->>'archivo_nombre',
+        p_archivo->>'archivo_tipo',
+        (p_archivo->>'total_registros')::INTEGER,
+        ARRAY(SELECT jsonb_array_elements_text(COALESCE(p_archivo->'sectores_incluidos', '[]'::JSONB))),
+        (p_archivo->>'usuario_id')::INTEGER
+    )
+    RETURNING id INTO v_id;
+
+    -- pk y pk_maestro son TEXT: los PKs irregulares entran completos
+    INSERT INTO revanchas_mediciones (
+        archivo_id, sector, pk, pk_maestro, distancia_pk, coronamiento,
+        revancha, lama, ancho, geomembrana, dist_geo_lama, dist_geo_coronamiento
+    )
+    SELECT
+        v_id, m.sector, m.pk, m.pk_maestro, m.distancia_pk, m.coronamiento,
+        m.revancha, m.lama, m.ancho, m.geomembrana, m.dist_geo_lama,
+        m.dist_geo_coronamiento
+    FROM jsonb_to_recordset(p_mediciones) AS m(
+        sector TEXT,
+        pk TEXT,
+        pk_maestro TEXT,
+        distancia_pk DECIMAL(8, 3),
+        coronamiento DECIMAL(10, 3),
+        revancha DECIMAL(10, 3),
+        lama DECIMAL(10, 3),
+        ancho DECIMAL(10, 3),
+        geomembrana DECIMAL(10, 3),
+        dist_geo_lama DECIMAL(10, 3),
+        dist_geo_coronamiento DECIMAL(10, 3)
+    );
+
+    RETURN jsonb_build_object('id', v_id, 'reemplazado_id', v_reemplazado);
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION ingestar_revancha(JSONB, JSONB) IS
+'Reemplaza (muro, fecha_medicion) e inserta archivo + mediciones en una transacción. Retorna {id, reemplazado_id}.';
+
+
+-- PASO 2: Ingesta de varios archivos en una llamada
+-- =====================================================
+-- p_archivos: [{"archivo": {...}, "mediciones": [...]}, ...]
+-- Retorna:    [{"id": ..., "reemplazado_id": ...}, ...] en el mismo orden
+-- Todo o nada: si un archivo falla, no se guarda ninguno del lote.
+
+CREATE OR REPLACE FUNCTION ingestar_revanchas_lote(p_archivos JSONB)
+RETURNS JSONB AS $$
+DECLARE
+    v_item JSONB;
+    v_resultados JSONB := '[]'::JSONB;
+BEGIN
+    FOR v_item IN
+        SELECT e.valor FROM jsonb_array_elements(p_archivos) WITH ORDINALITY AS e(valor, n)
+        ORDER BY e.n
+    LOOP
+        v_resultados := v_resultados || jsonb_build_array(
+            ingestar_revancha(v_item->'archivo', v_item->'mediciones')
+        );
+    END LOOP;
+
+    RETURN v_resultados;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION ingestar_revanchas_lote(JSONB) IS
+'Aplica ingestar_revancha() a cada archivo del lote en una sola transacción.';
+
+
+-- PASO 3: Verificación
+-- =====================================================
+
+SELECT proname, pg_get_function_arguments(oid) AS argumentos
+FROM pg_proc
+WHERE proname IN ('ingestar_revancha', 'ingestar_revanchas_lote');
@@ -0,0 +1,100 @@
+"""
+Agregados por PK de la Historia de Revanchas
+============================================
+
+Mantiene la tabla `revanchas_agregados_pk` (una fila por muro/sector/pk)
+actualizada en cada carga, para que los dashboards lean un resumen por PK
+en vez de recorrer toda la historia de `vista_revanchas_georreferenciadas`.
+
+Por cada métrica (revancha, ancho, dist_geo_lama) guarda: último valor,
+mínimo, máximo y la pendiente (m/año) de las últimas 10 mediciones.
+
+Tras subir un archivo se reduce el lote en NumPy a una fila por PK
+(cantidad, último valor, mínimo y máximo del archivo) y se llama a
+fusionar_agregados_pks(), que suma esas filas al resumen guardado sin
+releer la historia: cargar N archivos cuesta O(N), no O(N²). Si la fecha
+ya estaba aplicada con otro archivo (recarga), la BD recalcula el muro
+desde revanchas_mediciones, porque un mínimo o máximo viejo no se puede
+restar.
+
+Los PKs se agrupan por el PK del maestro (pk_maestro) si el lote pasó por
+emparejar_pks.py, así las escrituras irregulares del mismo punto no
+fragmentan su historia.
+
+Crear la tabla y las funciones con AGREGADOS_PK_REVANCHAS.sql antes de usarlo.
+"""
+
+from typing import Dict, List
+
+import numpy as np
+
+from cliente_postgrest import ClientePostgrest
+from lote_mediciones import LoteMediciones
+
+TABLA_AGREGADOS = 'revanchas_agregados_pk'
+
+FUNCION_FUSIONAR = 'fusionar_agregados_pks'
+
+METRICAS = ('revancha', 'ancho', 'dist_geo_lama')
+
+
+def _valor(numero: float):
+    return None if numero != numero else float(numero)
+
+
+def filas_archivo(mediciones) -> List[Dict]:
+    """
+    Reduce un archivo a una fila por (sector, pk del maestro), en el formato
+    de p_filas: cantidad de filas (n) y, por métrica, el valor de la última
+    fila del PK y el mínimo/máximo del archivo (None si no hay dato).
+    """
+    if not isinstance(mediciones, LoteMediciones):
+        mediciones = LoteMediciones.desde_filas(mediciones)
+    if not len(mediciones):
+        return []
+
+    # Código por clave en orden de aparición; orden estable = filas del
+    # archivo dentro de cada grupo, así la última del grupo es la última fila
+    codigos_clave: Dict = {}
+    codigos = np.fromiter(
+        (codigos_clave.setdefault(clave, len(codigos_clave))
+         for clave in zip(mediciones.sector, mediciones.pks_efectivos())),
+        dtype=np.int64, count=len(mediciones))
+    orden = np.argsort(codigos, kind='stable')
+    inicios = np.flatnonzero(np.r_[True, np.diff(codigos[orden]) != 0])
+    finales = np.r_[inicios[1:], len(orden)] - 1
+    conteos = finales - inicios + 1
+
+    resumen = {}
+    for metrica in METRICAS:
+        valores = mediciones.columna(metrica)[orden]
+        resumen[metrica] = valores[finales]
+        # fmin/fmax ignoran NaN mientras el grupo tenga algún dato
+        resumen[f'{metrica}_min'] = np.fmin.reduceat(valores, inicios)
+        resumen[f'{metrica}_max'] = np.fmax.reduceat(valores, inicios)
+
+    filas = []
+    for i, (sector, pk) in enumerate(codigos_clave):
+        fila = {'sector': sector, 'pk': pk, 'n': int(conteos[i])}
+        for nombre, valores in resumen.items():
+            fila[nombre] = _valor(valores[i])
+        filas.append(fila)
+    return filas
+
+
+class AgregadosPK:
+    """Suma en la BD los PKs de cada archivo subido a sus agregados."""
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+
+    def actualizar(self, muro: str, datos: Dict) -> int:
+        """Aplica las mediciones de un archivo ya subido. Retorna los PKs actualizados."""
+        filas = filas_archivo(datos['mediciones'])
+        if not filas:
+            return 0
+
+        argumentos = {'p_muro': muro, 'p_fecha': str(datos['fecha']), 'p_filas': filas}
+        if isinstance(self.conexion, ClientePostgrest):
+            return self.conexion.rpc(FUNCION_FUSIONAR, argumentos)
+        return self.conexion.rpc(FUNCION_FUSIONAR, argumentos).execute().data
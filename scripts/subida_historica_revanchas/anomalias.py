@@ -0,0 +1,298 @@
+"""
+Detección de Anomalías al Cargar Revanchas
+==========================================
+
+Antes de subir un archivo se compara cada PK (muro, sector, pk) contra su
+medición anterior a la fecha del archivo (en una carga histórica los
+archivos no llegan en orden). La historia se mantiene en memoria: se
+siembra una sola vez por muro desde el espejo local, la BD
+(revanchas_agregados_pk) o, sin conexión, los snapshots GeoJSON locales,
+y se actualiza con cada archivo subido. No hay consultas por fila: la
+medición anterior se busca por PK con bisect y las comparaciones son
+vectoriales.
+
+Reglas:
+    - Salto: |valor nuevo - último valor| mayor a SALTOS_MAXIMOS (ej: una
+      revancha que baja 2 m de una medición a la siguiente).
+    - Cruce de bandas: cambiar de banda en la vista SQL (revancha 3.5/3.0,
+      ancho 18/15, ver umbrales.py). La severidad es la distancia: cruzar
+      un umbral (verde-amarillo, amarillo-rojo) pesa PESOS_CRUCE[1], pasar
+      directo de verde a rojo (o al revés) pesa PESOS_CRUCE[2].
+    - Columnas cruzadas: lama por sobre el coronamiento, revancha mayor que
+      el ancho, o revancha nueva más parecida al ancho anterior que a la
+      revancha anterior.
+
+Un archivo es sospechoso si alguna heurística de columnas cruzadas se
+cumple o si el puntaje de sus PKs con historia (1 por salto, el peso del
+cruce de bandas más grave si no) llega a FRACCION_SOSPECHOSA del total.
+Los sospechosos quedan en cuarentena en la cola de fallidos
+(_fallidos/cuarentena/) en vez de subirse.
+
+Los PKs se identifican por el PK del maestro (pk_maestro) cuando el lote
+pasó por emparejar_pks.py, igual que revanchas_agregados_pk: "0+060" y
+"0.0599..." comparten historia.
+"""
+
+import json
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from cliente_postgrest import ClientePostgrest
+from lote_mediciones import LoteMediciones
+from umbrales import UMBRALES
+
+METRICAS = ('revancha', 'ancho', 'dist_geo_lama')
+
+# Cambio máximo esperable entre dos mediciones consecutivas (m)
+SALTOS_MAXIMOS = {
+    'revancha': 1.5,
+    'ancho': 5.0,
+    'dist_geo_lama': 1.5,
+}
+
+# Métricas con bandas de color en la vista SQL
+METRICAS_BANDAS = ('revancha', 'ancho')
+
+# Puntaje de un PK según cuántas bandas cruza: un umbral es habitual en un
+# PK que está cerca de él, verde <-> rojo de una medición a otra no
+PESOS_CRUCE = {1: 0.5, 2: 1.0}
+
+# Puntaje (fracción de PKs con historia) que marca el archivo
+FRACCION_SOSPECHOSA = 0.2
+
+# Mínimo de filas para aplicar las heurísticas de columnas cruzadas
+MIN_FILAS_HEURISTICAS = 5
+
+
+def _dia(fecha: str) -> int:
+    return int(np.datetime64(fecha, 'D').astype(np.int64))
+
+
+def bandas(metrica: str, valores: np.ndarray) -> np.ndarray:
+    """Banda de cada valor: 0 verde, 1 amarillo, 2 rojo, -1 sin dato."""
+    verde, amarillo = UMBRALES[metrica]
+    banda = np.where(valores >= verde, 0, np.where(valores >= amarillo, 1, 2))
+    return np.where(np.isnan(valores), -1, banda)
+
+
+def _mediana(valores: np.ndarray) -> float:
+    valores = valores[~np.isnan(valores)]
+    return float(np.median(valores)) if len(valores) >= MIN_FILAS_HEURISTICAS else np.nan
+
+
+class EstadoMuro:
+    """Mediciones conocidas de cada PK de un muro, ordenadas por fecha."""
+
+    __slots__ = ('dias', 'valores')
+
+    def __init__(self):
+        self.dias: Dict[Tuple[str, str], List[int]] = {}
+        self.valores: Dict[Tuple[str, str], List[Tuple[float, ...]]] = {}
+
+    def agregar(self, claves: List[Tuple[str, str]], dias: np.ndarray,
+                valores: Dict[str, np.ndarray]) -> None:
+        """Agrega mediciones (una por fila); la misma fecha de un PK se reemplaza."""
+        dias = np.broadcast_to(np.asarray(dias, dtype=np.int64), (len(claves),))
+        matriz = np.column_stack([np.asarray(valores[m], dtype=np.float64) for m in METRICAS]) \
+            if len(claves) else np.empty((0, len(METRICAS)))
+        for clave, dia, fila in zip(claves, dias.tolist(), map(tuple, matriz.tolist())):
+            dias_pk = self.dias.setdefault(clave, [])
+            valores_pk = self.valores.setdefault(clave, [])
+            j = bisect_left(dias_pk, dia)
+            if j < len(dias_pk) and dias_pk[j] == dia:
+                valores_pk[j] = fila
+            else:
+                dias_pk.insert(j, dia)
+                valores_pk.insert(j, fila)
+
+    def anteriores(self, claves: List[Tuple[str, str]], dia: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Última medición de cada PK con fecha < dia (búsqueda binaria por PK).
+        Retorna (con_historia, {métrica: valores}) alineados con `claves`.
+        """
+        con_historia = np.zeros(len(claves), dtype=bool)
+        previos = np.full((len(claves), len(METRICAS)), np.nan)
+        for i, clave in enumerate(claves):
+            dias_pk = self.dias.get(clave)
+            j = bisect_left(dias_pk, dia) - 1 if dias_pk else -1
+            if j >= 0:
+                con_historia[i] = True
+                previos[i] = self.valores[clave][j]
+        return con_historia, {m: previos[:, k] for k, m in enumerate(METRICAS)}
+
+
+class IndiceUltimoEstado:
+    """
+    Índice en memoria de la historia por (muro, sector, pk). Cada archivo se
+    compara con la medición anterior a su fecha, no con la más reciente: en
+    una carga histórica un archivo de 2022 no se juzga contra uno de 2024.
+
+    La semilla (una vez por muro) sale del espejo local si existe (historia
+    completa), si no de revanchas_agregados_pk (últimas 10 mediciones por
+    PK) o, sin conexión, de los snapshots GeoJSON (solo la última). Un PK sin
+    medición conocida anterior a la fecha del archivo cuenta como sin historia.
+    """
+
+    def __init__(self, conexion=None, carpeta_snapshots=None, espejo=None):
+        self.conexion = conexion
+        self.carpeta_snapshots = Path(carpeta_snapshots) if carpeta_snapshots else None
+        self.espejo = espejo
+        self._por_muro: Dict[str, EstadoMuro] = {}
+
+    # ----------------------------------------
+    # Semilla (una vez por muro)
+    # ----------------------------------------
+
+    def _filas_espejo(self, muro: str) -> Iterator[Dict]:
+        for f in self.espejo.historia(muro):
+            yield {'sector': f['sector'], 'pk': f.get('pk_maestro') or f['pk'],
+                   'fecha': f['fecha_medicion'], **{m: f[m] for m in METRICAS}}
+
+    def _filas_bd(self, muro: str) -> List[Dict]:
+        # Los agregados ya se guardan por PK del maestro
+        columnas = 'sector,pk,ventana_fechas,' + ','.join(f'ventana_{m}' for m in METRICAS)
+        if isinstance(self.conexion, ClientePostgrest):
+            filas = self.conexion.seleccionar('revanchas_agregados_pk', columnas, muro=muro)
+        else:
+            filas = self.conexion.table('revanchas_agregados_pk').select(columnas)\
+                .eq('muro', muro).execute().data
+        return [{'sector': f['sector'], 'pk': f['pk'], 'fecha': fecha,
+                 **{m: f[f'ventana_{m}'][j] for m in METRICAS}}
+                for f in filas for j, fecha in enumerate(f['ventana_fechas'])]
+
+    def _filas_snapshot(self, muro: str) -> List[Dict]:
+        ruta = self.carpeta_snapshots / f"{muro}.geojson" if self.carpeta_snapshots else None
+        if not ruta or not ruta.exists():
+            return []
+        coleccion = json.loads(ruta.read_text(encoding='utf-8'))
+        return [{'sector': p['sector'], 'pk': p.get('pk_maestro') or p['pk'],
+                 'fecha': p['fecha_medicion'], **{m: p.get(m) for m in METRICAS}}
+                for p in (f['properties'] for f in coleccion['features'])]
+
+    def _estado(self, muro: str) -> EstadoMuro:
+        if muro not in self._por_muro:
+            if self.espejo is not None:
+                filas = list(self._filas_espejo(muro))
+            elif self.conexion is not None:
+                try:
+                    filas = self._filas_bd(muro)
+                except Exception as e:
+                    # Tabla de agregados no creada: se usa el snapshot local
+                    print(f"⚠️  Sin agregados en la BD para {muro} ({e}), usando snapshot local")
+                    filas = self._filas_snapshot(muro)
+            else:
+                filas = self._filas_snapshot(muro)
+
+            estado = EstadoMuro()
+            if filas:
+                estado.agregar(
+                    [(f['sector'], f['pk']) for f in filas],
+                    np.array([_dia(f['fecha']) for f in filas], dtype=np.int64),
+                    {m: np.array([np.nan if f[m] is None else f[m] for f in filas], dtype=np.float64)
+                     for m in METRICAS},
+                )
+            self._por_muro[muro] = estado
+        return self._por_muro[muro]
+
+    # ----------------------------------------
+    # Revisión de un archivo
+    # ----------------------------------------
+
+    def revisar(self, muro: str, datos: Dict) -> Dict:
+        """
+        Compara un archivo parseado contra la medición anterior a su fecha de
+        cada PK. Retorna {'sospechoso': bool, 'motivos': [...],
+        'pks_con_historia': n, 'pks_anomalos': n, 'cruces_banda': {1: n, 2: n},
+        'ejemplos': [...]} (ejemplos de mayor a menor severidad).
+        """
+        lote: LoteMediciones = datos['mediciones']
+        estado = self._estado(muro)
+        motivos = columnas_cruzadas(lote)
+
+        claves = list(zip(lote.sector, lote.pks_efectivos()))
+        con_historia, anteriores = estado.anteriores(claves, _dia(datos['fecha']))
+        previos = {m: anteriores[m][con_historia] for m in METRICAS}
+
+        salto = np.zeros(int(con_historia.sum()), dtype=bool)
+        # Bandas cruzadas por PK (la métrica con el cruce más grande)
+        cruce = np.zeros(len(salto), dtype=np.int64)
+        for m in METRICAS:
+            nuevo = lote.columna(m)[con_historia]
+            previo = previos[m]
+            with np.errstate(invalid='ignore'):
+                salto |= np.abs(nuevo - previo) > SALTOS_MAXIMOS[m]
+            if m in METRICAS_BANDAS:
+                banda_nueva, banda_previa = bandas(m, nuevo), bandas(m, previo)
+                validas = (banda_nueva >= 0) & (banda_previa >= 0)
+                cruce = np.maximum(cruce, np.where(validas, np.abs(banda_nueva - banda_previa), 0))
+
+        pesos = np.array([0.0] + [PESOS_CRUCE[n] for n in sorted(PESOS_CRUCE)])
+        puntaje = np.where(salto, 1.0, pesos[cruce])
+        anomalo = puntaje > 0
+
+        # Revancha nueva pegada al ancho anterior: columnas corridas
+        if len(anomalo) >= MIN_FILAS_HEURISTICAS:
+            revancha = lote.columna('revancha')[con_historia]
+            contra_revancha = _mediana(np.abs(revancha - previos['revancha']))
+            contra_ancho = _mediana(np.abs(revancha - previos['ancho']))
+            if contra_ancho < contra_revancha:
+                motivos.append('revancha coincide con el ancho anterior')
+
+        total = len(anomalo)
+        anomalos = int(anomalo.sum())
+        cruces = {n: int((cruce == n).sum()) for n in PESOS_CRUCE}
+        if total and puntaje.sum() / total >= FRACCION_SOSPECHOSA:
+            motivos.append(f'{anomalos}/{total} PKs con saltos o cruces de banda '
+                           f'({int(salto.sum())} saltos, {cruces[1]} cruces de 1 banda, '
+                           f'{cruces[2]} de 2)')
+
+        # Los más graves primero (orden estable: a igual puntaje, orden del archivo)
+        graves = np.argsort(-puntaje, kind='stable')[:int(min(anomalos, 5))]
+        ejemplos = [' '.join(claves[i]) for i in np.flatnonzero(con_historia)[graves]]
+        return {
+            'sospechoso': bool(motivos),
+            'motivos': motivos,
+            'pks_con_historia': total,
+            'pks_anomalos': anomalos,
+            'cruces_banda': cruces,
+            'ejemplos': ejemplos,
+        }
+
+    def aceptar(self, muro: str, datos: Dict) -> None:
+        """Incorpora al índice un archivo ya subido (o válido, en dry-run)."""
+        lote: LoteMediciones = datos['mediciones']
+        if not len(lote):
+            return
+        self._estado(muro).agregar(
+            list(zip(lote.sector, lote.pks_efectivos())),
+            _dia(datos['fecha']),
+            {m: lote.columna(m) for m in METRICAS},
+        )
+
+
+def columnas_cruzadas(lote: LoteMediciones) -> List[str]:
+    """Heurísticas dentro del mismo archivo (no necesitan historia)."""
+    motivos = []
+    if len(lote) < MIN_FILAS_HEURISTICAS:
+        return motivos
+
+    # La revancha es coronamiento - lama: la lama no puede quedar arriba
+    if _mediana(lote.columna('coronamiento') - lote.columna('lama')) < 0:
+        motivos.append('lama sobre el coronamiento (columnas lama/coronamiento cruzadas)')
+
+    # La revancha son metros, el ancho son decenas de metros
+    if _mediana(lote.columna('revancha')) > _mediana(lote.columna('ancho')):
+        motivos.append('revancha mayor que el ancho (columnas cruzadas)')
+
+    return motivos
+
+
+def describir(revision: Dict) -> str:
+    """Texto corto para consola y log de eventos."""
+    detalle = '; '.join(revision['motivos'])
+    if revision['ejemplos']:
+        detalle += f" (ej: {', '.join(revision['ejemplos'])})"
+    return f"Anomalías: {detalle}"
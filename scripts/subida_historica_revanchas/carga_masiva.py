@@ -15,6 +15,7 @@ Estructura esperada:
 
 Uso:
     python carga_masiva.py
+    python revanchas.py load [--dry-run]   (CLI unificado)
 
 Autor: Sistema de Gestión de Canchas
 Fecha: 2025-12-22
@@ -22,49 +23,118 @@ Fecha: 2025-12-22
 
 import os
 import sys
+import json
 from pathlib import Path
 from datetime import datetime
-import json
 import re
+from bisect import bisect_right
 from typing import Dict, List, Tuple, Optional
 import time
 
-# Librerías externas
+from registro_eventos import RegistroEventos, ARCHIVO_EVENTOS, archivo_eventos_trabajador
+from cola_fallidos import guardar_fallido
+from cliente_postgrest import ClientePostgrest
+from snapshots_geojson import generar_snapshots, CARPETA_SNAPSHOTS
+from geopackage_revanchas import actualizar_geopackage, ARCHIVO_GEOPACKAGE
+from catalogo import listar_archivos, procesar_cacheado, en_cache
+from prefetch import Prefetch
+from espejo_local import ARCHIVO_ESPEJO, EspejoLocal
+from lote_mediciones import LoteMediciones
+
+# Librerías pesadas (openpyxl, supabase, numpy) se importan solo en las
+# funciones que las usan: validar o hacer dry-run no necesita supabase.
 try:
-    import openpyxl
-    from supabase import create_client, Client
     from dotenv import load_dotenv
-except ImportError as e:
-    print(f"❌ Error: Falta instalar dependencias.")
-    print(f"   Ejecuta: pip install -r requirements.txt")
-    sys.exit(1)
+    # Cargar variables de entorno
+    load_dotenv()
+except ImportError:
+    pass
+
 
-# Cargar variables de entorno
-load_dotenv()
+def _env_bool(nombre: str, por_defecto: bool) -> bool:
+    valor = os.getenv(nombre)
+    if valor is None:
+        return por_defecto
+    return valor.strip().lower() in ('1', 'true', 'si', 'sí', 'yes')
 
 # ============================================
 # CONFIGURACIÓN
 # ============================================
 
+# Cada valor se puede sobreescribir con variables de entorno (REVANCHAS_*)
+# o con las opciones de revanchas.py
 CONFIG = {
     # Carpeta base donde están los archivos
-    'carpeta_base': r'E:\TITO\1 Astro\REVANCHAS HISTORICAS',
+    'carpeta_base': os.getenv('REVANCHAS_CARPETA_BASE', r'E:\TITO\1 Astro\REVANCHAS HISTORICAS'),
     
     # Muros a procesar (solo Oeste y Este por ahora)
-    'muros': ['Oeste', 'Este', 'Principal'],
+    'muros': os.getenv('REVANCHAS_MUROS', 'Oeste,Este,Principal').split(','),
     
     # Credenciales Supabase (desde .env)
     'supabase_url': os.getenv('PUBLIC_SUPABASE_URL'),
     'supabase_key': os.getenv('SUPABASE_SERVICE_KEY'),  # Service Role Key
     
     # Usuario que "sube" los archivos (Linkapsis)
-    'usuario_id': 3,
+    'usuario_id': int(os.getenv('REVANCHAS_USUARIO_ID', '3')),
+    
+    # Archivos por llamada RPC (solo con usar_rpc): 1 = de a un archivo.
+    # Un lote es todo o nada; si falla, sus archivos se reintentan uno a uno
+    'batch_size': int(os.getenv('REVANCHAS_BATCH_SIZE', '1')),
+    
+    # Modo dry-run (solo validar, no insertar; no se conecta a Supabase)
+    'dry_run': _env_bool('REVANCHAS_DRY_RUN', False),
+    
+    # Lectura anticipada: archivos que se leen en segundo plano mientras se
+    # procesa el actual (0 = sin prefetch) y memoria máxima para esos buffers
+    'prefetch_archivos': int(os.getenv('REVANCHAS_PREFETCH', '4')),
+    'prefetch_max_mb': int(os.getenv('REVANCHAS_PREFETCH_MAX_MB', '256')),
+    
+    # Carpeta donde se guardan los datos de subidas fallidas (dead-letter)
+    'carpeta_fallidos': '_fallidos',
+    
+    # Modo eficiente: sesión HTTP/2 keep-alive y respuestas mínimas (pensado
+    # para los enlaces lentos de faena)
+    'upload_eficiente': _env_bool('REVANCHAS_UPLOAD_EFICIENTE', True),
+    
+    # Comprimir con gzip los cuerpos desde este tamaño (None = nunca). PostgREST
+    # no acepta cuerpos gzip: activar solo si hay un gateway que los descomprime
+    'gzip_desde_bytes': int(os.getenv('REVANCHAS_GZIP_DESDE_BYTES', '0')) or None,
     
-    # Batch size: 1 = procesar de a 1 archivo (más lento pero más seguro)
-    'batch_size': 1,
+    # Subir cada archivo con una sola llamada a ingestar_revancha() (reemplazo
+    # e inserción en una transacción, ver INGESTA_RPC_REVANCHAS.sql). Si la
+    # función no existe en la BD se vuelve solo a las llamadas separadas.
+    'usar_rpc': _env_bool('REVANCHAS_USAR_RPC', True),
     
-    # Modo dry-run (solo validar, no insertar)
-    'dry_run': False,
+    # Cola de trabajo compartida (`revanchas.py queue` / `work`): ruta del
+    # SQLite (por defecto en la carpeta base) y espera cuando todo está tomado
+    'cola_trabajo': os.getenv('REVANCHAS_COLA'),
+    'espera_cola_segundos': 10,
+    
+    # Asignar a cada fila el PK de pks_maestro más cercano por cadenamiento
+    # (columnas pk_maestro y distancia_pk, ver CORREGIR_VISTAS_REVANCHAS.sql)
+    'emparejar_pks': _env_bool('REVANCHAS_EMPAREJAR_PKS', True),
+    
+    # Mantener revanchas_agregados_pk (ver AGREGADOS_PK_REVANCHAS.sql)
+    'actualizar_agregados': _env_bool('REVANCHAS_ACTUALIZAR_AGREGADOS', True),
+    
+    # Snapshots GeoJSON estáticos para el mapa (se regeneran tras cada carga)
+    'generar_snapshots': _env_bool('REVANCHAS_GENERAR_SNAPSHOTS', True),
+    'carpeta_snapshots': os.getenv('REVANCHAS_CARPETA_SNAPSHOTS', str(CARPETA_SNAPSHOTS)),
+    
+    # GeoPackage offline con toda la historia georreferenciada (junto a
+    # mapbase.mbtiles), actualizado de forma incremental tras cada carga
+    'generar_geopackage': _env_bool('REVANCHAS_GENERAR_GEOPACKAGE', True),
+    'archivo_geopackage': ARCHIVO_GEOPACKAGE,
+    
+    # Revisar cada archivo contra el último estado de sus PKs antes de subirlo;
+    # los sospechosos quedan en _fallidos/cuarentena (ver anomalias.py)
+    'detectar_anomalias': _env_bool('REVANCHAS_DETECTAR_ANOMALIAS', True),
+    
+    # Espejo SQLite local (`revanchas.py sync`): se usa para revisar duplicados
+    # sin consultar Supabase. Con omitir_ya_cargados, un archivo que el espejo
+    # ya tiene (mismo muro, fecha, nombre y total de registros) no se vuelve a subir
+    'espejo_local': ARCHIVO_ESPEJO,
+    'omitir_ya_cargados': _env_bool('REVANCHAS_OMITIR_CARGADOS', False),
 }
 
 # Configuraciones por muro (igual que frontend)
@@ -148,12 +218,12 @@ CONFIGURACIONES_MURO = {
 # FUNCIONES AUXILIARES
 # ============================================
 
-def validar_configuracion():
+def validar_configuracion(requiere_supabase: bool = True):
     """Valida que la configuración esté completa."""
-    if not CONFIG['supabase_url']:
+    if requiere_supabase and not CONFIG['supabase_url']:
         print("❌ Error: Falta PUBLIC_SUPABASE_URL en .env")
         return False
-    if not CONFIG['supabase_key']:
+    if requiere_supabase and not CONFIG['supabase_key']:
         print("❌ Error: Falta SUPABASE_SERVICE_KEY en .env")
         return False
     if not os.path.exists(CONFIG['carpeta_base']):
@@ -291,12 +361,59 @@ def detectar_estructura_automatica(worksheet):
     return header_row, columns, data_start_row, data_end_row
 
 
+class IndiceIntervalos:
+    """
+    Intervalos de filas [inicio, fin] -> valor, ordenados por inicio.
+    La búsqueda es O(log n) con bisect en vez de recorrer todos los rangos.
+    """
+
+    def __init__(self, intervalos: List[Tuple[int, int, object]]):
+        intervalos = sorted(intervalos, key=lambda r: r[0])
+        self._inicios = [r[0] for r in intervalos]
+        self._fines = [r[1] for r in intervalos]
+        self._valores = [r[2] for r in intervalos]
+
+    def buscar(self, fila: int, por_defecto=None):
+        """Valor del intervalo que contiene la fila, o `por_defecto`."""
+        i = bisect_right(self._inicios, fila) - 1
+        if i >= 0 and fila <= self._fines[i]:
+            return self._valores[i]
+        return por_defecto
+
+
+def indice_celdas_combinadas(worksheet, columna: str) -> IndiceIntervalos:
+    """
+    Índice de los rangos combinados (merged cells) que cruzan una columna.
+    En las plantillas Principal 2023+ el sector es un rango vertical
+    combinado: solo la celda ancla tiene valor y las demás leen None.
+    Con este índice cualquier fila del rango resuelve al valor del ancla.
+    Se construye una vez por hoja.
+    """
+    col = 0
+    for letra in columna.upper():
+        col = col * 26 + (ord(letra) - ord('A') + 1)
+    
+    intervalos = [
+        (rango.min_row, rango.max_row, worksheet.cell(rango.min_row, rango.min_col).value)
+        for rango in worksheet.merged_cells.ranges
+        if rango.min_col <= col <= rango.max_col
+    ]
+    return IndiceIntervalos(intervalos)
+
+
+# Índice de sectores por configuración de muro (se construye una sola vez)
+_INDICES_SECTORES: Dict[str, IndiceIntervalos] = {}
+
+
 def obtener_sector_por_fila(fila: int, config: dict) -> Optional[str]:
     """Determina el sector según la fila."""
-    for sector_info in config['sectores']:
-        if sector_info['start_row'] <= fila <= sector_info['end_row']:
-            return str(sector_info['num'])
-    return None
+    indice = _INDICES_SECTORES.get(config['nombre'])
+    if indice is None:
+        indice = IndiceIntervalos([
+            (s['start_row'], s['end_row'], str(s['num'])) for s in config['sectores']
+        ])
+        _INDICES_SECTORES[config['nombre']] = indice
+    return indice.buscar(fila)
 
 
 def extraer_datos(worksheet, config: dict) -> List[Dict]:
@@ -341,8 +458,13 @@ def extraer_datos(worksheet, config: dict) -> List[Dict]:
     return mediciones
 
 
-def procesar_archivo(ruta: Path, muro: str) -> Optional[Dict]:
-    """Procesa un archivo Excel y extrae los datos usando detección automática."""
+def procesar_archivo(ruta, muro: str) -> Optional[Dict]:
+    """
+    Procesa un archivo Excel y extrae los datos usando detección automática.
+    `ruta` puede ser una ruta o un buffer en memoria (ej: planilla de un .zip).
+    """
+    import openpyxl
+    
     try:
         # Cargar workbook
         workbook = openpyxl.load_workbook(ruta, data_only=True)
@@ -356,62 +478,161 @@ def procesar_archivo(ruta: Path, muro: str) -> Optional[Dict]:
         if not fecha:
             raise ValueError("No se pudo extraer la fecha del archivo")
         
-        # Extraer mediciones usando las columnas detectadas
-        mediciones = []
+        # Sector: resolver celdas combinadas al valor de su ancla. Si la hoja
+        # usa la plantilla conocida del muro, los rangos fijos de sectores
+        # sirven de respaldo para filas sin valor.
+        sector_col = columns.get('sector', 'A')
+        sectores_combinados = indice_celdas_combinadas(worksheet, sector_col)
+        config_muro = CONFIGURACIONES_MURO.get(muro.lower())
+        if config_muro and config_muro['data_start_row'] != data_start_row:
+            config_muro = None
+        
+        # Columna de cada valor numérico (con las posiciones por defecto)
+        columnas_valores = {
+            nombre: columns.get(nombre, defecto) for nombre, defecto in (
+                ('coronamiento', 'C'), ('revancha', 'E'), ('lama', 'F'), ('ancho', 'H'),
+                ('geomembrana', 'J'), ('dist_geo_lama', 'K'), ('dist_geo_coronamiento', 'L'),
+            )
+        }
+        
+        # Extraer mediciones usando las columnas detectadas (lote por columnas)
+        mediciones = LoteMediciones()
         for fila in range(data_start_row, data_end_row + 1):
             # Leer valores de celdas usando columnas detectadas
             pk_value = worksheet[f"{columns['pk']}{fila}"].value
             if not pk_value:  # Si no hay PK, saltar fila
                 continue
             
-            # Convertir PK a string y limitar a 20 caracteres
+            # PK tal cual viene (sin truncar): formatos como "0.05999999999994543"
+            # se ubican después en pks_maestro (emparejar_pks.py)
             pk_str = str(pk_value).strip()
-            if len(pk_str) > 20:
-                pk_str = pk_str[:20]  # Truncar si es muy largo
             
-            medicion = {
-                'sector': str(worksheet[f"{columns.get('sector', 'A')}{fila}"].value or '').strip(),
-                'pk': pk_str,
-                'coronamiento': worksheet[f"{columns.get('coronamiento', 'C')}{fila}"].value,
-                'revancha': worksheet[f"{columns.get('revancha', 'E')}{fila}"].value,
-                'lama': worksheet[f"{columns.get('lama', 'F')}{fila}"].value,
-                'ancho': worksheet[f"{columns.get('ancho', 'H')}{fila}"].value,
-                'geomembrana': worksheet[f"{columns.get('geomembrana', 'J')}{fila}"].value,
-                'dist_geo_lama': worksheet[f"{columns.get('dist_geo_lama', 'K')}{fila}"].value,
-                'dist_geo_coronamiento': worksheet[f"{columns.get('dist_geo_coronamiento', 'L')}{fila}"].value,
-            }
+            sector = sectores_combinados.buscar(fila, worksheet[f"{sector_col}{fila}"].value)
+            if sector is None and config_muro:
+                sector = obtener_sector_por_fila(fila, config_muro)
             
-            # Convertir a float o None
-            for key in ['coronamiento', 'revancha', 'lama', 'ancho', 'geomembrana', 
-                        'dist_geo_lama', 'dist_geo_coronamiento']:
-                val = medicion[key]
-                if val is not None:
-                    try:
-                        medicion[key] = float(val)
-                    except (ValueError, TypeError):
-                        medicion[key] = None
-            
-            mediciones.append(medicion)
+            # Los valores se convierten a float (NaN si no es numérico) al agregar
+            mediciones.agregar(str(sector or '').strip(), pk_str, {
+                nombre: worksheet[f"{col}{fila}"].value for nombre, col in columnas_valores.items()
+            })
         
-        if not mediciones:
+        if not len(mediciones):
             raise ValueError("No se encontraron mediciones válidas")
         
-        # Obtener sectores únicos
-        sectores = sorted(list(set(m['sector'] for m in mediciones if m['sector'])))
-        
         return {
             'fecha': fecha,
             'mediciones': mediciones,
             'total_registros': len(mediciones),
-            'sectores': sectores
+            'sectores': mediciones.sectores()
         }
         
     except Exception as e:
         raise Exception(f"Error procesando archivo: {str(e)}")
 
 
-def subir_a_supabase(supabase: Client, datos: Dict, archivo: str, muro: str) -> Tuple[bool, str]:
+def crear_conexion():
+    """Crea la conexión según el modo de subida configurado."""
+    if CONFIG['upload_eficiente']:
+        return ClientePostgrest(CONFIG['supabase_url'], CONFIG['supabase_key'],
+                                gzip_desde_bytes=CONFIG['gzip_desde_bytes'])
+    
+    from supabase import create_client
+    return create_client(CONFIG['supabase_url'], CONFIG['supabase_key'])
+
+
+def datos_archivo(datos: Dict, archivo: str, muro: str) -> Dict:
+    """Fila de revanchas_archivos para un archivo parseado."""
+    return {
+        'muro': muro,
+        'fecha_medicion': datos['fecha'],
+        'archivo_nombre': archivo,
+        'archivo_tipo': 'XLSX' if archivo.endswith('.xlsx') else 'CSV',
+        'total_registros': datos['total_registros'],
+        'sectores_incluidos': datos['sectores'],
+        'usuario_id': CONFIG['usuario_id']
+    }
+
+
+# Función inexistente en la BD (PostgREST / Postgres)
+_CODIGOS_SIN_FUNCION = ('PGRST202', '42883')
+
+
+def _sin_funcion_rpc(mensaje: str) -> bool:
+    return any(codigo in mensaje for codigo in _CODIGOS_SIN_FUNCION)
+
+
+def _desactivar_rpc() -> None:
+    print("⚠️  ingestar_revancha() no existe (ejecutar INGESTA_RPC_REVANCHAS.sql), "
+          "usando llamadas separadas... ", end='', flush=True)
+    CONFIG['usar_rpc'] = False
+
+
+def _json_rpc(datos: Dict, archivo: str, muro: str, clave_archivo: str, clave_mediciones: str) -> bytes:
+    """Cuerpo {"<clave_archivo>": {...}, "<clave_mediciones>": [...]} sin pasar por dicts por fila."""
+    return b''.join([
+        b'{"', clave_archivo.encode(), b'":',
+        json.dumps(datos_archivo(datos, archivo, muro), ensure_ascii=False).encode('utf-8'),
+        b',"', clave_mediciones.encode(), b'":', datos['mediciones'].a_json(), b'}',
+    ])
+
+
+def subir_rpc(supabase, datos: Dict, archivo: str, muro: str) -> Tuple[bool, str]:
+    """Sube un archivo con una sola llamada a ingestar_revancha() (atómica)."""
+    try:
+        if isinstance(supabase, ClientePostgrest):
+            resultado = supabase.rpc('ingestar_revancha',
+                                     _json_rpc(datos, archivo, muro, 'p_archivo', 'p_mediciones'))
+        else:
+            resultado = supabase.rpc('ingestar_revancha', {
+                'p_archivo': datos_archivo(datos, archivo, muro),
+                'p_mediciones': list(datos['mediciones'].filas()),
+            }).execute().data
+        
+        if resultado.get('reemplazado_id'):
+            print(f"🔄 Reemplazado archivo existente (ID: {resultado['reemplazado_id']})... ", end='', flush=True)
+        return True, f"Archivo ID: {resultado['id']}"
+        
+    except Exception as e:
+        return False, f"Error: {str(e)}"
+
+
+def subir_lote(supabase, pendientes: List[Tuple[str, Dict]], muro: str) -> List[Tuple[bool, str]]:
+    """
+    Sube varios archivos del muro con una sola llamada a ingestar_revanchas_lote().
+    Si el lote falla (es todo o nada), se suben de a uno para aislar el archivo con error.
+    """
+    try:
+        if isinstance(supabase, ClientePostgrest):
+            cuerpo = b'{"p_archivos":[' + b','.join(
+                _json_rpc(datos, archivo, muro, 'archivo', 'mediciones') for archivo, datos in pendientes
+            ) + b']}'
+            resultados = supabase.rpc('ingestar_revanchas_lote', cuerpo)
+        else:
+            resultados = supabase.rpc('ingestar_revanchas_lote', {'p_archivos': [
+                {'archivo': datos_archivo(datos, archivo, muro),
+                 'mediciones': list(datos['mediciones'].filas())}
+                for archivo, datos in pendientes
+            ]}).execute().data
+        return [(True, f"Archivo ID: {r['id']}") for r in resultados]
+        
+    except Exception as e:
+        if _sin_funcion_rpc(str(e)):
+            _desactivar_rpc()
+        print(f"⚠️  Lote rechazado ({e}), subiendo de a uno...")
+        return [subir_a_supabase(supabase, datos, archivo, muro) for archivo, datos in pendientes]
+
+
+def subir_a_supabase(supabase, datos: Dict, archivo: str, muro: str) -> Tuple[bool, str]:
     """Sube los datos a Supabase. Si encuentra duplicado, lo reemplaza."""
+    if CONFIG['usar_rpc']:
+        exito, mensaje = subir_rpc(supabase, datos, archivo, muro)
+        if exito or not _sin_funcion_rpc(mensaje):
+            return exito, mensaje
+        _desactivar_rpc()
+    
+    if isinstance(supabase, ClientePostgrest):
+        return subir_eficiente(supabase, datos, archivo, muro)
+    
     try:
         # 1. Verificar si ya existe un archivo con este muro y fecha
         existing = supabase.table('revanchas_archivos')\
@@ -427,15 +648,7 @@ def subir_a_supabase(supabase: Client, datos: Dict, archivo: str, muro: str) ->
             print(f"🔄 Reemplazando archivo existente (ID: {old_id})... ", end='', flush=True)
         
         # 2. Insertar nuevo archivo en revanchas_archivos
-        archivo_data = {
-            'muro': muro,
-            'fecha_medicion': datos['fecha'],
-            'archivo_nombre': archivo,
-            'archivo_tipo': 'XLSX' if archivo.endswith('.xlsx') else 'CSV',
-            'total_registros': datos['total_registros'],
-            'sectores_incluidos': datos['sectores'],
-            'usuario_id': CONFIG['usuario_id']
-        }
+        archivo_data = datos_archivo(datos, archivo, muro)
         
         response = supabase.table('revanchas_archivos').insert(archivo_data).execute()
         
@@ -445,20 +658,7 @@ def subir_a_supabase(supabase: Client, datos: Dict, archivo: str, muro: str) ->
         archivo_id = response.data[0]['id']
         
         # 3. Insertar mediciones en batch
-        mediciones_para_insertar = []
-        for m in datos['mediciones']:
-            mediciones_para_insertar.append({
-                'archivo_id': archivo_id,
-                'sector': m['sector'],
-                'pk': m['pk'],
-                'coronamiento': m['coronamiento'],
-                'revancha': m['revancha'],
-                'lama': m['lama'],
-                'ancho': m['ancho'],
-                'geomembrana': m['geomembrana'],
-                'dist_geo_lama': m['dist_geo_lama'],
-                'dist_geo_coronamiento': m['dist_geo_coronamiento']
-            })
+        mediciones_para_insertar = list(datos['mediciones'].filas(archivo_id))
         
         supabase.table('revanchas_mediciones').insert(mediciones_para_insertar).execute()
         
@@ -469,125 +669,389 @@ def subir_a_supabase(supabase: Client, datos: Dict, archivo: str, muro: str) ->
         return False, f"Error: {error_msg}"
 
 
+def subir_eficiente(cliente: ClientePostgrest, datos: Dict, archivo: str, muro: str) -> Tuple[bool, str]:
+    """
+    Igual que subir_a_supabase() pero minimizando el tráfico: el select y el
+    delete del duplicado van en una sola llamada, y las inserciones solo
+    devuelven el `id` del archivo (las mediciones no devuelven nada).
+    """
+    try:
+        # 1. Eliminar archivo existente con este muro y fecha (CASCADE a mediciones)
+        eliminados = cliente.eliminar('revanchas_archivos', devolver='id',
+                                      muro=muro, fecha_medicion=datos['fecha'])
+        if eliminados:
+            print(f"🔄 Reemplazando archivo existente (ID: {eliminados[0]['id']})... ", end='', flush=True)
+        
+        # 2. Insertar nuevo archivo, pidiendo solo el id
+        archivo_data = datos_archivo(datos, archivo, muro)
+        
+        response = cliente.insertar('revanchas_archivos', archivo_data, devolver='id')
+        if not response:
+            return False, "Error insertando archivo"
+        
+        archivo_id = response[0]['id']
+        
+        # 3. Insertar mediciones sin representación de vuelta
+        cliente.insertar('revanchas_mediciones', datos['mediciones'].a_json(archivo_id))
+        
+        return True, f"Archivo ID: {archivo_id}"
+        
+    except Exception as e:
+        return False, f"Error: {str(e)}"
+
+
+def formatear_trafico(trafico: Dict[str, int]) -> str:
+    """Formatea el tráfico de un archivo (ej: '↑12.3 KB ↓0.8 KB')."""
+    return f"↑{trafico['bytes_enviados'] / 1024:.1f} KB ↓{trafico['bytes_recibidos'] / 1024:.1f} KB"
+
+
 # ============================================
 # FUNCIÓN PRINCIPAL
 # ============================================
 
-def main():
-    """Función principal del script."""
+def main(trabajador=None):
+    """
+    Función principal del script. Con `trabajador` (cola_trabajo.Trabajador)
+    los archivos se toman de la cola compartida en vez de recorrer las carpetas.
+    """
     print("=" * 70)
     print("📤 CARGA MASIVA DE REVANCHAS HISTÓRICAS")
     print("=" * 70)
     print()
+    archivo_eventos = archivo_eventos_trabajador(trabajador.nombre) if trabajador else ARCHIVO_EVENTOS
     
-    # Validar configuración
-    if not validar_configuracion():
+    # Validar configuración (el dry-run no necesita credenciales)
+    if not validar_configuracion(requiere_supabase=not CONFIG['dry_run']):
         sys.exit(1)
     
-    # Conectar a Supabase
-    print("🔌 Conectando a Supabase...")
-    supabase = create_client(CONFIG['supabase_url'], CONFIG['supabase_key'])
-    print("✅ Conectado\n")
-    
-    # Modo dry-run
+    # Modo dry-run: totalmente offline, sin conexión a Supabase
     if CONFIG['dry_run']:
         print("⚠️  MODO DRY-RUN: Solo validación, no se guardará nada\n")
+        supabase = None
+    else:
+        # Conectar a Supabase
+        print("🔌 Conectando a Supabase...")
+        supabase = crear_conexion()
+        print("✅ Conectado\n")
     
-    # Reporte
-    reporte = {
-        'exitosos': [],
-        'duplicados': [],
-        'errores': [],
-        'estadisticas': {'Principal': 0, 'Este': 0, 'Oeste': 0},
-        'inicio': datetime.now().isoformat(),
-    }
-    
-    # Procesar cada muro
-    for muro in CONFIG['muros']:
-        carpeta_muro = Path(CONFIG['carpeta_base']) / muro
-        
-        if not carpeta_muro.exists():
-            print(f"⚠️  Carpeta no encontrada: {carpeta_muro}")
-            continue
-        
-        # Obtener archivos
-        archivos = list(carpeta_muro.glob('*.xlsx')) + list(carpeta_muro.glob('*.csv'))
+    # Log de eventos (JSONL): cada resultado se escribe apenas ocurre
+    try:
+        with RegistroEventos(archivo_eventos, muros=CONFIG['muros']) as registro:
+            if trabajador:
+                procesar_cola(supabase, registro, trabajador)
+            else:
+                procesar_muros(supabase, registro)
         
-        print(f"\n{'=' * 70}")
-        print(f"📁 {muro.upper()}: {len(archivos)} archivos")
-        print(f"{'=' * 70}\n")
+        # Snapshots del mapa: solo si algo cambió en la BD
+        if CONFIG['generar_snapshots'] and not CONFIG['dry_run'] and registro.resumen['exitosos']:
+            print("\n🗺️  Generando snapshots GeoJSON del mapa...")
+            try:
+                manifest = generar_snapshots(supabase, CONFIG['muros'], CONFIG['carpeta_snapshots'])
+                for nombre, entrada in manifest.items():
+                    print(f"   {nombre}: {entrada['total']} PKs (etag {entrada['etag']})")
+            except Exception as e:
+                print(f"⚠️  No se pudieron generar los snapshots: {e}")
         
-        # Procesar archivos
-        for i, ruta_archivo in enumerate(archivos, 1):
-            archivo = ruta_archivo.name
-            print(f"[{i}/{len(archivos)}] {archivo}... ", end='', flush=True)
-            
+        # GeoPackage offline: solo agrega los archivos nuevos. Con la cola lo
+        # actualiza una sola vez el trabajador que la deja vacía
+        if CONFIG['generar_geopackage'] and not CONFIG['dry_run'] and (
+                trabajador.reclamar_cierre() if trabajador else registro.resumen['exitosos']):
+            print("\n🧭 Actualizando GeoPackage offline...")
             try:
-                # Procesar archivo
-                datos = procesar_archivo(ruta_archivo, muro)
-                
-                if CONFIG['dry_run']:
-                    print(f"✅ Válido ({datos['total_registros']} registros, {datos['fecha']})")
-                    reporte['exitosos'].append({
-                        'archivo': archivo,
-                        'muro': muro,
-                        'fecha': datos['fecha'],
-                        'registros': datos['total_registros']
-                    })
-                else:
-                    # Subir a Supabase (reemplaza duplicados automáticamente)
-                    exito, mensaje = subir_a_supabase(supabase, datos, archivo, muro)
-                    
-                    if exito:
-                        print(f"✅ {datos['total_registros']} registros ({datos['fecha']})")
-                        reporte['exitosos'].append({
-                            'archivo': archivo,
-                            'muro': muro,
-                            'fecha': datos['fecha'],
-                            'registros': datos['total_registros']
-                        })
-                        reporte['estadisticas'][muro] += 1
-                    else:
-                        print(f"❌ {mensaje}")
-                        reporte['errores'].append({
-                            'archivo': archivo,
-                            'muro': muro,
-                            'error': mensaje
-                        })
-                
-                # Pequeña pausa para no sobrecargar
-                time.sleep(0.1)
-                
+                resultado = actualizar_geopackage(supabase, ruta=CONFIG['archivo_geopackage'])
+                print(f"   +{resultado['archivos_nuevos']} archivos ({resultado['filas_nuevas']} mediciones), "
+                      f"{resultado['filas_total']} en total: {CONFIG['archivo_geopackage']}")
             except Exception as e:
-                print(f"❌ {str(e)}")
-                reporte['errores'].append({
-                    'archivo': archivo,
-                    'muro': muro,
-                    'error': str(e)
-                })
-    
-    # Reporte final
-    reporte['fin'] = datetime.now().isoformat()
+                print(f"⚠️  No se pudo actualizar el GeoPackage: {e}")
+    finally:
+        if isinstance(supabase, ClientePostgrest):
+            supabase.cerrar()
+
+    resumen = registro.resumen
     
     print(f"\n{'=' * 70}")
     print("📊 REPORTE FINAL")
     print(f"{'=' * 70}\n")
-    print(f"✅ Exitosos:   {len(reporte['exitosos'])}")
-    print(f"⚠️  Duplicados: {len(reporte['duplicados'])}")
-    print(f"❌ Errores:    {len(reporte['errores'])}")
+    print(f"✅ Exitosos:   {resumen['exitosos']}")
+    print(f"⚠️  Duplicados: {resumen['duplicados']}")
+    print(f"❌ Errores:    {resumen['errores']}")
     
     print(f"\n📈 Por Muro:")
-    for muro, count in reporte['estadisticas'].items():
+    for muro, count in resumen['estadisticas'].items():
         print(f"   {muro}: {count} archivos")
     
-    # Guardar reporte
-    with open('reporte_carga_masiva.json', 'w', encoding='utf-8') as f:
-        json.dump(reporte, f, indent=2, ensure_ascii=False)
-    
-    print(f"\n💾 Reporte guardado en: reporte_carga_masiva.json")
+    print(f"\n💾 Eventos guardados en: {archivo_eventos}")
     print()
 
 
+def ya_cargado(existente: Dict, archivo: str, datos: Dict) -> bool:
+    """El archivo del espejo es el mismo que se quiere subir."""
+    return (existente['archivo_nombre'] == archivo
+            and existente['total_registros'] == datos['total_registros'])
+
+
+def leer_anticipado(archivos):
+    """Itera (entrada, buffer) con prefetch según CONFIG (buffer None si está apagado)."""
+    if CONFIG['prefetch_archivos'] <= 0:
+        return ((entrada, None) for entrada in archivos)
+    return Prefetch(archivos, k=CONFIG['prefetch_archivos'],
+                    max_bytes=CONFIG['prefetch_max_mb'] * 1024 * 1024, omitir=en_cache)
+
+
+class SesionCarga:
+    """Estado compartido por todos los archivos de una corrida (agregados, anomalías, espejo)."""
+    
+    def __init__(self, supabase, registro: RegistroEventos):
+        self.supabase = supabase
+        self.registro = registro
+        
+        self.agregados = None
+        if supabase is not None and CONFIG['actualizar_agregados']:
+            from agregados_pk import AgregadosPK
+            self.agregados = AgregadosPK(supabase)
+        
+        # Duplicados: se revisan en el espejo local, si existe
+        self.espejo = None
+        if Path(CONFIG['espejo_local']).exists():
+            self.espejo = EspejoLocal(CONFIG['espejo_local'])
+            print(f"🗄️  Espejo local: {CONFIG['espejo_local']} (sincronizado {self.espejo.ultima_sincronizacion()})")
+        
+        # Historia por PK: del espejo, de la BD, o de los snapshots en dry-run
+        self.indice_anomalias = None
+        if CONFIG['detectar_anomalias']:
+            from anomalias import IndiceUltimoEstado
+            self.indice_anomalias = IndiceUltimoEstado(supabase, CONFIG['carpeta_snapshots'], self.espejo)
+        
+        # Maestro de PKs: del espejo, o de la BD (en dry-run sin espejo no se empareja)
+        self.indice_pks = None
+        if CONFIG['emparejar_pks'] and (self.espejo or supabase is not None):
+            from emparejar_pks import IndicePKs
+            self.indice_pks = IndicePKs(supabase, self.espejo)
+    
+    def cerrar(self) -> None:
+        if self.espejo:
+            self.espejo.cerrar()
+
+
+def procesar_muros(supabase, registro: RegistroEventos):
+    """Procesa todos los archivos de cada muro registrando cada resultado."""
+    sesion = SesionCarga(supabase, registro)
+    tamano_lote = CONFIG['batch_size'] if CONFIG['usar_rpc'] else 1
+    
+    try:
+        for muro in CONFIG['muros']:
+            carpeta_muro = Path(CONFIG['carpeta_base']) / muro
+            
+            if not carpeta_muro.exists():
+                print(f"⚠️  Carpeta no encontrada: {carpeta_muro}")
+                continue
+            
+            # Obtener archivos
+            archivos = list(listar_archivos(CONFIG['carpeta_base'], [muro]))
+            
+            print(f"\n{'=' * 70}")
+            print(f"📁 {muro.upper()}: {len(archivos)} archivos")
+            print(f"{'=' * 70}\n")
+            
+            # Procesar archivos (el lector se cierra aunque falle: cancela las lecturas en curso)
+            pendientes: List[Tuple[str, Dict, Dict]] = []
+            lector = iter(leer_anticipado(archivos))
+            try:
+                for i, (entrada, fuente) in enumerate(lector, 1):
+                    print(f"[{i}/{len(archivos)}] {entrada.nombre}... ", end='', flush=True)
+                    procesar_entrada(sesion, entrada, fuente, pendientes, tamano_lote)
+            finally:
+                lector.close()
+            
+            # Archivos que quedaron en un lote incompleto
+            if pendientes:
+                subir_pendientes(supabase, registro, sesion.agregados, muro, pendientes, diferido=True,
+                                 anomalias=sesion.indice_anomalias)
+    finally:
+        sesion.cerrar()
+
+
+def procesar_cola(supabase, registro: RegistroEventos, trabajador) -> None:
+    """
+    Toma archivos de la cola compartida hasta vaciarla. Cada archivo se
+    parsea, se reserva su (muro, fecha) en la cola y recién entonces se sube:
+    otro trabajador nunca reemplaza la misma fecha al mismo tiempo.
+    """
+    sesion = SesionCarga(supabase, registro)
+    print(f"👷 Trabajador {trabajador.nombre} (cola: {trabajador.ruta})\n")
+    
+    tomados = 0
+    try:
+        while True:
+            tomado = trabajador.tomar()
+            if tomado is None:
+                # Lo que queda está tomado por otros, o bloqueado por su fecha
+                if not trabajador.quedan():
+                    break
+                time.sleep(CONFIG['espera_cola_segundos'])
+                continue
+            
+            id_trabajo, entrada = tomado
+            tomados += 1
+            print(f"[{tomados}] {entrada.muro}/{entrada.nombre}... ", end='', flush=True)
+            
+            # El parseo queda en cache: procesar_entrada no vuelve a leer el archivo
+            try:
+                datos = procesar_cacheado(entrada)
+            except Exception:
+                datos = None  # procesar_entrada registra el error
+            if datos and not trabajador.asignar_fecha(id_trabajo, datos['fecha']):
+                print(f"⏸️  {entrada.muro} {datos['fecha']} en proceso en otro trabajador, vuelve a la cola")
+                continue
+            
+            resultado = procesar_entrada(sesion, entrada, None, [])
+            # El error queda en la cola: organize lo reporta desde cualquier equipo
+            error = registro.ultimo_error if resultado in ('error', 'cuarentena') else None
+            if not trabajador.completar(id_trabajo, resultado, error):
+                print("   ⚠️  El lease venció durante el proceso: otro trabajador pudo retomarlo")
+            for fallo in trabajador.fallos_heartbeat():
+                registro.registrar('heartbeat_error', error=fallo)
+    finally:
+        sesion.cerrar()
+
+
+def procesar_entrada(sesion: SesionCarga, entrada, fuente, pendientes: List[Tuple[str, Dict, Dict]],
+                     tamano_lote: int = 1) -> str:
+    """
+    Parsea, revisa y sube (o deja en lote) un archivo del catálogo.
+    Retorna 'exitoso', 'error', 'cuarentena', 'duplicado', 'valido' (dry-run)
+    o 'en_lote' (se subirá con los siguientes).
+    """
+    registro = sesion.registro
+    archivo = entrada.nombre
+    muro = entrada.muro
+    # Planillas dentro de un .zip: el evento indica el zip y la ruta interna
+    origen = entrada.origen
+    
+    try:
+        # Procesar archivo (cache compartido con `revanchas.py validate`)
+        datos = procesar_cacheado(entrada, fuente)
+        
+        if sesion.indice_pks:
+            datos['emparejamiento'] = sesion.indice_pks.emparejar(muro, datos['mediciones'])
+        
+        if sesion.indice_anomalias:
+            from anomalias import describir
+            revision = sesion.indice_anomalias.revisar(muro, datos)
+            if revision['sospechoso']:
+                mensaje = describir(revision)
+                ruta_fallido = None
+                if not CONFIG['dry_run']:
+                    _, ruta_fallido = guardar_fallido(datos, archivo, muro, mensaje,
+                                                      CONFIG['carpeta_fallidos'],
+                                                      clasificacion='cuarentena', origen=origen)
+                print(f"🚧 [cuarentena] {mensaje}")
+                registro.registrar('error', archivo=archivo, muro=muro, error=mensaje,
+                                   clasificacion='cuarentena',
+                                   fallido=str(ruta_fallido) if ruta_fallido else None,
+                                   pks_anomalos=revision['pks_anomalos'],
+                                   pks_con_historia=revision['pks_con_historia'],
+                                   dry_run=CONFIG['dry_run'], **origen)
+                return 'cuarentena'
+        
+        existente = sesion.espejo.archivo_existente(muro, datos['fecha']) if sesion.espejo else None
+        if existente and CONFIG['omitir_ya_cargados'] and ya_cargado(existente, archivo, datos):
+            print(f"⏭️  Ya cargado (ID: {existente['id']}, según espejo local)")
+            registro.registrar('duplicado', archivo=archivo, muro=muro, fecha=datos['fecha'],
+                               archivo_id=existente['id'], dry_run=CONFIG['dry_run'], **origen)
+            return 'duplicado'
+        
+        if CONFIG['dry_run']:
+            reemplazo = f", reemplazaría ID {existente['id']}" if existente else ''
+            print(f"✅ Válido ({datos['total_registros']} registros, {datos['fecha']}{reemplazo})")
+            registro.registrar('exitoso', archivo=archivo, muro=muro,
+                               fecha=datos['fecha'], registros=datos['total_registros'],
+                               dry_run=True, **datos.get('emparejamiento', {}), **origen)
+            # En dry-run un archivo válido cuenta como subido para los siguientes
+            if sesion.indice_anomalias:
+                sesion.indice_anomalias.aceptar(muro, datos)
+            return 'valido'
+        
+        # Se sube de a un archivo o, con usar_rpc y batch_size > 1, por lotes
+        pendientes.append((archivo, datos, origen))
+        if len(pendientes) < tamano_lote:
+            print("⏳ en lote")
+            return 'en_lote'
+        resultados = subir_pendientes(sesion.supabase, registro, sesion.agregados, muro, pendientes,
+                                      anomalias=sesion.indice_anomalias)
+        return 'exitoso' if resultados[-1][0] else 'error'
+        
+    except Exception as e:
+        print(f"❌ {str(e)}")
+        registro.registrar('error', archivo=archivo, muro=muro, error=str(e), **origen)
+        return 'error'
+
+
+def subir_pendientes(supabase, registro: RegistroEventos, agregados, muro: str,
+                     pendientes: List[Tuple[str, Dict, Dict]],
+                     diferido: bool = False, anomalias=None) -> List[Tuple[bool, str]]:
+    """
+    Sube los archivos pendientes (uno solo, o un lote por RPC) y registra cada
+    resultado. `diferido`: la línea del archivo ya se imprimió (quedó en lote).
+    Solo los archivos subidos entran al índice de `anomalias`.
+    Retorna (exito, mensaje) de cada archivo.
+    """
+    en_lote = len(pendientes) > 1
+    if en_lote:
+        print(f"📦 Subiendo lote de {len(pendientes)} archivos...")
+        resultados = subir_lote(supabase, [(archivo, datos) for archivo, datos, _ in pendientes], muro)
+    else:
+        archivo, datos, _ = pendientes[0]
+        # Subir a Supabase (reemplaza duplicados automáticamente)
+        resultados = [subir_a_supabase(supabase, datos, archivo, muro)]
+    
+    for (archivo, datos, origen), (exito, mensaje) in zip(pendientes, resultados):
+        if en_lote or diferido:
+            print(f"   {archivo}... ", end='', flush=True)
+        
+        if exito and anomalias:
+            anomalias.aceptar(muro, datos)
+        
+        if exito and agregados:
+            # Un error en los agregados no invalida la subida del archivo
+            try:
+                agregados.actualizar(muro, datos)
+            except Exception as e:
+                print(f"⚠️  Agregados no actualizados: {e}... ", end='')
+                registro.registrar('agregados_error', archivo=archivo, muro=muro, error=str(e))
+        
+        # Tráfico del archivo (solo en modo eficiente; en lote se reporta el total)
+        trafico = {}
+        if isinstance(supabase, ClientePostgrest) and not en_lote:
+            trafico = supabase.tomar_trafico()
+        
+        if exito:
+            detalle_trafico = f" {formatear_trafico(trafico)}" if trafico else ''
+            print(f"✅ {datos['total_registros']} registros ({datos['fecha']}){detalle_trafico}")
+            registro.registrar('exitoso', archivo=archivo, muro=muro,
+                               fecha=datos['fecha'], registros=datos['total_registros'],
+                               **datos.get('emparejamiento', {}), **trafico, **origen)
+        else:
+            # Guardar datos parseados para reintentar sin releer el Excel
+            clasificacion, ruta_fallido = guardar_fallido(
+                datos, archivo, muro, mensaje, CONFIG['carpeta_fallidos'], origen=origen)
+            print(f"❌ [{clasificacion}] {mensaje}")
+            registro.registrar('error', archivo=archivo, muro=muro, error=mensaje,
+                               clasificacion=clasificacion, fallido=str(ruta_fallido),
+                               **trafico, **origen)
+    
+    if en_lote and isinstance(supabase, ClientePostgrest):
+        trafico = supabase.tomar_trafico()
+        print(f"   📦 Tráfico del lote: {formatear_trafico(trafico)}")
+        registro.registrar('lote', muro=muro, archivos=[archivo for archivo, _, _ in pendientes], **trafico)
+    
+    pendientes.clear()
+    
+    # Pequeña pausa para no sobrecargar
+    time.sleep(0.1)
+    return resultados
+
+
 if __name__ == '__main__':
     try:
         main()
@@ -0,0 +1,175 @@
+"""
+Catálogo de Archivos de Revanchas
+=================================
+
+Recorre la carpeta base (una subcarpeta por muro) y lista los archivos de
+revanchas sin abrirlos: solo nombre, tamaño y fecha de modificación. No
+importa openpyxl ni supabase, así `revanchas.py catalog` parte al instante.
+
+Los .zip de un muro (temporadas antiguas archivadas) se tratan como
+carpetas virtuales: cada planilla interna es una entrada más, que se lee
+desde memoria sin extraerla al disco. Su clave de cache usa el hash del
+contenido interno (CRC-32 + tamaño, ya guardados en el índice del zip).
+
+También mantiene un cache en memoria del parseo de cada archivo, compartido
+por todos los subcomandos que corren en el mismo proceso (por ejemplo
+`revanchas.py validate load`: el load reutiliza lo que parseó el validate
+sin volver a leer la unidad de red).
+"""
+
+import io
+import json
+import zipfile
+from collections import OrderedDict
+from fnmatch import fnmatch
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+EXTENSIONES = ('*.xlsx', '*.csv')
+
+
+class EntradaCatalogo(NamedTuple):
+    muro: str
+    nombre: str
+    ruta: Path
+    tamano: int
+    modificado: float
+    # Solo para planillas dentro de un .zip: nombre interno y hash del contenido
+    miembro: Optional[str] = None
+    hash: Optional[str] = None
+
+    @property
+    def contenedor(self) -> Optional[str]:
+        """Nombre del .zip que contiene la planilla (None si es un archivo suelto)."""
+        return self.ruta.name if self.miembro else None
+
+    @property
+    def origen(self) -> Dict[str, str]:
+        """
+        Zip y ruta interna completa de una planilla comprimida ({} si es un
+        archivo suelto). Dos zips (o dos carpetas de un zip) pueden tener
+        planillas con el mismo nombre: el log de eventos y la cola de
+        fallidos las distinguen por estos campos.
+        """
+        return {'contenedor': self.ruta.name, 'miembro': self.miembro} if self.miembro else {}
+
+    @property
+    def clave(self) -> Tuple:
+        """Clave de cache: cambia si el archivo (o la planilla interna) se modifica."""
+        if self.miembro:
+            return (str(self.ruta), self.miembro, self.hash)
+        return (str(self.ruta), self.tamano, self.modificado)
+
+    def leer(self) -> bytes:
+        """Contenido completo del archivo (o de la planilla interna del zip)."""
+        if not self.miembro:
+            return self.ruta.read_bytes()
+        with zipfile.ZipFile(self.ruta) as contenedor:
+            return contenedor.read(self.miembro)
+
+    def abrir(self) -> Union[Path, io.BytesIO]:
+        """Ruta del archivo, o la planilla interna del zip cargada en memoria."""
+        if not self.miembro:
+            return self.ruta
+        return io.BytesIO(self.leer())
+
+
+def _es_planilla(nombre: str) -> bool:
+    ruta = PurePosixPath(nombre)
+    # Se ignoran carpetas de metadatos de macOS y archivos de bloqueo de Excel
+    if '__MACOSX' in ruta.parts or ruta.name.startswith('~$'):
+        return False
+    return any(fnmatch(ruta.name.lower(), patron) for patron in EXTENSIONES)
+
+
+def listar_zip(muro: str, ruta: Path) -> Iterator[EntradaCatalogo]:
+    """Planillas dentro de un .zip (solo lee el índice, no descomprime)."""
+    try:
+        with zipfile.ZipFile(ruta) as contenedor:
+            miembros = [i for i in contenedor.infolist() if not i.is_dir() and _es_planilla(i.filename)]
+    except zipfile.BadZipFile:
+        print(f"⚠️  Zip dañado, se omite: {ruta}")
+        return
+
+    modificado = ruta.stat().st_mtime
+    for info in sorted(miembros, key=lambda i: i.filename):
+        yield EntradaCatalogo(
+            muro, PurePosixPath(info.filename).name, ruta, info.file_size,
+            modificado, miembro=info.filename,
+            hash=f"{info.CRC:08x}-{info.file_size}",
+        )
+
+
+def listar_archivos(carpeta_base: str, muros: List[str]) -> Iterator[EntradaCatalogo]:
+    """Lista los archivos de cada muro (ordenados por nombre), incluyendo los de sus .zip."""
+    for muro in muros:
+        carpeta_muro = Path(carpeta_base) / muro
+        if not carpeta_muro.exists():
+            continue
+
+        rutas = sorted(r for patron in EXTENSIONES + ('*.zip',) for r in carpeta_muro.glob(patron))
+        for ruta in rutas:
+            if ruta.suffix.lower() == '.zip':
+                yield from listar_zip(muro, ruta)
+                continue
+            info = ruta.stat()
+            yield EntradaCatalogo(muro, ruta.name, ruta, info.st_size, info.st_mtime)
+
+
+def escribir_manifest(entradas: List[EntradaCatalogo], ruta: str) -> None:
+    """Guarda el catálogo como JSON (muro, archivo, tamaño, modificado, zip y hash)."""
+    filas = [
+        {'muro': e.muro, 'archivo': e.nombre, 'ruta': str(e.ruta),
+         'tamano': e.tamano, 'modificado': e.modificado,
+         **({'miembro': e.miembro, 'hash': e.hash} if e.miembro else {})}
+        for e in entradas
+    ]
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(filas, f, indent=2, ensure_ascii=False)
+
+
+# ============================================
+# CACHE DE PARSEO (en memoria, por proceso)
+# ============================================
+
+# Máximo de archivos parseados en memoria (se descartan los más antiguos)
+MAX_CACHE_PARSEO = 128
+
+# clave -> (True, datos) o (False, mensaje de error). Los errores se guardan
+# como texto: una excepción con traceback retiene el libro y su BytesIO.
+_CACHE_PARSEO: 'OrderedDict[Tuple, Tuple[bool, object]]' = OrderedDict()
+
+
+def en_cache(entrada: EntradaCatalogo) -> bool:
+    """True si el archivo ya se parseó en este proceso (no hace falta leerlo)."""
+    return entrada.clave in _CACHE_PARSEO
+
+
+def _guardar_en_cache(clave: Tuple, valor: Tuple[bool, object]) -> None:
+    _CACHE_PARSEO[clave] = valor
+    while len(_CACHE_PARSEO) > MAX_CACHE_PARSEO:
+        _CACHE_PARSEO.popitem(last=False)
+
+
+def procesar_cacheado(entrada: EntradaCatalogo, fuente: Optional[io.BytesIO] = None) -> Dict:
+    """
+    procesar_archivo() con cache por archivo (LRU de MAX_CACHE_PARSEO). Los
+    errores también se guardan, para no volver a abrir un archivo que ya se
+    sabe inválido. `fuente`: bytes ya leídos por el prefetch (si no, se abre
+    el archivo).
+    """
+    if entrada.clave not in _CACHE_PARSEO:
+        from carga_masiva import procesar_archivo
+        try:
+            datos = procesar_archivo(fuente or entrada.abrir(), entrada.muro)
+        except Exception as e:
+            _guardar_en_cache(entrada.clave, (False, str(e)))
+            raise
+        _guardar_en_cache(entrada.clave, (True, datos))
+        return datos
+
+    _CACHE_PARSEO.move_to_end(entrada.clave)
+    ok, resultado = _CACHE_PARSEO[entrada.clave]
+    if not ok:
+        raise ValueError(resultado)
+    return resultado
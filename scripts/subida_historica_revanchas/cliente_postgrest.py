@@ -0,0 +1,159 @@
+"""
+Cliente PostgREST Liviano para la Carga Masiva
+==============================================
+
+Alternativa al cliente de supabase-py pensada para enlaces lentos:
+- Una sola sesión HTTP/2 keep-alive (pool de conexiones) para toda la corrida
+- Inserciones con `Prefer: return=minimal` o devolviendo solo `id`
+- Opcional: cuerpos grandes comprimidos con gzip. PostgREST no los acepta
+  por sí solo (solo si hay un gateway que los descomprime), así que viene
+  apagado; si se activa y el servidor los rechaza, se desactiva para todo
+  el cliente y se reenvía sin comprimir
+- Conteo de bytes enviados/recibidos para reportar el tráfico por archivo
+
+Requiere httpx (ya instalado con supabase) y h2 para HTTP/2; sin h2 se usa
+HTTP/1.1 keep-alive. httpx se importa al crear el cliente, así importar
+este módulo no tiene costo para los comandos que no suben datos.
+"""
+
+import gzip
+import json
+from typing import Dict, List, Optional
+
+# Respuestas de un servidor que no descomprime el cuerpo: 415 (Content-Encoding
+# no soportado) o 400 (JSON ilegible, el cuerpo llega comprimido)
+_RECHAZOS_COMPRESION = (415, 400)
+
+
+def _filtros_eq(filtros: Dict) -> Dict[str, str]:
+    """Convierte {'muro': 'Este'} en parámetros PostgREST {'muro': 'eq.Este'}."""
+    return {columna: f"eq.{valor}" for columna, valor in filtros.items()}
+
+
+class ClientePostgrest:
+    """Cliente mínimo de PostgREST con sesión persistente y conteo de tráfico."""
+
+    def __init__(self, url: str, key: str, gzip_desde_bytes: Optional[int] = None,
+                 timeout: float = 60.0):
+        self.base = url.rstrip('/') + '/rest/v1'
+        self.gzip_desde_bytes = gzip_desde_bytes
+        self.bytes_enviados = 0
+        self.bytes_recibidos = 0
+
+        import httpx
+
+        headers = {
+            'apikey': key,
+            'Authorization': f"Bearer {key}",
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip',
+        }
+        try:
+            self.http = httpx.Client(http2=True, headers=headers, timeout=timeout)
+        except ImportError:
+            # Sin el paquete h2: HTTP/1.1 con keep-alive
+            self.http = httpx.Client(headers=headers, timeout=timeout)
+
+    # ----------------------------------------
+    # Transporte
+    # ----------------------------------------
+
+    def _solicitar(self, metodo: str, ruta: str, params: Optional[Dict] = None,
+                   cuerpo=None, prefer: Optional[str] = None) -> 'httpx.Response':
+        headers = {}
+        if prefer:
+            headers['Prefer'] = prefer
+
+        contenido = None
+        enviado = None
+        if cuerpo is not None:
+            contenido = cuerpo if isinstance(cuerpo, bytes) else \
+                json.dumps(cuerpo, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            enviado = contenido
+            if self.gzip_desde_bytes and len(contenido) >= self.gzip_desde_bytes:
+                enviado = gzip.compress(contenido)
+                headers['Content-Encoding'] = 'gzip'
+
+        respuesta = self.http.request(metodo, f"{self.base}/{ruta}", params=params,
+                                      content=enviado, headers=headers)
+        self._contar(respuesta)
+
+        if 'Content-Encoding' in headers and respuesta.status_code in _RECHAZOS_COMPRESION:
+            # Se reenvía sin comprimir. Si así funciona (o falla distinto), el
+            # rechazo era por la compresión: se desactiva para todo el cliente.
+            # Un 400 que se repite es un error de los datos y no la apaga.
+            del headers['Content-Encoding']
+            rechazo = respuesta.status_code
+            respuesta = self.http.request(metodo, f"{self.base}/{ruta}", params=params,
+                                          content=contenido, headers=headers)
+            self._contar(respuesta)
+            if rechazo == 415 or respuesta.status_code != rechazo:
+                self.gzip_desde_bytes = None
+
+        if respuesta.status_code >= 400:
+            try:
+                detalle = respuesta.json()
+            except ValueError:
+                detalle = f"HTTP {respuesta.status_code}: {respuesta.text[:200]}"
+            raise Exception(str(detalle))
+
+        return respuesta
+
+    def _contar(self, respuesta: 'httpx.Response') -> None:
+        request = respuesta.request
+        self.bytes_enviados += len(request.content or b'') + \
+            sum(len(k) + len(v) + 4 for k, v in request.headers.raw)
+        self.bytes_recibidos += respuesta.num_bytes_downloaded + \
+            sum(len(k) + len(v) + 4 for k, v in respuesta.headers.raw)
+
+    def tomar_trafico(self) -> Dict[str, int]:
+        """Retorna el tráfico acumulado desde la última llamada y reinicia los contadores."""
+        trafico = {'bytes_enviados': self.bytes_enviados, 'bytes_recibidos': self.bytes_recibidos}
+        self.bytes_enviados = 0
+        self.bytes_recibidos = 0
+        return trafico
+
+    def cerrar(self) -> None:
+        self.http.close()
+
+    # ----------------------------------------
+    # Operaciones
+    # ----------------------------------------
+
+    def seleccionar(self, tabla: str, columnas: str = '*', **filtros) -> List[Dict]:
+        params = {'select': columnas, **_filtros_eq(filtros)}
+        return self._solicitar('GET', tabla, params=params).json()
+
+    def consultar(self, tabla: str, **params) -> List[Dict]:
+        """GET con parámetros PostgREST directos (ej: id='gt.100', order='id.asc', limit='1000')."""
+        return self._solicitar('GET', tabla, params=params).json()
+
+    def eliminar(self, tabla: str, devolver: Optional[str] = None, **filtros) -> List[Dict]:
+        """Elimina filas; si se pide `devolver`, retorna esas columnas de las filas borradas."""
+        params = _filtros_eq(filtros)
+        if devolver:
+            params['select'] = devolver
+            return self._solicitar('DELETE', tabla, params=params,
+                                   prefer='return=representation').json()
+        self._solicitar('DELETE', tabla, params=params, prefer='return=minimal')
+        return []
+
+    def insertar(self, tabla: str, filas, devolver: Optional[str] = None) -> List[Dict]:
+        """Inserta filas; sin `devolver` el servidor no retorna nada (return=minimal)."""
+        if devolver:
+            return self._solicitar('POST', tabla, params={'select': devolver}, cuerpo=filas,
+                                   prefer='return=representation').json()
+        self._solicitar('POST', tabla, cuerpo=filas, prefer='return=minimal')
+        return []
+
+    def upsert(self, tabla: str, filas, en_conflicto: str) -> None:
+        """Inserta o actualiza filas según las columnas únicas `en_conflicto`."""
+        self._solicitar('POST', tabla, params={'on_conflict': en_conflicto}, cuerpo=filas,
+                        prefer='resolution=merge-duplicates,return=minimal')
+
+    def rpc(self, funcion: str, argumentos):
+        """
+        Llama una función de Postgres expuesta por PostgREST. `argumentos`
+        puede ser un dict o el JSON ya serializado (bytes).
+        """
+        return self._solicitar('POST', f"rpc/{funcion}", cuerpo=argumentos).json()
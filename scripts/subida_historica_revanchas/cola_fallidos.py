@@ -0,0 +1,245 @@
+"""
+Cola de Fallidos (Dead-Letter) de la Carga Masiva
+=================================================
+
+Cuando subir_a_supabase() falla, los datos ya parseados del Excel se
+guardan en disco (JSON comprimido con gzip) para poder reintentarlos sin
+volver a leer el archivo desde la unidad de red.
+
+Cada fallido queda clasificado según su error:
+    _fallidos/
+    ├── reintentable/   (red, timeout, errores 5xx...)
+    ├── permanente/     (PK demasiado largo, constraints, tipos inválidos)
+    └── cuarentena/     (anomalías detectadas antes de subir, ver anomalias.py)
+
+Los permanentes no se reintentan por defecto: hay que corregir la causa
+(en el Excel o en la BD) y luego usar --permanentes. Los de cuarentena
+se suben tal cual con --cuarentena, una vez revisados.
+
+Uso:
+    python cola_fallidos.py listar
+    python cola_fallidos.py replay
+    python cola_fallidos.py replay --permanentes
+    python cola_fallidos.py replay --cuarentena
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from lote_mediciones import LoteMediciones
+
+CARPETA_FALLIDOS = '_fallidos'
+
+CLASIFICACIONES = ('reintentable', 'permanente', 'cuarentena')
+
+# Códigos SQLSTATE de Postgres que no se arreglan reintentando
+CODIGOS_PERMANENTES = {
+    '22001',  # string_data_right_truncation (ej: sector > 10 caracteres)
+    '22003',  # numeric_value_out_of_range
+    '22P02',  # invalid_text_representation
+    '23502',  # not_null_violation
+    '23503',  # foreign_key_violation
+    '23514',  # check_violation
+    '42703',  # undefined_column
+}
+
+# Mensajes equivalentes cuando el error no trae código
+PATRONES_PERMANENTES = [
+    r'value too long',
+    r'violates check constraint',
+    r'violates not-null constraint',
+    r'violates foreign key constraint',
+    r'invalid input syntax',
+    r'out of range',
+]
+
+
+def clasificar_error(mensaje: str) -> str:
+    """Clasifica un mensaje de error como 'permanente' o 'reintentable'."""
+    codigo = re.search(r"'code':\s*'(\w+)'", mensaje)
+    if codigo and codigo.group(1) in CODIGOS_PERMANENTES:
+        return 'permanente'
+
+    mensaje_lower = mensaje.lower()
+    if any(re.search(patron, mensaje_lower) for patron in PATRONES_PERMANENTES):
+        return 'permanente'
+
+    return 'reintentable'
+
+
+def _ruta_fallido(carpeta: Path, clasificacion: str, muro: str, archivo: str,
+                  origen: Optional[Dict] = None) -> Path:
+    if origen:
+        # Planilla de un zip: el zip más un hash de la ruta interna (dos
+        # carpetas del zip pueden tener planillas con el mismo nombre)
+        huella = hashlib.sha1(origen['miembro'].encode('utf-8')).hexdigest()[:10]
+        archivo = f"{origen['contenedor']}__{archivo}__{huella}"
+    return carpeta / clasificacion / f"{muro}__{archivo}.json.gz"
+
+
+def guardar_fallido(datos: Dict, archivo: str, muro: str, error: str,
+                    carpeta: str = CARPETA_FALLIDOS, intentos: int = 1,
+                    clasificacion: Optional[str] = None,
+                    origen: Optional[Dict] = None) -> Tuple[str, Path]:
+    """
+    Guarda los datos parseados de un archivo fallido. Si no se indica la
+    clasificación, se deduce del error. `origen`: zip y ruta interna de
+    una planilla comprimida (EntradaCatalogo.origen).
+    Retorna (clasificacion, ruta del archivo guardado).
+    """
+    clasificacion = clasificacion or clasificar_error(error)
+    base = Path(carpeta)
+
+    # Si ya estaba en la otra clasificación, se reemplaza
+    for otra in CLASIFICACIONES:
+        anterior = _ruta_fallido(base, otra, muro, archivo, origen)
+        if otra != clasificacion and anterior.exists():
+            anterior.unlink()
+
+    ruta = _ruta_fallido(base, clasificacion, muro, archivo, origen)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+
+    payload = {
+        'archivo': archivo,
+        'muro': muro,
+        'error': error,
+        'clasificacion': clasificacion,
+        'intentos': intentos,
+        'origen': origen or {},
+        'ts': datetime.now().isoformat(),
+        # Las mediciones se guardan por columnas (más compacto que una lista de dicts)
+        'datos': {**datos, 'mediciones': datos['mediciones'].a_columnas()},
+    }
+    with gzip.open(ruta, 'wt', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+
+    return clasificacion, ruta
+
+
+def cargar_fallido(ruta: Path) -> Dict:
+    """Lee un fallido guardado (las mediciones vuelven como LoteMediciones)."""
+    with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+        fallido = json.load(f)
+    mediciones = fallido['datos']['mediciones']
+    if isinstance(mediciones, list):
+        # Formato antiguo: lista de dicts por fila
+        fallido['datos']['mediciones'] = LoteMediciones.desde_filas(mediciones)
+    else:
+        fallido['datos']['mediciones'] = LoteMediciones.desde_columnas(mediciones)
+    return fallido
+
+
+def listar_fallidos(carpeta: str = CARPETA_FALLIDOS,
+                    clasificacion: Optional[str] = None) -> Iterator[Path]:
+    """Lista los archivos de la cola, opcionalmente de una sola clasificación."""
+    clasificaciones = [clasificacion] if clasificacion else CLASIFICACIONES
+    for c in clasificaciones:
+        yield from sorted((Path(carpeta) / c).glob('*.json.gz'))
+
+
+def reintentar(supabase, carpeta: str = CARPETA_FALLIDOS,
+               incluir_permanentes: bool = False, registro=None, agregados=None,
+               incluir_cuarentena: bool = False) -> Dict:
+    """
+    Vuelve a subir en bloque los fallidos de la cola (sin tocar los Excel).
+    Los exitosos se eliminan de la cola; los que fallan de nuevo se
+    reclasifican con el nuevo error.
+    """
+    from carga_masiva import subir_a_supabase
+
+    clasificaciones = ['reintentable']
+    if incluir_permanentes:
+        clasificaciones.append('permanente')
+    if incluir_cuarentena:
+        clasificaciones.append('cuarentena')
+    resultado = {'exitosos': 0, 'errores': 0}
+
+    rutas = [ruta for c in clasificaciones for ruta in listar_fallidos(carpeta, c)]
+    for i, ruta in enumerate(rutas, 1):
+        fallido = cargar_fallido(ruta)
+        archivo, muro, datos = fallido['archivo'], fallido['muro'], fallido['datos']
+        # Zip y ruta interna: el evento del reintento resuelve el error original
+        origen = fallido.get('origen') or {}
+        print(f"[{i}/{len(rutas)}] {muro}/{origen.get('miembro', archivo)}... ", end='', flush=True)
+
+        exito, mensaje = subir_a_supabase(supabase, datos, archivo, muro)
+
+        if exito:
+            ruta.unlink()
+            resultado['exitosos'] += 1
+            if agregados:
+                try:
+                    agregados.actualizar(muro, datos)
+                except Exception as e:
+                    print(f"⚠️  Agregados no actualizados: {e}... ", end='')
+            print(f"✅ {datos['total_registros']} registros ({datos['fecha']})")
+            if registro:
+                registro.registrar('exitoso', archivo=archivo, muro=muro, fecha=datos['fecha'],
+                                   registros=datos['total_registros'], reintento=True, **origen)
+        else:
+            ruta.unlink()
+            nueva, _ = guardar_fallido(datos, archivo, muro, mensaje, carpeta,
+                                       intentos=fallido.get('intentos', 1) + 1, origen=origen)
+            resultado['errores'] += 1
+            print(f"❌ [{nueva}] {mensaje}")
+            if registro:
+                registro.registrar('error', archivo=archivo, muro=muro, error=mensaje,
+                                   clasificacion=nueva, reintento=True, **origen)
+
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cola de fallidos de la carga masiva')
+    parser.add_argument('comando', choices=['listar', 'replay'])
+    parser.add_argument('--permanentes', action='store_true',
+                        help='Incluir también los errores permanentes (tras corregir la causa)')
+    parser.add_argument('--cuarentena', action='store_true',
+                        help='Subir también los archivos en cuarentena (ya revisados)')
+    parser.add_argument('--carpeta', default=CARPETA_FALLIDOS)
+    args = parser.parse_args()
+
+    if args.comando == 'listar':
+        total = 0
+        for ruta in listar_fallidos(args.carpeta):
+            fallido = cargar_fallido(ruta)
+            total += 1
+            print(f"[{fallido['clasificacion']}] {fallido['muro']}/{fallido['archivo']} "
+                  f"({fallido['intentos']} intentos): {fallido['error']}")
+        print(f"\n📦 {total} archivos en la cola")
+        return
+
+    from carga_masiva import CONFIG, ARCHIVO_EVENTOS, RegistroEventos, crear_conexion
+    from agregados_pk import AgregadosPK
+
+    if not CONFIG['supabase_url'] or not CONFIG['supabase_key']:
+        print("❌ Error: Faltan credenciales de Supabase en .env")
+        sys.exit(1)
+
+    print("🔌 Conectando a Supabase...")
+    supabase = crear_conexion()
+    print("✅ Conectado\n")
+
+    # Se agrega al log existente para que organizar_archivos.py vea los reintentos
+    with RegistroEventos(ARCHIVO_EVENTOS, muros=CONFIG['muros'], continuar=True) as registro:
+        agregados = AgregadosPK(supabase) if CONFIG['actualizar_agregados'] else None
+        resultado = reintentar(supabase, args.carpeta, args.permanentes, registro, agregados,
+                               incluir_cuarentena=args.cuarentena)
+
+    print(f"\n✅ Reintentos exitosos: {resultado['exitosos']}")
+    print(f"❌ Siguen fallando:     {resultado['errores']}")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Proceso cancelado por el usuario")
+        sys.exit(1)
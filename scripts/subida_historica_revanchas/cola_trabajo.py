@@ -0,0 +1,397 @@
+"""
+Cola de Trabajo Compartida (SQLite con Leases)
+==============================================
+
+Permite repartir una carga histórica grande entre varios procesos, o varios
+equipos que ven la misma carpeta de red: `revanchas.py queue` encola los
+archivos del catálogo y cada `revanchas.py work` toma archivos de a uno.
+
+    - Lease: un archivo tomado queda a nombre del trabajador hasta
+      `lease_hasta`. Un hilo de fondo lo renueva (heartbeat) mientras el
+      trabajador está vivo; si el proceso o el equipo se cae, el lease
+      vence y otro trabajador retoma el archivo.
+    - Shard por (muro, fecha_medicion): la fecha se conoce recién al parsear.
+      Antes de subir, el trabajador la asigna a su archivo; si otro
+      trabajador vivo tiene un archivo con la misma clave, el suyo vuelve a
+      la cola. Así dos reemplazos del mismo muro y fecha nunca corren a la vez.
+    - Los archivos que vencen MAX_INTENTOS veces (ej: un Excel que tumba al
+      proceso) quedan en estado 'error' en vez de reintentarse para siempre.
+    - Fin de carga: el trabajador que deja la cola vacía (reclamar_cierre)
+      actualiza el GeoPackage una sola vez por todos.
+
+La cola es un archivo SQLite en la carpeta base (por defecto
+_cola_carga.sqlite). Usa el journal clásico (no WAL, que no funciona sobre
+SMB) y transacciones BEGIN IMMEDIATE para tomar archivos. Los leases usan
+el reloj de cada equipo: LEASE_SEGUNDOS debe ser bastante mayor que la
+diferencia de hora entre ellos.
+
+Uso:
+    python revanchas.py queue                 (una vez, o de nuevo para sumar archivos)
+    python revanchas.py work                  (en cada proceso / equipo)
+    python revanchas.py queue --estado        (avance de la cola)
+"""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from catalogo import EntradaCatalogo
+
+NOMBRE_COLA = '_cola_carga.sqlite'
+
+# Duración del lease y frecuencia del heartbeat (segundos)
+LEASE_SEGUNDOS = int(os.getenv('REVANCHAS_LEASE_SEGUNDOS', '300'))
+HEARTBEAT_SEGUNDOS = max(1, LEASE_SEGUNDOS // 5)
+
+# Veces que un archivo puede quedar huérfano antes de darlo por fallido
+MAX_INTENTOS = 3
+
+ESTADOS = ('pendiente', 'tomado', 'hecho', 'error')
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id INTEGER PRIMARY KEY,
+    muro TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    ruta TEXT NOT NULL,
+    miembro TEXT NOT NULL DEFAULT '',  -- planilla dentro de un .zip
+    hash TEXT,
+    tamano INTEGER,
+    modificado REAL,
+    fecha_medicion TEXT,               -- se conoce al parsear
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    trabajador TEXT,
+    lease_hasta REAL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    resultado TEXT,
+    error TEXT,
+    actualizado REAL,
+    UNIQUE (ruta, miembro)
+);
+
+CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, muro, id);
+CREATE INDEX IF NOT EXISTS idx_trabajos_clave ON trabajos (muro, fecha_medicion, estado);
+
+-- Pasos de fin de carga (GeoPackage) ya corridos: uno por vaciado de la cola
+CREATE TABLE IF NOT EXISTS cierres (
+    id INTEGER PRIMARY KEY,
+    trabajador TEXT NOT NULL,
+    hasta REAL NOT NULL,               -- `actualizado` del último archivo subido que cubre
+    cerrado REAL NOT NULL
+);
+"""
+
+# Resultado de procesar_entrada() -> estado final en la cola
+ESTADO_POR_RESULTADO = {
+    'exitoso': 'hecho',
+    'duplicado': 'hecho',
+    'valido': 'hecho',
+    'cuarentena': 'hecho',  # queda en _fallidos/cuarentena, no se reintenta aquí
+    'error': 'error',       # los errores de subida quedan en la cola de fallidos
+}
+
+
+def ruta_por_defecto(carpeta_base: str) -> str:
+    """La cola vive junto a los archivos: todos los equipos la ven."""
+    return str(Path(carpeta_base) / NOMBRE_COLA)
+
+
+def nombre_trabajador() -> str:
+    """Identificador del proceso: equipo-pid."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def abrir_cola(ruta: str) -> sqlite3.Connection:
+    # isolation_level=None: las transacciones se abren a mano (BEGIN IMMEDIATE)
+    conexion = sqlite3.connect(ruta, timeout=30, isolation_level=None)
+    conexion.row_factory = sqlite3.Row
+    conexion.execute('PRAGMA journal_mode=DELETE')
+    conexion.executescript(ESQUEMA)
+    return conexion
+
+
+class _Transaccion:
+    """BEGIN IMMEDIATE ... COMMIT: toma el lock de escritura al entrar."""
+
+    def __init__(self, conexion: sqlite3.Connection):
+        self.conexion = conexion
+
+    def __enter__(self):
+        self.conexion.execute('BEGIN IMMEDIATE')
+        return self.conexion
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conexion.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+        return False
+
+
+# ============================================
+# ENCOLAR Y ESTADO
+# ============================================
+
+def encolar(conexion: sqlite3.Connection, entradas: Iterable[EntradaCatalogo]) -> Dict[str, int]:
+    """
+    Agrega las entradas del catálogo. Volver a encolar es seguro: los archivos
+    ya conocidos se ignoran, salvo que hayan cambiado (vuelven a 'pendiente').
+    """
+    nuevos = 0
+    cambiados = 0
+    ahora = time.time()
+    with _Transaccion(conexion):
+        for e in entradas:
+            previo = conexion.execute(
+                'SELECT id, tamano, modificado, hash FROM trabajos WHERE ruta = ? AND miembro = ?',
+                (str(e.ruta), e.miembro or ''),
+            ).fetchone()
+            if previo is None:
+                conexion.execute(
+                    'INSERT INTO trabajos (muro, nombre, ruta, miembro, hash, tamano, modificado, actualizado)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (e.muro, e.nombre, str(e.ruta), e.miembro or '', e.hash, e.tamano, e.modificado, ahora),
+                )
+                nuevos += 1
+            elif (previo['tamano'], previo['modificado'], previo['hash']) != (e.tamano, e.modificado, e.hash):
+                # Un archivo tomado ahora se vuelve a procesar al terminar su lease
+                conexion.execute(
+                    "UPDATE trabajos SET tamano = ?, modificado = ?, hash = ?, fecha_medicion = NULL,"
+                    " estado = CASE WHEN estado = 'tomado' THEN estado ELSE 'pendiente' END,"
+                    " intentos = 0, resultado = NULL, error = NULL, actualizado = ? WHERE id = ?",
+                    (e.tamano, e.modificado, e.hash, ahora, previo['id']),
+                )
+                cambiados += 1
+    return {'nuevos': nuevos, 'cambiados': cambiados}
+
+
+def estado_cola(conexion: sqlite3.Connection) -> Dict[str, Dict[str, int]]:
+    """Conteo por muro y estado ('tomado' separa los leases vencidos)."""
+    resumen: Dict[str, Dict[str, int]] = {}
+    filas = conexion.execute(
+        "SELECT muro, CASE WHEN estado = 'tomado' AND lease_hasta < ? THEN 'vencido' ELSE estado END AS e,"
+        " COUNT(*) AS n FROM trabajos GROUP BY muro, e ORDER BY muro",
+        (time.time(),),
+    )
+    for fila in filas:
+        resumen.setdefault(fila['muro'], {})[fila['e']] = fila['n']
+    return resumen
+
+
+# Resultado en la cola -> evento del log (registro_eventos.py)
+EVENTO_POR_RESULTADO = {
+    'exitoso': 'exitoso',
+    'duplicado': 'duplicado',
+    'valido': 'exitoso',      # dry-run
+    'cuarentena': 'error',
+    'error': 'error',
+}
+
+
+def eventos_cola(conexion: sqlite3.Connection) -> Iterator[Dict]:
+    """
+    Resultado de cada archivo terminado (hecho/error) en el formato de los
+    eventos de archivo del log, para organizar_archivos.py. La cola es la
+    misma para todos los equipos: no depende de qué logs ve cada uno.
+    """
+    filas = conexion.execute(
+        "SELECT muro, nombre, ruta, miembro, fecha_medicion, resultado, error FROM trabajos"
+        " WHERE estado IN ('hecho', 'error') ORDER BY actualizado")
+    for fila in filas:
+        evento = {'evento': EVENTO_POR_RESULTADO.get(fila['resultado'], 'error'),
+                  'archivo': fila['nombre'], 'muro': fila['muro']}
+        if fila['miembro']:
+            evento.update(contenedor=Path(fila['ruta']).name, miembro=fila['miembro'])
+        if fila['fecha_medicion']:
+            evento['fecha'] = fila['fecha_medicion']
+        if fila['resultado'] == 'valido':
+            evento['dry_run'] = True
+        elif fila['resultado'] == 'cuarentena':
+            evento['clasificacion'] = 'cuarentena'
+        if evento['evento'] == 'error':
+            evento['error'] = fila['error'] or 'sin detalle (ver el log del trabajador)'
+        yield evento
+
+
+def entrada_de(fila: sqlite3.Row) -> EntradaCatalogo:
+    return EntradaCatalogo(
+        fila['muro'], fila['nombre'], Path(fila['ruta']), fila['tamano'], fila['modificado'],
+        miembro=fila['miembro'] or None, hash=fila['hash'],
+    )
+
+
+# ============================================
+# TRABAJADOR
+# ============================================
+
+_CLAVE_OCUPADA = """
+EXISTS (SELECT 1 FROM trabajos o
+        WHERE o.muro = t.muro AND o.fecha_medicion = t.fecha_medicion
+          AND o.id != t.id AND o.estado = 'tomado' AND o.lease_hasta >= :ahora)
+"""
+
+
+class Trabajador:
+    """Toma archivos de la cola con lease y los renueva en un hilo de fondo."""
+
+    def __init__(self, ruta: str, nombre: Optional[str] = None,
+                 muros: Optional[List[str]] = None, lease: int = LEASE_SEGUNDOS):
+        self.ruta = ruta
+        self.nombre = nombre or nombre_trabajador()
+        self.muros = muros
+        self.lease = lease
+        self.conexion = abrir_cola(ruta)
+        self._detener = threading.Event()
+        # El hilo no imprime (se mezclaría con la línea de avance): guarda los
+        # fallos y procesar_cola los pasa al log de eventos
+        self._fallos_latido: List[str] = []
+        self._candado_fallos = threading.Lock()
+        self._heartbeat = threading.Thread(target=self._latir, name='heartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def _latir(self) -> None:
+        # Conexión propia: sqlite3 no comparte conexiones entre hilos
+        conexion = abrir_cola(self.ruta)
+        try:
+            while not self._detener.wait(min(HEARTBEAT_SEGUNDOS, self.lease / 3)):
+                try:
+                    conexion.execute(
+                        "UPDATE trabajos SET lease_hasta = ? WHERE estado = 'tomado' AND trabajador = ?",
+                        (time.time() + self.lease, self.nombre),
+                    )
+                except sqlite3.OperationalError as e:
+                    # Cola bloqueada o red caída: se reintenta en el próximo latido
+                    with self._candado_fallos:
+                        self._fallos_latido.append(str(e))
+        finally:
+            conexion.close()
+
+    def fallos_heartbeat(self) -> List[str]:
+        """Errores de los latidos no renovados desde la última llamada."""
+        with self._candado_fallos:
+            fallos, self._fallos_latido = self._fallos_latido, []
+        return fallos
+
+    def _filtro_muros(self) -> Tuple[str, Dict[str, str]]:
+        if not self.muros:
+            return '', {}
+        marcas = ', '.join(f':muro{i}' for i in range(len(self.muros)))
+        return f'AND t.muro IN ({marcas})', {f'muro{i}': m for i, m in enumerate(self.muros)}
+
+    def tomar(self) -> Optional[Tuple[int, EntradaCatalogo]]:
+        """
+        Toma el próximo archivo pendiente (o con lease vencido) cuya clave
+        (muro, fecha) no esté tomada por otro trabajador. None si no queda nada.
+        """
+        ahora = time.time()
+        filtro_muros, parametros = self._filtro_muros()
+        parametros.update({'ahora': ahora, 'hasta': ahora + self.lease, 'yo': self.nombre,
+                           'max_intentos': MAX_INTENTOS})
+
+        with _Transaccion(self.conexion) as conexion:
+            # Huérfanos que ya agotaron sus intentos: no se vuelven a tomar
+            conexion.execute(
+                "UPDATE trabajos SET estado = 'error', error = 'lease vencido ' || intentos || ' veces',"
+                " trabajador = NULL, actualizado = :ahora"
+                " WHERE estado = 'tomado' AND lease_hasta < :ahora AND intentos >= :max_intentos",
+                parametros,
+            )
+            fila = conexion.execute(
+                f"""SELECT t.* FROM trabajos t
+                    WHERE (t.estado = 'pendiente' OR (t.estado = 'tomado' AND t.lease_hasta < :ahora))
+                      {filtro_muros}
+                      AND NOT (t.fecha_medicion IS NOT NULL AND {_CLAVE_OCUPADA})
+                    ORDER BY t.estado = 'tomado', t.muro, t.id
+                    LIMIT 1""",
+                parametros,
+            ).fetchone()
+            if fila is None:
+                return None
+            if fila['estado'] == 'tomado':
+                print(f"♻️  Lease vencido de {fila['trabajador']}: se retoma {fila['nombre']}")
+            conexion.execute(
+                "UPDATE trabajos SET estado = 'tomado', trabajador = :yo, lease_hasta = :hasta,"
+                " intentos = intentos + 1, actualizado = :ahora WHERE id = :id",
+                {**parametros, 'id': fila['id']},
+            )
+        return fila['id'], entrada_de(fila)
+
+    def quedan(self) -> bool:
+        """True si hay archivos pendientes o tomados por otros (hay que esperar)."""
+        filtro, parametros = self._filtro_muros()
+        return self.conexion.execute(
+            f"""SELECT EXISTS (SELECT 1 FROM trabajos t
+                    WHERE (t.estado = 'pendiente' OR (t.estado = 'tomado' AND t.trabajador != :yo))
+                    {filtro})""",
+            {**parametros, 'yo': self.nombre},
+        ).fetchone()[0] == 1
+
+    def asignar_fecha(self, id_trabajo: int, fecha: str) -> bool:
+        """
+        Registra la fecha parseada del archivo. Si otro trabajador vivo tiene la
+        misma clave (muro, fecha), el archivo vuelve a la cola y retorna False.
+        """
+        ahora = time.time()
+        with _Transaccion(self.conexion) as conexion:
+            conexion.execute('UPDATE trabajos SET fecha_medicion = ? WHERE id = ?', (fecha, id_trabajo))
+            ocupada = conexion.execute(
+                f'SELECT {_CLAVE_OCUPADA} FROM trabajos t WHERE t.id = :id',
+                {'id': id_trabajo, 'ahora': ahora},
+            ).fetchone()[0]
+            if ocupada:
+                conexion.execute(
+                    "UPDATE trabajos SET estado = 'pendiente', trabajador = NULL, lease_hasta = NULL,"
+                    " intentos = intentos - 1, actualizado = ? WHERE id = ? AND trabajador = ?",
+                    (ahora, id_trabajo, self.nombre),
+                )
+        return not ocupada
+
+    def completar(self, id_trabajo: int, resultado: str, error: Optional[str] = None) -> bool:
+        """Cierra el archivo. False si el lease ya se había perdido (otro lo retomó)."""
+        estado = ESTADO_POR_RESULTADO.get(resultado, 'error')
+        with _Transaccion(self.conexion) as conexion:
+            cursor = conexion.execute(
+                "UPDATE trabajos SET estado = ?, resultado = ?, error = ?, lease_hasta = NULL,"
+                " actualizado = ? WHERE id = ? AND trabajador = ? AND estado = 'tomado'",
+                (estado, resultado, error, time.time(), id_trabajo, self.nombre),
+            )
+        return cursor.rowcount == 1
+
+    def reclamar_cierre(self) -> bool:
+        """
+        True para un solo trabajador: el que encuentra la cola vacía (nada
+        pendiente ni tomado) con archivos subidos después del último cierre.
+        Ese trabajador corre los pasos de fin de carga una vez por todos.
+        """
+        with _Transaccion(self.conexion) as conexion:
+            ocupada = conexion.execute(
+                "SELECT EXISTS (SELECT 1 FROM trabajos WHERE estado IN ('pendiente', 'tomado'))"
+            ).fetchone()[0]
+            ultimo = conexion.execute(
+                "SELECT MAX(actualizado) FROM trabajos WHERE resultado = 'exitoso'").fetchone()[0]
+            cubierto = conexion.execute('SELECT MAX(hasta) FROM cierres').fetchone()[0]
+            if ocupada or ultimo is None or (cubierto is not None and ultimo <= cubierto):
+                return False
+            conexion.execute('INSERT INTO cierres (trabajador, hasta, cerrado) VALUES (?, ?, ?)',
+                             (self.nombre, ultimo, time.time()))
+        return True
+
+    def cerrar(self) -> None:
+        """Detiene el heartbeat y devuelve a la cola lo que quedó tomado (Ctrl-C)."""
+        self._detener.set()
+        self._heartbeat.join()
+        with _Transaccion(self.conexion) as conexion:
+            conexion.execute(
+                "UPDATE trabajos SET estado = 'pendiente', trabajador = NULL, lease_hasta = NULL,"
+                " intentos = intentos - 1, actualizado = ? WHERE estado = 'tomado' AND trabajador = ?",
+                (time.time(), self.nombre),
+            )
+        self.conexion.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cerrar()
+        return False
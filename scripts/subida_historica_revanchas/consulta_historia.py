@@ -0,0 +1,211 @@
+"""
+Consultas por Fecha sobre la Historia de Revanchas
+==================================================
+
+Responde "¿cómo estaba cada PK el día X?" (auditorías, slider de historia
+del mapa) sin el GROUP BY con MAX(fecha_medicion) <= X sobre toda la vista
+georreferenciada.
+
+La historia (del espejo local o de las planillas de la carpeta base) se
+carga una vez en vectores NumPy ordenados por (muro, sector, pk) y fecha:
+la historia de cada PK es un tramo contiguo de fechas ordenadas. Cada
+consulta es una búsqueda binaria por PK (np.searchsorted), O(PKs · log
+historia), y una consulta de muchas fechas (ej: animar un año) se resuelve
+con una sola llamada.
+
+Uso:
+    historia = HistoriaPKs.desde_espejo('espejo_revanchas.sqlite', ['Principal'])
+    historia.al('2023-06-30')                       # última medición de cada PK a esa fecha
+    historia.entre('2023-01-01', '2023-12-31')      # todas las mediciones del período
+    historia.a_fechas(['2023-01-31', '2023-02-28'])  # {fecha: filas} en una pasada
+"""
+
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from lote_mediciones import COLUMNAS_NUMERICAS, a_float
+
+Clave = Tuple[str, str, str]  # (muro, sector, pk)
+
+
+def _dia(fecha) -> int:
+    return int(np.datetime64(str(fecha)[:10], 'D').astype(np.int64))
+
+
+def _fecha(dia: int) -> str:
+    return str(np.datetime64(int(dia), 'D'))
+
+
+class HistoriaPKs:
+    """
+    Historia de mediciones por PK en vectores alineados:
+    filas [inicio[k], inicio[k + 1]) son las del PK `claves[k]`, por fecha.
+    """
+
+    def __init__(self):
+        self.claves: List[Clave] = []
+        self.archivos: List[str] = []
+        self.inicio = np.zeros(1, dtype=np.intp)
+        self.dias = np.empty(0, dtype=np.int64)
+        self.archivo = np.empty(0, dtype=np.int32)
+        self.valores: Dict[str, np.ndarray] = {c: np.empty(0) for c in COLUMNAS_NUMERICAS}
+        # Clave de búsqueda: k * _escala + (día - _dia_minimo), creciente en todo el vector
+        self._compuesto = np.empty(0, dtype=np.int64)
+        self._dia_minimo = 0
+        self._escala = 1
+
+    # ----------------------------------------
+    # Construcción
+    # ----------------------------------------
+
+    @classmethod
+    def desde_filas(cls, filas: Iterable[Dict]) -> 'HistoriaPKs':
+        """
+        Filas con muro, sector, pk, fecha_medicion, archivo_nombre y las columnas
+        numéricas. Si un PK tiene dos mediciones en la misma fecha gana la última.
+        Las filas con pk_maestro (espejo) se agrupan por ese PK: el mismo punto
+        del mapa aunque cada planilla lo escriba distinto.
+        """
+        historia = cls()
+        indice_claves: Dict[Clave, int] = {}
+        indice_archivos: Dict[str, int] = {}
+        claves = array('q')
+        dias = array('q')
+        archivos = array('q')
+        valores = {c: array('d') for c in COLUMNAS_NUMERICAS}
+
+        for fila in filas:
+            clave = (fila['muro'], fila['sector'] or '', fila.get('pk_maestro') or fila['pk'])
+            claves.append(indice_claves.setdefault(clave, len(indice_claves)))
+            nombre = fila.get('archivo_nombre') or ''
+            archivos.append(indice_archivos.setdefault(nombre, len(indice_archivos)))
+            dias.append(_dia(fila['fecha_medicion']))
+            for c in COLUMNAS_NUMERICAS:
+                valores[c].append(a_float(fila.get(c)))
+
+        historia.archivos = list(indice_archivos)
+        if not indice_claves:
+            return historia
+
+        # Claves en orden (muro, sector, pk) para que las salidas salgan ordenadas
+        por_indice = list(indice_claves)
+        orden_claves = sorted(range(len(por_indice)), key=por_indice.__getitem__)
+        rango = np.empty(len(orden_claves), dtype=np.int64)
+        rango[orden_claves] = np.arange(len(orden_claves))
+        historia.claves = [por_indice[k] for k in orden_claves]
+
+        clave = rango[np.frombuffer(claves, dtype=np.int64)]
+        dia = np.frombuffer(dias, dtype=np.int64)
+        secuencia = np.arange(len(clave))
+        orden = np.lexsort((secuencia, dia, clave))
+        clave, dia = clave[orden], dia[orden]
+
+        # Misma clave y fecha repetida: se queda la última fila leída
+        ultima = np.ones(len(clave), dtype=bool)
+        ultima[:-1] = (clave[1:] != clave[:-1]) | (dia[1:] != dia[:-1])
+        orden, clave, dia = orden[ultima], clave[ultima], dia[ultima]
+
+        historia.dias = dia
+        historia.archivo = np.frombuffer(archivos, dtype=np.int64)[orden].astype(np.int32)
+        historia.valores = {c: np.frombuffer(valores[c], dtype=np.float64)[orden] for c in COLUMNAS_NUMERICAS}
+        historia.inicio = np.searchsorted(clave, np.arange(len(historia.claves) + 1))
+
+        historia._dia_minimo = int(dia.min())
+        historia._escala = int(dia.max()) - historia._dia_minimo + 2
+        historia._compuesto = clave * historia._escala + (dia - historia._dia_minimo)
+        return historia
+
+    @classmethod
+    def desde_espejo(cls, ruta: str, muros: List[str]) -> 'HistoriaPKs':
+        """Historia desde el espejo SQLite local (`revanchas.py sync`)."""
+        from espejo_local import EspejoLocal
+
+        espejo = EspejoLocal(ruta)
+        try:
+            return cls.desde_filas(fila for muro in muros for fila in espejo.historia(muro))
+        finally:
+            espejo.cerrar()
+
+    @classmethod
+    def desde_archivos(cls, carpeta_base: str, muros: List[str]) -> 'HistoriaPKs':
+        """Historia parseando las planillas de la carpeta base (se omiten las inválidas)."""
+        from catalogo import listar_archivos, procesar_cacheado
+
+        def filas():
+            for entrada in listar_archivos(carpeta_base, muros):
+                try:
+                    datos = procesar_cacheado(entrada)
+                except Exception as e:
+                    print(f"⚠️  {entrada.muro}/{entrada.nombre}: {e}")
+                    continue
+                lote = datos['mediciones']
+                for i in range(len(lote)):
+                    yield {'muro': entrada.muro, 'sector': lote.sector[i], 'pk': lote.pk[i],
+                           'fecha_medicion': datos['fecha'], 'archivo_nombre': entrada.nombre,
+                           **{c: lote.columnas[c][i] for c in COLUMNAS_NUMERICAS}}
+
+        return cls.desde_filas(filas())
+
+    # ----------------------------------------
+    # Consultas
+    # ----------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.dias)
+
+    def _buscar(self, dias: np.ndarray, lado: str) -> np.ndarray:
+        """searchsorted de cada (PK, día): matriz (len(dias), PKs) de posiciones."""
+        # Días fuera del rango conocido se acotan para no invadir el tramo del PK vecino
+        relativos = np.clip(dias - self._dia_minimo, -1, self._escala - 1)
+        k = np.arange(len(self.claves), dtype=np.int64)
+        objetivos = k[None, :] * self._escala + relativos[:, None]
+        return np.searchsorted(self._compuesto, objetivos, side=lado)
+
+    def posiciones(self, fechas: Iterable) -> np.ndarray:
+        """
+        Fila vigente de cada PK en cada fecha: matriz (fechas, PKs) con el
+        índice de la última medición <= fecha, o -1 si el PK aún no se medía.
+        """
+        dias = np.array([_dia(f) for f in fechas], dtype=np.int64)
+        if not len(self.claves):
+            return np.full((len(dias), 0), -1, dtype=np.intp)
+        posicion = self._buscar(dias, 'right') - 1
+        return np.where(posicion >= self.inicio[None, :-1], posicion, -1)
+
+    def fila(self, k: int, i: int) -> Dict:
+        """Medición i (del PK k) como dict, con None en vez de NaN."""
+        muro, sector, pk = self.claves[k]
+        fila = {'muro': muro, 'sector': sector, 'pk': pk, 'fecha_medicion': _fecha(self.dias[i]),
+                'archivo_nombre': self.archivos[self.archivo[i]]}
+        for c in COLUMNAS_NUMERICAS:
+            valor = float(self.valores[c][i])
+            fila[c] = None if valor != valor else valor
+        return fila
+
+    def a_fechas(self, fechas: Iterable) -> Dict[str, List[Dict]]:
+        """Estado de cada PK en cada fecha: {fecha: filas} (PKs sin medición previa se omiten)."""
+        fechas = [str(f)[:10] for f in fechas]
+        matriz = self.posiciones(fechas)
+        return {
+            fecha: [self.fila(k, i) for k, i in enumerate(matriz[j]) if i >= 0]
+            for j, fecha in enumerate(fechas)
+        }
+
+    def al(self, fecha) -> List[Dict]:
+        """Última medición de cada PK a la fecha (inclusive)."""
+        return self.a_fechas([fecha])[str(fecha)[:10]]
+
+    def entre(self, desde, hasta, muro: Optional[str] = None) -> List[Dict]:
+        """Todas las mediciones con desde <= fecha <= hasta, por PK y fecha."""
+        dias = np.array([_dia(desde), _dia(hasta)], dtype=np.int64)
+        if not len(self.claves) or dias[0] > dias[1]:
+            return []
+        inicio = self._buscar(dias[:1], 'left')[0]
+        fin = self._buscar(dias[1:], 'right')[0]
+        return [
+            self.fila(k, i)
+            for k in range(len(self.claves)) if muro is None or self.claves[k][0] == muro
+            for i in range(inicio[k], fin[k])
+        ]
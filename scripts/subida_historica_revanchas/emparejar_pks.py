@@ -0,0 +1,153 @@
+"""
+Emparejamiento de PKs por Cadenamiento
+======================================
+
+Las planillas antiguas traen PKs en formatos que el JOIN exacto de la vista
+(normalizar_pk) no puede ubicar: "736.45", "0.05999999999994543", "2.75".
+Antes se borraban (CORREGIR_VISTAS_REVANCHAS.sql); ahora el loader asigna a
+cada fila el PK de pks_maestro más cercano por cadenamiento y guarda la
+distancia, sin perder la medición ni hacer búsquedas difusas en SQL.
+
+    - Cadenamiento: "1+234.5" -> 1234.5 m. Un número sin "+" puede estar en
+      metros ("736.45") o en kilómetros ("0.0599..." = 0+060): se prueban
+      ambas lecturas y gana la más cercana a un PK del maestro.
+    - Por muro se arma una sola vez un vector ordenado con el cadenamiento
+      de los PKs activos; cada fila se ubica con una búsqueda binaria
+      (np.searchsorted, O(log n)), todas las filas del archivo a la vez.
+    - Si el PK más cercano está a más de TOLERANCIA_METROS, la fila queda
+      sin pk_maestro (se guarda igual, sin coordenadas en el mapa).
+
+El maestro se lee del espejo local (si existe) o de Supabase.
+"""
+
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cliente_postgrest import ClientePostgrest
+from lote_mediciones import LoteMediciones
+
+# Distancia máxima (m) entre el PK de la planilla y el PK del maestro
+TOLERANCIA_METROS = float(os.getenv('REVANCHAS_TOLERANCIA_PK', '5'))
+
+# "1+234", "0+550.800", "1 + 234,5"
+_PATRON_CADENAMIENTO = re.compile(r'^\s*(\d+)\s*\+\s*(\d+(?:[.,]\d+)?)\s*$')
+# "736.45", "0.05999999999994543", "12"
+_PATRON_NUMERO = re.compile(r'^\s*\d+(?:[.,]\d+)?\s*$')
+
+
+def cadenamiento(pk: str) -> Tuple[float, bool]:
+    """
+    Cadenamiento en metros y si el PK viene en formato estándar (km+m).
+    Un número suelto se retorna tal cual (la lectura en km se prueba aparte).
+    (NaN, False) si no es interpretable.
+    """
+    texto = str(pk)
+    encontrado = _PATRON_CADENAMIENTO.match(texto)
+    if encontrado:
+        return int(encontrado.group(1)) * 1000 + float(encontrado.group(2).replace(',', '.')), True
+    if _PATRON_NUMERO.match(texto):
+        return float(texto.replace(',', '.')), False
+    return np.nan, False
+
+
+class MaestroMuro:
+    """PKs activos de un muro ordenados por cadenamiento."""
+
+    __slots__ = ('pks', 'cadenamientos')
+
+    def __init__(self, pks: List[str]):
+        pares = sorted((c, pk) for pk in pks for c, estandar in [cadenamiento(pk)] if estandar)
+        self.pks = [pk for _, pk in pares]
+        self.cadenamientos = np.array([c for c, _ in pares], dtype=np.float64)
+
+    def mas_cercano(self, valores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Índice del PK más cercano a cada cadenamiento y su distancia (inf si NaN)."""
+        n = len(self.cadenamientos)
+        if n == 0:
+            return np.zeros(len(valores), dtype=np.intp), np.full(len(valores), np.inf)
+
+        validos = ~np.isnan(valores)
+        # Vecinos a cada lado de la posición de inserción
+        derecha = np.searchsorted(self.cadenamientos, np.where(validos, valores, 0.0))
+        derecha = np.clip(derecha, 1, n - 1) if n > 1 else np.zeros(len(valores), dtype=np.intp)
+        izquierda = np.maximum(derecha - 1, 0)
+        dist_izquierda = np.abs(valores - self.cadenamientos[izquierda])
+        dist_derecha = np.abs(valores - self.cadenamientos[derecha])
+        indices = np.where(dist_derecha < dist_izquierda, derecha, izquierda)
+        distancias = np.where(validos, np.fmin(dist_izquierda, dist_derecha), np.inf)
+        return indices, distancias
+
+
+class IndicePKs:
+    """
+    Maestro de PKs por muro, leído una sola vez por corrida.
+    `espejo`: EspejoLocal (preferido); `conexion`: Supabase o ClientePostgrest.
+    """
+
+    def __init__(self, conexion=None, espejo=None, tolerancia: float = TOLERANCIA_METROS):
+        self.conexion = conexion
+        self.espejo = espejo
+        self.tolerancia = tolerancia
+        self._por_muro: Dict[str, MaestroMuro] = {}
+
+    def _pks(self, muro: str) -> List[str]:
+        if self.espejo is not None:
+            return [f['pk'] for f in self.espejo.conexion.execute(
+                'SELECT pk FROM pks_maestro WHERE muro = ? AND activo', (muro,))]
+        if isinstance(self.conexion, ClientePostgrest):
+            filas = self.conexion.seleccionar('pks_maestro', 'pk', muro=muro, activo='true')
+        else:
+            filas = self.conexion.table('pks_maestro').select('pk')\
+                .eq('muro', muro).eq('activo', True).execute().data
+        return [f['pk'] for f in filas]
+
+    def maestro(self, muro: str) -> MaestroMuro:
+        if muro not in self._por_muro:
+            self._por_muro[muro] = MaestroMuro(self._pks(muro))
+        return self._por_muro[muro]
+
+    def emparejar_pks(self, muro: str, pks: List[str]) -> Tuple[List[Optional[str]], np.ndarray]:
+        """PK del maestro (None si no hay uno dentro de la tolerancia) y distancia de cada PK."""
+        maestro = self.maestro(muro)
+        # Los PKs se repiten entre archivos y sectores: se resuelve cada valor distinto una vez
+        unicos = list(dict.fromkeys(pks))
+        lecturas = [cadenamiento(pk) for pk in unicos]
+        metros = np.array([c for c, _ in lecturas], dtype=np.float64)
+        numero_suelto = np.array([not estandar for _, estandar in lecturas], dtype=bool)
+
+        indices, distancias = maestro.mas_cercano(metros)
+        # Número sin "+": también puede estar en kilómetros
+        en_km = np.where(numero_suelto, metros * 1000, np.nan)
+        indices_km, distancias_km = maestro.mas_cercano(en_km)
+        usar_km = distancias_km < distancias
+        indices = np.where(usar_km, indices_km, indices)
+        distancias = np.where(usar_km, distancias_km, distancias)
+
+        dentro = distancias <= self.tolerancia
+        resultado = {
+            pk: (maestro.pks[indices[i]] if dentro[i] else None, distancias[i] if dentro[i] else np.nan)
+            for i, pk in enumerate(unicos)
+        }
+        return ([resultado[pk][0] for pk in pks],
+                np.array([resultado[pk][1] for pk in pks], dtype=np.float64))
+
+    def emparejar(self, muro: str, lote: LoteMediciones) -> Dict[str, int]:
+        """
+        Asigna pk_maestro y distancia_pk a cada fila del lote.
+        Retorna {'pks_rescatados': n, 'pks_sin_maestro': m}: rescatados son
+        los PKs fuera del formato km+m que sí se ubicaron en el maestro.
+        """
+        if not self.maestro(muro).pks:
+            return {}
+        pks_maestro, distancias = self.emparejar_pks(muro, lote.pk)
+        lote.asignar_maestro(pks_maestro, distancias)
+
+        estandar = np.array([_PATRON_CADENAMIENTO.match(pk) is not None for pk in lote.pk], dtype=bool)
+        ubicados = np.array([pk is not None for pk in pks_maestro], dtype=bool)
+        return {
+            'pks_rescatados': int((ubicados & ~estandar).sum()),
+            'pks_sin_maestro': int((~ubicados).sum()),
+        }
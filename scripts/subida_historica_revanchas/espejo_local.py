@@ -0,0 +1,461 @@
+"""
+Espejo Local (SQLite) de las Tablas de Revanchas
+================================================
+
+Mantiene una copia local de revanchas_archivos, revanchas_mediciones y
+pks_maestro en un archivo SQLite, sincronizada de forma incremental:
+
+    - revanchas_archivos / revanchas_mediciones: se traen las filas con id
+      mayor al último sincronizado (marca de agua) menos un solape, en
+      páginas ordenadas por id. Un id se reserva al insertar pero se ve al
+      confirmar: un lote largo puede confirmar ids menores que los de una
+      sync anterior, y el solape los vuelve a pedir.
+    - Lo que quede fuera del solape se reconcilia como los borrados: los
+      archivos comparando solo los ids (faltantes se traen, sobrantes se
+      eliminan) y las mediciones comparando, por archivo, las filas locales
+      con su total_registros (si no coinciden se vuelven a traer).
+    - Un archivo reemplazado en la BD (mismo muro y fecha, id nuevo)
+      reemplaza al local y sus mediciones antiguas se eliminan.
+    - pks_maestro (se edita en el lugar, pocas filas): se comparan id y
+      updated_at de todas las filas; se traen las nuevas o cambiadas y se
+      eliminan las borradas en la BD.
+    - Las mediciones incluyen pk_maestro y distancia_pk (columnas de
+      CORREGIR_VISTAS_REVANCHAS.sql, que debe estar aplicado en la BD).
+
+La verificación (`revanchas.py verify`), la revisión de duplicados del
+loader y los análisis ad-hoc leen el espejo a velocidad de disco local en
+vez de consultar Supabase cada vez.
+
+Uso:
+    python revanchas.py sync
+    python revanchas.py load sync      (cargar y luego actualizar el espejo)
+    sqlite3 espejo_revanchas.sqlite "SELECT muro, COUNT(*) FROM revanchas_archivos GROUP BY muro"
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cliente_postgrest import ClientePostgrest
+
+ARCHIVO_ESPEJO = os.getenv('REVANCHAS_ESPEJO', 'espejo_revanchas.sqlite')
+
+# Filas por página (el máximo por defecto de PostgREST en Supabase es 1000)
+LIMITE_PAGINA = 1000
+
+# Ids bajo la marca de agua que se vuelven a pedir en cada sync (ids
+# confirmados fuera de orden). Mediciones: varios archivos en vuelo a la vez.
+SOLAPE_IDS = {
+    'revanchas_archivos': 100,
+    'revanchas_mediciones': 20_000,
+}
+
+# Valores por filtro `in.(...)` (mantiene la URL corta)
+LIMITE_FILTRO_EN = 200
+
+COLUMNAS = {
+    'revanchas_archivos': (
+        'id', 'muro', 'fecha_medicion', 'archivo_nombre', 'archivo_tipo',
+        'total_registros', 'sectores_incluidos', 'usuario_id', 'created_at',
+    ),
+    'revanchas_mediciones': (
+        'id', 'archivo_id', 'sector', 'pk', 'coronamiento', 'revancha', 'lama',
+        'ancho', 'geomembrana', 'dist_geo_lama', 'dist_geo_coronamiento',
+        'pk_maestro', 'distancia_pk', 'created_at',
+    ),
+    'pks_maestro': (
+        'id', 'muro', 'pk', 'utm_x', 'utm_y', 'lon', 'lat', 'activo', 'updated_at',
+    ),
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS revanchas_archivos (
+    id INTEGER PRIMARY KEY,
+    muro TEXT NOT NULL,
+    fecha_medicion TEXT NOT NULL,
+    archivo_nombre TEXT,
+    archivo_tipo TEXT,
+    total_registros INTEGER,
+    sectores_incluidos TEXT,  -- JSON
+    usuario_id INTEGER,
+    created_at TEXT,
+    UNIQUE (muro, fecha_medicion)
+);
+
+CREATE TABLE IF NOT EXISTS revanchas_mediciones (
+    id INTEGER PRIMARY KEY,
+    archivo_id INTEGER NOT NULL,
+    sector TEXT,
+    pk TEXT,
+    coronamiento REAL,
+    revancha REAL,
+    lama REAL,
+    ancho REAL,
+    geomembrana REAL,
+    dist_geo_lama REAL,
+    dist_geo_coronamiento REAL,
+    pk_maestro TEXT,
+    distancia_pk REAL,
+    created_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_mediciones_archivo_pk ON revanchas_mediciones (archivo_id, pk);
+
+CREATE TABLE IF NOT EXISTS pks_maestro (
+    id INTEGER PRIMARY KEY,
+    muro TEXT NOT NULL,
+    pk TEXT NOT NULL,
+    utm_x REAL,
+    utm_y REAL,
+    lon REAL,
+    lat REAL,
+    activo INTEGER,
+    updated_at TEXT,
+    UNIQUE (muro, pk)
+);
+
+CREATE TABLE IF NOT EXISTS _sincronizacion (
+    tabla TEXT PRIMARY KEY,
+    marca TEXT,           -- último id o updated_at sincronizado
+    sincronizado TEXT     -- fecha/hora local de la última sincronización
+);
+"""
+
+# El UNIQUE (muro, fecha_medicion) de revanchas_archivos crea el índice
+# sqlite_autoindex que sirve a las búsquedas por muro y fecha.
+
+# Columnas agregadas después de crear el esquema (espejos existentes)
+COLUMNAS_NUEVAS = {
+    'revanchas_mediciones': {'pk_maestro': 'TEXT', 'distancia_pk': 'REAL'},
+}
+
+
+def columnas_presentes(conexion: sqlite3.Connection, tabla: str) -> set:
+    """Columnas que tiene la tabla en este archivo (un espejo antiguo puede no tenerlas todas)."""
+    return {f[1] for f in conexion.execute(f'PRAGMA table_info({tabla})')}
+
+
+def _migrar(conexion: sqlite3.Connection) -> None:
+    """
+    Agrega las columnas nuevas a un espejo existente. Las filas ya copiadas
+    no las tienen: se borra la marca de la tabla para que la próxima sync
+    la vuelva a traer completa (INSERT OR REPLACE por id).
+    """
+    for tabla, nuevas in COLUMNAS_NUEVAS.items():
+        faltantes = {c: tipo for c, tipo in nuevas.items() if c not in columnas_presentes(conexion, tabla)}
+        if not faltantes:
+            continue
+        with conexion:
+            for columna, tipo in faltantes.items():
+                conexion.execute(f'ALTER TABLE {tabla} ADD COLUMN {columna} {tipo}')
+            conexion.execute('DELETE FROM _sincronizacion WHERE tabla = ?', (tabla,))
+
+
+def abrir_espejo(ruta: str = ARCHIVO_ESPEJO) -> sqlite3.Connection:
+    """Abre (o crea) el espejo con su esquema."""
+    conexion = sqlite3.connect(ruta)
+    conexion.row_factory = sqlite3.Row
+    conexion.execute('PRAGMA journal_mode=WAL')
+    conexion.execute('PRAGMA synchronous=NORMAL')
+    conexion.executescript(ESQUEMA)
+    _migrar(conexion)
+    return conexion
+
+
+def _marca(espejo: sqlite3.Connection, tabla: str) -> Optional[str]:
+    fila = espejo.execute('SELECT marca FROM _sincronizacion WHERE tabla = ?', (tabla,)).fetchone()
+    return fila['marca'] if fila else None
+
+
+def _guardar_marca(espejo: sqlite3.Connection, tabla: str, marca) -> None:
+    espejo.execute(
+        'INSERT OR REPLACE INTO _sincronizacion (tabla, marca, sincronizado) VALUES (?, ?, ?)',
+        (tabla, None if marca is None else str(marca), datetime.now().isoformat(timespec='seconds')),
+    )
+
+
+# ============================================
+# LECTURA PAGINADA DESDE SUPABASE
+# ============================================
+
+def _pagina(conexion, tabla: str, columnas: str, orden: str, desde, inclusivo: bool,
+            desplazamiento: int = 0, en: Optional[Tuple[str, List]] = None) -> List[Dict]:
+    """
+    Una página de filas con `orden` > desde (o >= si inclusivo), ordenadas por
+    `orden`. `en` = (columna, valores) limita a las filas con esos valores.
+    """
+    operador = 'gte' if inclusivo else 'gt'
+    if isinstance(conexion, ClientePostgrest):
+        # Desempate por id para que las páginas sean estables
+        orden_params = 'id.asc' if orden == 'id' else f'{orden}.asc,id.asc'
+        params = {'select': columnas, 'order': orden_params,
+                  'limit': str(LIMITE_PAGINA), 'offset': str(desplazamiento)}
+        if desde is not None:
+            params[orden] = f'{operador}.{desde}'
+        if en is not None:
+            params[en[0]] = f"in.({','.join(str(v) for v in en[1])})"
+        return conexion.consultar(tabla, **params)
+
+    consulta = conexion.table(tabla).select(columnas)
+    if desde is not None:
+        consulta = getattr(consulta, operador)(orden, desde)
+    if en is not None:
+        consulta = consulta.in_(en[0], list(en[1]))
+    return consulta.order(orden).range(desplazamiento, desplazamiento + LIMITE_PAGINA - 1).execute().data
+
+
+def _filas_en(conexion, tabla: str, columnas: str, columna: str, valores) -> Iterator[List[Dict]]:
+    """Páginas de las filas con `columna` en `valores` (por tandas, ordenadas por id)."""
+    valores = sorted(valores)
+    # Por id cada tanda cabe en una página (el filtro `in` reemplaza al cursor)
+    por_id = columna == 'id'
+    tamano = min(LIMITE_FILTRO_EN, LIMITE_PAGINA) if por_id else LIMITE_FILTRO_EN
+    for i in range(0, len(valores), tamano):
+        tanda = (columna, valores[i:i + tamano])
+        ultimo = None
+        while True:
+            pagina = _pagina(conexion, tabla, columnas, 'id', ultimo, inclusivo=False, en=tanda)
+            if pagina:
+                yield pagina
+            if por_id or len(pagina) < LIMITE_PAGINA:
+                break
+            ultimo = pagina[-1]['id']
+
+
+def _ids_remotos(conexion, tabla: str) -> set:
+    """Todos los ids de una tabla (solo la columna id, paginado)."""
+    ids = set()
+    ultimo = None
+    while True:
+        pagina = _pagina(conexion, tabla, 'id', 'id', ultimo, inclusivo=False)
+        ids.update(f['id'] for f in pagina)
+        if len(pagina) < LIMITE_PAGINA:
+            return ids
+        ultimo = pagina[-1]['id']
+
+
+def _valores(tabla: str, fila: Dict) -> Tuple:
+    valores = []
+    for columna in COLUMNAS[tabla]:
+        valor = fila.get(columna)
+        if columna == 'sectores_incluidos' and valor is not None:
+            valor = json.dumps(valor, ensure_ascii=False)
+        valores.append(valor)
+    return tuple(valores)
+
+
+def _insertar(espejo: sqlite3.Connection, tabla: str, filas: List[Dict]) -> None:
+    columnas = COLUMNAS[tabla]
+    # OR REPLACE: un archivo nuevo con el mismo muro/fecha desplaza al anterior
+    espejo.executemany(
+        f"INSERT OR REPLACE INTO {tabla} ({', '.join(columnas)}) "
+        f"VALUES ({', '.join('?' for _ in columnas)})",
+        [_valores(tabla, f) for f in filas],
+    )
+
+
+# ============================================
+# SINCRONIZACIÓN
+# ============================================
+
+def _sincronizar_por_id(conexion, espejo: sqlite3.Connection, tabla: str) -> int:
+    """
+    Trae las filas con id mayor a la marca de agua menos SOLAPE_IDS, página
+    por página (INSERT OR REPLACE: las ya copiadas solo se reescriben).
+    """
+    columnas = ','.join(COLUMNAS[tabla])
+    marca = _marca(espejo, tabla)
+    marca = int(marca) if marca else None
+    ultimo = max(marca - SOLAPE_IDS[tabla], 0) if marca else None
+    total = 0
+    while True:
+        pagina = _pagina(conexion, tabla, columnas, 'id', ultimo, inclusivo=False)
+        if pagina:
+            ultimo = pagina[-1]['id']
+            marca = max(marca or 0, ultimo)
+            with espejo:
+                _insertar(espejo, tabla, pagina)
+                # Marca por página: si se corta, la próxima sync sigue desde aquí
+                _guardar_marca(espejo, tabla, marca)
+            total += len(pagina)
+        if len(pagina) < LIMITE_PAGINA:
+            break
+
+    # Se registra la hora de sincronización aunque no haya filas nuevas
+    with espejo:
+        _guardar_marca(espejo, tabla, marca)
+    return total
+
+
+def _reconciliar_archivos(conexion, espejo: sqlite3.Connection) -> Tuple[int, int]:
+    """
+    Compara solo los ids con la BD: trae los archivos que faltan (confirmados
+    bajo la marca fuera del solape) y elimina los borrados sin reemplazo.
+    Retorna (traídos, eliminados).
+    """
+    tabla = 'revanchas_archivos'
+    remotos = _ids_remotos(conexion, tabla)
+    locales = {f['id'] for f in espejo.execute(f'SELECT id FROM {tabla}')}
+    borrados = locales - remotos
+    with espejo:
+        espejo.executemany(f'DELETE FROM {tabla} WHERE id = ?', [(i,) for i in borrados])
+
+    traidos = 0
+    for pagina in _filas_en(conexion, tabla, ','.join(COLUMNAS[tabla]), 'id', remotos - locales):
+        with espejo:
+            _insertar(espejo, tabla, pagina)
+        traidos += len(pagina)
+    return traidos, len(borrados)
+
+
+def _reconciliar_mediciones(conexion, espejo: sqlite3.Connection) -> int:
+    """
+    Archivos cuyas mediciones locales no suman su total_registros (filas
+    confirmadas fuera del solape, o una sync cortada): se borran sus
+    mediciones locales y se vuelven a traer. Retorna las filas traídas.
+    """
+    tabla = 'revanchas_mediciones'
+    incompletos = [f['id'] for f in espejo.execute(
+        'SELECT a.id FROM revanchas_archivos a '
+        'LEFT JOIN (SELECT archivo_id, COUNT(*) AS n FROM revanchas_mediciones GROUP BY archivo_id) m '
+        'ON m.archivo_id = a.id '
+        'WHERE COALESCE(m.n, 0) != COALESCE(a.total_registros, 0)')]
+    if not incompletos:
+        return 0
+
+    with espejo:
+        espejo.executemany(f'DELETE FROM {tabla} WHERE archivo_id = ?', [(i,) for i in incompletos])
+    traidas = 0
+    for pagina in _filas_en(conexion, tabla, ','.join(COLUMNAS[tabla]), 'archivo_id', incompletos):
+        with espejo:
+            _insertar(espejo, tabla, pagina)
+        traidas += len(pagina)
+    return traidas
+
+
+def _sincronizar_pks(conexion, espejo: sqlite3.Connection) -> Tuple[int, int]:
+    """
+    pks_maestro se edita en el lugar y tiene pocas filas: se leen id y
+    updated_at de todas (sin depender del orden en que se confirman) y se
+    traen las nuevas o cambiadas y se eliminan las borradas en la BD.
+    Retorna (traídas, eliminadas).
+    """
+    tabla = 'pks_maestro'
+    remotos: Dict[int, Optional[str]] = {}
+    ultimo = None
+    while True:
+        pagina = _pagina(conexion, tabla, 'id,updated_at', 'id', ultimo, inclusivo=False)
+        remotos.update((f['id'], f['updated_at']) for f in pagina)
+        if len(pagina) < LIMITE_PAGINA:
+            break
+        ultimo = pagina[-1]['id']
+
+    locales = {f['id']: f['updated_at'] for f in espejo.execute(f'SELECT id, updated_at FROM {tabla}')}
+    borrados = locales.keys() - remotos.keys()
+    cambiados = {i for i, actualizado in remotos.items() if i not in locales or locales[i] != actualizado}
+    with espejo:
+        espejo.executemany(f'DELETE FROM {tabla} WHERE id = ?', [(i,) for i in borrados])
+
+    total = 0
+    for pagina in _filas_en(conexion, tabla, ','.join(COLUMNAS[tabla]), 'id', cambiados):
+        with espejo:
+            # Un PK borrado y vuelto a crear trae id nuevo con el mismo (muro, pk)
+            _insertar(espejo, tabla, pagina)
+        total += len(pagina)
+
+    with espejo:
+        _guardar_marca(espejo, tabla, max(filter(None, remotos.values()), default=None))
+    return total, len(borrados)
+
+
+def sincronizar(conexion, ruta: str = ARCHIVO_ESPEJO) -> Dict[str, int]:
+    """
+    Actualiza el espejo local. Retorna las filas traídas por tabla y las
+    eliminadas localmente por haber desaparecido de la BD.
+    """
+    espejo = abrir_espejo(ruta)
+    try:
+        resultado = {'revanchas_archivos': _sincronizar_por_id(conexion, espejo, 'revanchas_archivos')}
+
+        # Archivos fuera del solape o borrados en la BD: solo se comparan los ids
+        traidos, archivos_borrados = _reconciliar_archivos(conexion, espejo)
+        resultado['revanchas_archivos'] += traidos
+
+        resultado['revanchas_mediciones'] = _sincronizar_por_id(conexion, espejo, 'revanchas_mediciones')
+
+        # Mediciones de archivos reemplazados o borrados (CASCADE en la BD). Las
+        # de archivos más nuevos que la marca aún no sincronizados se conservan.
+        marca_archivos = int(_marca(espejo, 'revanchas_archivos') or 0)
+        with espejo:
+            huerfanas = espejo.execute(
+                'DELETE FROM revanchas_mediciones WHERE archivo_id <= ? '
+                'AND archivo_id NOT IN (SELECT id FROM revanchas_archivos)', (marca_archivos,)
+            ).rowcount
+        resultado['revanchas_mediciones'] += _reconciliar_mediciones(conexion, espejo)
+
+        resultado['pks_maestro'], pks_borrados = _sincronizar_pks(conexion, espejo)
+        resultado['archivos_eliminados'] = archivos_borrados
+        resultado['mediciones_eliminadas'] = huerfanas
+        resultado['pks_maestro_eliminados'] = pks_borrados
+        return resultado
+    finally:
+        espejo.close()
+
+
+# ============================================
+# CONSULTAS SOBRE EL ESPEJO
+# ============================================
+
+class EspejoLocal:
+    """Consultas de solo lectura sobre el espejo."""
+
+    def __init__(self, ruta: str = ARCHIVO_ESPEJO):
+        if not Path(ruta).exists():
+            raise FileNotFoundError(f"No existe el espejo local {ruta} (ejecutar: python revanchas.py sync)")
+        self.ruta = ruta
+        self.conexion = sqlite3.connect(f"file:{Path(ruta).resolve().as_posix()}?mode=ro", uri=True)
+        self.conexion.row_factory = sqlite3.Row
+        self.columnas_mediciones = columnas_presentes(self.conexion, 'revanchas_mediciones')
+
+    def ultima_sincronizacion(self) -> Optional[str]:
+        fila = self.conexion.execute('SELECT MIN(sincronizado) AS s FROM _sincronizacion').fetchone()
+        return fila['s'] if fila else None
+
+    def archivo_existente(self, muro: str, fecha: str) -> Optional[Dict]:
+        """Archivo ya cargado para ese muro y fecha (mismo criterio que el UNIQUE de la BD)."""
+        fila = self.conexion.execute(
+            'SELECT * FROM revanchas_archivos WHERE muro = ? AND fecha_medicion = ?', (muro, fecha)
+        ).fetchone()
+        return dict(fila) if fila else None
+
+    def archivos(self, muro: str) -> List[Dict]:
+        return [dict(f) for f in self.conexion.execute(
+            'SELECT * FROM revanchas_archivos WHERE muro = ? ORDER BY fecha_medicion', (muro,))]
+
+    def mediciones(self, archivo_id: int) -> List[Dict]:
+        return [dict(f) for f in self.conexion.execute(
+            'SELECT * FROM revanchas_mediciones WHERE archivo_id = ? ORDER BY pk', (archivo_id,))]
+
+    def historia(self, muro: str) -> Iterator[Dict]:
+        """
+        Todas las mediciones del muro con la fecha y el nombre de su archivo
+        (de a una, sin listas). pk_maestro y distancia_pk solo si el espejo
+        ya las tiene (sincronizado después de agregarlas).
+        """
+        columnas = ', '.join(f'm.{c}' for c in COLUMNAS['revanchas_mediciones']
+                             if c not in ('id', 'archivo_id', 'created_at') and c in self.columnas_mediciones)
+        cursor = self.conexion.execute(
+            f'SELECT a.muro, a.fecha_medicion, a.archivo_nombre, {columnas} '
+            'FROM revanchas_mediciones m JOIN revanchas_archivos a ON a.id = m.archivo_id '
+            'WHERE a.muro = ? ORDER BY a.fecha_medicion, m.id', (muro,))
+        return (dict(fila) for fila in cursor)
+
+    def ejemplos_pk(self, limite: int = 5) -> List[str]:
+        return [f['pk'] for f in self.conexion.execute(
+            'SELECT pk FROM revanchas_mediciones LIMIT ?', (limite,))]
+
+    def cerrar(self) -> None:
+        self.conexion.close()
@@ -0,0 +1,305 @@
+"""
+Exportación de la Historia de un Muro a Excel
+=============================================
+
+Genera un libro por muro con la historia de una métrica (revancha, ancho o
+dist_geo_lama) en un período: una hoja por sector, los PKs como filas y
+las fechas de medición como columnas, con el mismo formato condicional de
+colores que la vista SQL (umbrales.py).
+
+La memoria no crece con el largo de la historia:
+
+    - Las filas se leen de SQLite ordenadas por (sector, PK, fecha) con un
+      cursor, y cada PK se escribe apenas se completa su fila.
+    - openpyxl en modo write_only va escribiendo las hojas a disco.
+    - Fuentes: el espejo local se lee directo; la BD y las planillas de la
+      carpeta base se copian primero (archivo por archivo) a un SQLite
+      temporal con el mismo esquema del espejo.
+
+En memoria queda solo la lista de fechas del muro y la fila del PK actual.
+
+Uso:
+    python revanchas.py export --muros Este --desde 2023-01-01 --hasta 2023-12-31
+    python revanchas.py export --metrica ancho --fuente bd
+"""
+
+import os
+import sqlite3
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from emparejar_pks import cadenamiento
+from umbrales import UMBRALES
+
+METRICAS = tuple(UMBRALES)
+
+# Rellenos de las reglas de color (paleta estándar de Excel)
+RELLENOS = {
+    'verde': 'C6EFCE',
+    'amarillo': 'FFEB9C',
+    'rojo': 'FFC7CE',
+}
+
+FECHA_MINIMA = '0001-01-01'
+FECHA_MAXIMA = '9999-12-31'
+
+_CARACTERES_INVALIDOS_HOJA = set('[]:*?/\\')
+
+
+def _nombre_hoja(sector: str, usados: set) -> str:
+    """Nombre válido para Excel (31 caracteres, sin []:*?/\\) y sin repetir."""
+    base = ''.join('_' if c in _CARACTERES_INVALIDOS_HOJA else c for c in (sector or 'Sin sector'))[:31]
+    nombre = base
+    n = 2
+    while nombre.lower() in usados:
+        sufijo = f' ({n})'
+        nombre = base[:31 - len(sufijo)] + sufijo
+        n += 1
+    usados.add(nombre.lower())
+    return nombre
+
+
+def _letra_columna(indice: int) -> str:
+    """1 -> A, 27 -> AA."""
+    letras = ''
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+# ============================================
+# FUENTES (todas terminan en un SQLite con el esquema del espejo)
+# ============================================
+
+def copiar_desde_bd(conexion, destino: sqlite3.Connection, muro: str,
+                    desde: str, hasta: str) -> int:
+    """Copia los archivos del período y sus mediciones (de a un archivo). Retorna archivos."""
+    from cliente_postgrest import ClientePostgrest
+    from espejo_local import COLUMNAS, LIMITE_PAGINA, _insertar
+
+    columnas_archivos = ','.join(COLUMNAS['revanchas_archivos'])
+    columnas_mediciones = ','.join(COLUMNAS['revanchas_mediciones'])
+    if isinstance(conexion, ClientePostgrest):
+        archivos = conexion.consultar(
+            'revanchas_archivos', select=columnas_archivos, muro=f'eq.{muro}',
+            **{'and': f'(fecha_medicion.gte.{desde},fecha_medicion.lte.{hasta})'})
+    else:
+        archivos = conexion.table('revanchas_archivos').select(columnas_archivos).eq('muro', muro)\
+            .gte('fecha_medicion', desde).lte('fecha_medicion', hasta).execute().data
+
+    for archivo in archivos:
+        _insertar(destino, 'revanchas_archivos', [archivo])
+        desplazamiento = 0
+        while True:
+            if isinstance(conexion, ClientePostgrest):
+                pagina = conexion.consultar(
+                    'revanchas_mediciones', select=columnas_mediciones,
+                    archivo_id=f"eq.{archivo['id']}", order='id.asc',
+                    limit=str(LIMITE_PAGINA), offset=str(desplazamiento))
+            else:
+                pagina = conexion.table('revanchas_mediciones').select(columnas_mediciones)\
+                    .eq('archivo_id', archivo['id']).order('id')\
+                    .range(desplazamiento, desplazamiento + LIMITE_PAGINA - 1).execute().data
+            _insertar(destino, 'revanchas_mediciones', pagina)
+            if len(pagina) < LIMITE_PAGINA:
+                break
+            desplazamiento += LIMITE_PAGINA
+        destino.commit()
+    return len(archivos)
+
+
+def copiar_desde_archivos(carpeta_base: str, destino: sqlite3.Connection, muro: str,
+                          desde: str, hasta: str) -> int:
+    """
+    Parsea las planillas del muro y copia las del período. No usa el cache
+    de parseo (que guarda todo en memoria): cada lote se descarta al copiarlo.
+    Igual que en la BD, un archivo con la misma fecha reemplaza al anterior.
+    """
+    from carga_masiva import procesar_archivo
+    from catalogo import listar_archivos
+
+    copiados = 0
+    for entrada in listar_archivos(carpeta_base, [muro]):
+        try:
+            datos = procesar_archivo(entrada.abrir(), muro)
+        except Exception as e:
+            print(f"⚠️  {entrada.nombre}: {e}")
+            continue
+        if not desde <= datos['fecha'] <= hasta:
+            continue
+
+        destino.execute('DELETE FROM revanchas_mediciones WHERE archivo_id IN '
+                        '(SELECT id FROM revanchas_archivos WHERE muro = ? AND fecha_medicion = ?)',
+                        (muro, datos['fecha']))
+        cursor = destino.execute(
+            'INSERT OR REPLACE INTO revanchas_archivos (muro, fecha_medicion, archivo_nombre, total_registros) '
+            'VALUES (?, ?, ?, ?)', (muro, datos['fecha'], entrada.nombre, datos['total_registros']))
+        archivo_id = cursor.lastrowid
+        lote = datos['mediciones']
+        columnas = ['sector', 'pk'] + list(lote.columnas)
+        destino.executemany(
+            f"INSERT INTO revanchas_mediciones (archivo_id, {', '.join(columnas)}) "
+            f"VALUES ({', '.join('?' for _ in range(len(columnas) + 1))})",
+            ((archivo_id, *(fila[c] for c in columnas)) for fila in lote.filas()))
+        destino.commit()
+        copiados += 1
+    return copiados
+
+
+def fechas_muro(fuente: sqlite3.Connection, muro: str, desde: str, hasta: str) -> List[str]:
+    return [f[0] for f in fuente.execute(
+        'SELECT fecha_medicion FROM revanchas_archivos '
+        'WHERE muro = ? AND fecha_medicion BETWEEN ? AND ? ORDER BY fecha_medicion',
+        (muro, desde, hasta))]
+
+
+def filas_pivote(fuente: sqlite3.Connection, muro: str, metrica: str,
+                 desde: str, hasta: str) -> Iterator[Tuple[str, str, str, Optional[float]]]:
+    """
+    (sector, pk, fecha, valor) ordenado por sector, cadenamiento del PK y fecha
+    (cursor). Las filas con pk_maestro van a la fila de ese PK del maestro:
+    "0+060" y "0.0599..." de dos planillas quedan en la misma fila.
+    """
+    from espejo_local import columnas_presentes
+
+    pk = 'COALESCE(m.pk_maestro, m.pk)' if 'pk_maestro' in columnas_presentes(fuente, 'revanchas_mediciones') \
+        else 'm.pk'
+    # Orden por cadenamiento: "0+100" antes que "1+000" y que "0+1000"
+    fuente.create_function('cadenamiento', 1, _cadenamiento_sql, deterministic=True)
+    return fuente.execute(
+        f'SELECT m.sector, {pk} AS pk, a.fecha_medicion, m.{metrica} '
+        'FROM revanchas_mediciones m JOIN revanchas_archivos a ON a.id = m.archivo_id '
+        'WHERE a.muro = ? AND a.fecha_medicion BETWEEN ? AND ? '
+        f'ORDER BY m.sector, cadenamiento({pk}), {pk}, a.fecha_medicion',
+        (muro, desde, hasta))
+
+
+def _cadenamiento_sql(pk: str) -> Optional[float]:
+    metros, _ = cadenamiento(pk)
+    return None if metros != metros else metros
+
+
+# ============================================
+# LIBRO (openpyxl write_only)
+# ============================================
+
+def _reglas_color(metrica: str, celda: str) -> List:
+    """Tres reglas de fórmula (verde/amarillo/rojo) que ignoran celdas vacías."""
+    from openpyxl.formatting.rule import FormulaRule
+    from openpyxl.styles import PatternFill
+
+    verde, amarillo = UMBRALES[metrica]
+    condiciones = {
+        'verde': f'{celda}>={verde}',
+        'amarillo': f'{celda}>={amarillo},{celda}<{verde}',
+        'rojo': f'{celda}<{amarillo}',
+    }
+    return [
+        FormulaRule(formula=[f'AND(ISNUMBER({celda}),{condicion})'], stopIfTrue=True,
+                    fill=PatternFill(start_color=RELLENOS[color], end_color=RELLENOS[color],
+                                     fill_type='solid'))
+        for color, condicion in condiciones.items()
+    ]
+
+
+def escribir_libro(fuente: sqlite3.Connection, muro: str, metrica: str,
+                   ruta: str, desde: str = FECHA_MINIMA, hasta: str = FECHA_MAXIMA) -> Dict:
+    """Escribe el libro del muro. Retorna {'ruta', 'hojas', 'pks', 'fechas'}."""
+    from openpyxl import Workbook
+
+    fechas = fechas_muro(fuente, muro, desde, hasta)
+    columna_de = {fecha: i for i, fecha in enumerate(fechas, 1)}
+    ultima_columna = _letra_columna(len(fechas) + 1)
+
+    libro = Workbook(write_only=True)
+    nombres_usados: set = set()
+    resumen = {'ruta': ruta, 'hojas': 0, 'pks': 0, 'fechas': len(fechas)}
+
+    hoja = None
+    filas_hoja = 0
+    clave_actual = None
+    fila: List = []
+
+    def cerrar_fila():
+        nonlocal filas_hoja
+        if clave_actual is not None:
+            hoja.append(fila)
+            filas_hoja += 1
+            resumen['pks'] += 1
+
+    def cerrar_hoja():
+        if hoja is not None and filas_hoja:
+            rango = f'B2:{ultima_columna}{filas_hoja + 1}'
+            for regla in _reglas_color(metrica, 'B2'):
+                hoja.conditional_formatting.add(rango, regla)
+
+    for sector, pk, fecha, valor in filas_pivote(fuente, muro, metrica, desde, hasta):
+        if clave_actual is None or sector != clave_actual[0]:
+            cerrar_fila()
+            cerrar_hoja()
+            clave_actual = None
+            hoja = libro.create_sheet(_nombre_hoja(sector, nombres_usados))
+            # Anchos y paneles antes de escribir filas (requisito de write_only)
+            hoja.column_dimensions['A'].width = 14
+            hoja.freeze_panes = 'B2'
+            hoja.append([f'PK ({metrica})'] + fechas)
+            filas_hoja = 0
+            resumen['hojas'] += 1
+        if (sector, pk) != clave_actual:
+            cerrar_fila()
+            clave_actual = (sector, pk)
+            fila = [pk] + [None] * len(fechas)
+        fila[columna_de[fecha]] = valor
+    cerrar_fila()
+    cerrar_hoja()
+
+    if not resumen['hojas']:
+        libro.create_sheet('Sin datos').append([f'Sin mediciones de {muro} entre {desde} y {hasta}'])
+    libro.save(ruta)
+    return resumen
+
+
+def exportar(muros: List[str], metrica: str, carpeta_salida: str,
+             desde: Optional[str] = None, hasta: Optional[str] = None,
+             espejo: Optional[str] = None, conexion=None, carpeta_base: Optional[str] = None) -> List[Dict]:
+    """
+    Un libro por muro en `carpeta_salida`. Fuente: `espejo` (ruta del SQLite
+    local), si no `conexion` (Supabase), si no las planillas de `carpeta_base`.
+    """
+    if metrica not in METRICAS:
+        raise ValueError(f"Métrica desconocida: {metrica} (opciones: {', '.join(METRICAS)})")
+    desde = desde or FECHA_MINIMA
+    hasta = hasta or FECHA_MAXIMA
+    Path(carpeta_salida).mkdir(parents=True, exist_ok=True)
+
+    temporal = None
+    if espejo:
+        fuente = sqlite3.connect(f"file:{Path(espejo).resolve().as_posix()}?mode=ro", uri=True)
+    else:
+        from espejo_local import abrir_espejo
+        descriptor, temporal = tempfile.mkstemp(suffix='.sqlite', prefix='exportar_')
+        os.close(descriptor)
+        fuente = abrir_espejo(temporal)
+
+    resultados = []
+    try:
+        for muro in muros:
+            if temporal:
+                if conexion is not None:
+                    copiados = copiar_desde_bd(conexion, fuente, muro, desde, hasta)
+                else:
+                    copiados = copiar_desde_archivos(carpeta_base, fuente, muro, desde, hasta)
+                print(f"   {muro}: {copiados} archivos copiados")
+
+            periodo = f"{desde if desde != FECHA_MINIMA else 'inicio'}_{hasta if hasta != FECHA_MAXIMA else 'hoy'}"
+            ruta = str(Path(carpeta_salida) / f"revanchas_{muro}_{metrica}_{periodo}.xlsx")
+            resultados.append({'muro': muro, **escribir_libro(fuente, muro, metrica, ruta, desde, hasta)})
+    finally:
+        fuente.close()
+        if temporal:
+            for sufijo in ('', '-wal', '-shm'):
+                if os.path.exists(temporal + sufijo):
+                    os.remove(temporal + sufijo)
+    return resultados
@@ -0,0 +1,444 @@
+"""
+GeoPackage Offline de la Historia Georreferenciada
+==================================================
+
+Genera public/revanchas_historia.gpkg (junto a mapbase.mbtiles) con todas
+las mediciones georreferenciadas, con las columnas de
+vista_revanchas_georreferenciadas, para usarlo sin conexión en terreno
+(QGIS, o consultas SQLite locales desde este script).
+
+    - Formato GeoPackage 1.3 escrito con sqlite3 (sin GDAL ni SpatiaLite):
+      geometrías POINT en WGS84 (EPSG:4326).
+    - Índice espacial R-tree (rtree_revanchas_georreferenciadas_geom, la
+      extensión gpkg_rtree_index) e índice (muro, pk, fecha_medicion): una
+      consulta por rectángulo y rango de fechas de un sector lee solo las
+      hojas del R-tree que tocan el rectángulo.
+    - Actualización incremental: se guarda qué archivos ya están incluidos;
+      cada corrida agrega los archivos nuevos y quita los borrados o
+      reemplazados en la fuente. Si cambió pks_maestro (coordenadas) o la
+      fuente, se reconstruye completo.
+    - Fuente: la BD (vista_revanchas_georreferenciadas, tras cada carga) o
+      el espejo local (mismo JOIN hecho en Python, con emparejar_pks.py).
+      El archivo guarda con cuál se construyó; la CLI sigue usando esa.
+
+Uso:
+    python revanchas.py geopackage                 (la fuente del archivo; si no, espejo o BD)
+    consultar(ruta, (-70.75, -33.13, -70.74, -33.12), '2023-01-01', '2023-12-31', sector='S3')
+"""
+
+import os
+import sqlite3
+import struct
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cliente_postgrest import ClientePostgrest
+from umbrales import colores
+
+VISTA = 'vista_revanchas_georreferenciadas'
+TABLA = 'revanchas_georreferenciadas'
+RTREE = f'rtree_{TABLA}_geom'
+SRS_WGS84 = 4326
+
+ARCHIVO_GEOPACKAGE = os.getenv(
+    'REVANCHAS_GEOPACKAGE',
+    str(Path(__file__).resolve().parents[2] / 'public' / 'revanchas_historia.gpkg'),
+)
+
+# Filas por página (el máximo por defecto de PostgREST en Supabase es 1000)
+LIMITE_PAGINA = 1000
+
+MEDICIONES = ('coronamiento', 'revancha', 'lama', 'ancho', 'geomembrana',
+              'dist_geo_lama', 'dist_geo_coronamiento')
+
+# Columnas de la vista (tiene_coordenadas se omite: aquí siempre es verdadero)
+COLUMNAS = (
+    'medicion_id', 'archivo_id', 'archivo_muro', 'sector', 'pk', 'pk_maestro', 'distancia_pk',
+    'fecha_medicion', *MEDICIONES, 'lat', 'lon', 'utm_x', 'utm_y',
+    'color_revancha', 'color_ancho', 'color_dist_geo', 'archivo_nombre', 'created_at', 'usuario_id',
+)
+
+_TIPOS = {
+    'medicion_id': 'INTEGER', 'archivo_id': 'INTEGER', 'usuario_id': 'INTEGER',
+    'distancia_pk': 'REAL', 'lat': 'REAL', 'lon': 'REAL', 'utm_x': 'REAL', 'utm_y': 'REAL',
+    'fecha_medicion': 'DATE', 'created_at': 'DATETIME',
+    **{c: 'REAL' for c in MEDICIONES},
+}
+
+# 'GPKG' como entero (PRAGMA application_id) y versión 1.3.0
+APPLICATION_ID = 0x47504B47
+USER_VERSION = 10300
+
+WKT_WGS84 = (
+    'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,'
+    'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,'
+    'AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+    'AUTHORITY["EPSG","4326"]]'
+)
+
+ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys (
+    srs_name TEXT NOT NULL,
+    srs_id INTEGER PRIMARY KEY,
+    organization TEXT NOT NULL,
+    organization_coordsys_id INTEGER NOT NULL,
+    definition TEXT NOT NULL,
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS gpkg_contents (
+    table_name TEXT NOT NULL PRIMARY KEY,
+    data_type TEXT NOT NULL,
+    identifier TEXT UNIQUE,
+    description TEXT DEFAULT '',
+    last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE,
+    srs_id INTEGER REFERENCES gpkg_spatial_ref_sys (srs_id)
+);
+
+CREATE TABLE IF NOT EXISTS gpkg_geometry_columns (
+    table_name TEXT NOT NULL,
+    column_name TEXT NOT NULL,
+    geometry_type_name TEXT NOT NULL,
+    srs_id INTEGER NOT NULL,
+    z TINYINT NOT NULL,
+    m TINYINT NOT NULL,
+    PRIMARY KEY (table_name, column_name)
+);
+
+CREATE TABLE IF NOT EXISTS gpkg_extensions (
+    table_name TEXT,
+    column_name TEXT,
+    extension_name TEXT NOT NULL,
+    definition TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    UNIQUE (table_name, column_name, extension_name)
+);
+
+CREATE TABLE IF NOT EXISTS {TABLA} (
+    fid INTEGER PRIMARY KEY,  -- = medicion_id
+    geom POINT,
+    {', '.join(f'{c} {_TIPOS.get(c, "TEXT")}' for c in COLUMNAS)}
+);
+
+CREATE INDEX IF NOT EXISTS idx_{TABLA}_muro_pk_fecha ON {TABLA} (archivo_muro, pk, fecha_medicion);
+CREATE INDEX IF NOT EXISTS idx_{TABLA}_archivo ON {TABLA} (archivo_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE} USING rtree (id, minx, maxx, miny, maxy);
+
+-- Las funciones ST_* de los triggers estándar requieren SpatiaLite/GDAL:
+-- para un punto el rectángulo es (lon, lon, lat, lat), que sí está en la fila
+CREATE TRIGGER IF NOT EXISTS {RTREE}_insert AFTER INSERT ON {TABLA}
+WHEN NEW.lon IS NOT NULL AND NEW.lat IS NOT NULL
+BEGIN
+    INSERT OR REPLACE INTO {RTREE} VALUES (NEW.fid, NEW.lon, NEW.lon, NEW.lat, NEW.lat);
+END;
+
+CREATE TRIGGER IF NOT EXISTS {RTREE}_delete AFTER DELETE ON {TABLA}
+BEGIN
+    DELETE FROM {RTREE} WHERE id = OLD.fid;
+END;
+
+-- Estado de la actualización incremental
+CREATE TABLE IF NOT EXISTS _archivos_incluidos (
+    archivo_id INTEGER PRIMARY KEY,
+    muro TEXT,
+    fecha_medicion TEXT,
+    filas INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS _metadatos (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+
+def geometria_punto(lon: float, lat: float) -> bytes:
+    """GeoPackageBinary: cabecera 'GP' (little endian, sin envolvente) + WKB Point."""
+    return struct.pack('<2sBBi', b'GP', 0, 1, SRS_WGS84) + struct.pack('<BIdd', 1, 1, lon, lat)
+
+
+def abrir_geopackage(ruta: str = ARCHIVO_GEOPACKAGE) -> sqlite3.Connection:
+    """Abre (o crea) el GeoPackage con las tablas de metadatos y la capa."""
+    Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+    conexion = sqlite3.connect(ruta)
+    conexion.row_factory = sqlite3.Row
+    # Sin WAL: el archivo se copia a los notebooks de terreno como un solo archivo
+    conexion.execute('PRAGMA journal_mode=DELETE')
+    conexion.execute(f'PRAGMA application_id={APPLICATION_ID}')
+    conexion.execute(f'PRAGMA user_version={USER_VERSION}')
+    conexion.executescript(ESQUEMA)
+    with conexion:
+        conexion.executemany(
+            'INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)', [
+                ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', None),
+                ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', None),
+                ('WGS 84 geodetic', SRS_WGS84, 'EPSG', SRS_WGS84, WKT_WGS84, None),
+            ])
+        conexion.execute(
+            "INSERT OR IGNORE INTO gpkg_contents (table_name, data_type, identifier, description, srs_id) "
+            "VALUES (?, 'features', ?, 'Historia de revanchas georreferenciadas', ?)",
+            (TABLA, TABLA, SRS_WGS84))
+        conexion.execute(
+            "INSERT OR IGNORE INTO gpkg_geometry_columns VALUES (?, 'geom', 'POINT', ?, 0, 0)",
+            (TABLA, SRS_WGS84))
+        conexion.execute(
+            "INSERT OR IGNORE INTO gpkg_extensions VALUES (?, 'geom', 'gpkg_rtree_index', "
+            "'http://www.geopackage.org/spec120/#extension_rtree', 'write-only')", (TABLA,))
+    return conexion
+
+
+def _metadato(gpkg: sqlite3.Connection, clave: str) -> Optional[str]:
+    fila = gpkg.execute('SELECT valor FROM _metadatos WHERE clave = ?', (clave,)).fetchone()
+    return fila['valor'] if fila else None
+
+
+def fuente_geopackage(ruta: str = ARCHIVO_GEOPACKAGE) -> Optional[str]:
+    """Fuente ('bd' o 'espejo') con la que se construyó el GeoPackage, si existe."""
+    if not Path(ruta).exists():
+        return None
+    conexion = sqlite3.connect(f"file:{Path(ruta).resolve().as_posix()}?mode=ro", uri=True)
+    conexion.row_factory = sqlite3.Row
+    try:
+        return _metadato(conexion, 'fuente')
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conexion.close()
+
+
+# ============================================
+# FUENTES
+# ============================================
+
+class FuenteBD:
+    """Filas de vista_revanchas_georreferenciadas (Supabase o ClientePostgrest)."""
+
+    nombre = 'bd'
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+
+    def archivos(self) -> Dict[int, Tuple[str, str]]:
+        """{id: (muro, fecha_medicion)} de todos los archivos, paginado por id."""
+        from espejo_local import _pagina
+
+        archivos = {}
+        ultimo = None
+        while True:
+            pagina = _pagina(self.conexion, 'revanchas_archivos', 'id,muro,fecha_medicion', 'id',
+                             ultimo, inclusivo=False)
+            archivos.update((f['id'], (f['muro'], f['fecha_medicion'])) for f in pagina)
+            if len(pagina) < LIMITE_PAGINA:
+                return archivos
+            ultimo = pagina[-1]['id']
+
+    def version_maestro(self) -> Optional[str]:
+        """Último updated_at de pks_maestro (si cambia, las coordenadas pueden haber cambiado)."""
+        if isinstance(self.conexion, ClientePostgrest):
+            filas = self.conexion.consultar('pks_maestro', select='updated_at',
+                                            order='updated_at.desc.nullslast', limit='1')
+        else:
+            filas = self.conexion.table('pks_maestro').select('updated_at')\
+                .order('updated_at', desc=True).limit(1).execute().data
+        return filas[0]['updated_at'] if filas else None
+
+    def filas(self, archivo_id: int, muro: str) -> Iterator[Dict]:
+        columnas = ','.join(COLUMNAS)
+        desplazamiento = 0
+        while True:
+            if isinstance(self.conexion, ClientePostgrest):
+                pagina = self.conexion.consultar(
+                    VISTA, select=columnas, archivo_id=f'eq.{archivo_id}',
+                    tiene_coordenadas='eq.true', order='medicion_id.asc',
+                    limit=str(LIMITE_PAGINA), offset=str(desplazamiento))
+            else:
+                pagina = self.conexion.table(VISTA).select(columnas)\
+                    .eq('archivo_id', archivo_id).eq('tiene_coordenadas', True).order('medicion_id')\
+                    .range(desplazamiento, desplazamiento + LIMITE_PAGINA - 1).execute().data
+            yield from pagina
+            if len(pagina) < LIMITE_PAGINA:
+                return
+            desplazamiento += LIMITE_PAGINA
+
+
+class FuenteEspejo:
+    """
+    El mismo JOIN de la vista sobre el espejo local: cada medición usa el
+    pk_maestro que guardó el loader y, si no lo tiene (filas antiguas o
+    espejo sin esa columna), se empareja con el maestro por cadenamiento.
+    """
+
+    nombre = 'espejo'
+
+    def __init__(self, ruta: str):
+        from emparejar_pks import IndicePKs
+        from espejo_local import EspejoLocal
+
+        self.espejo = EspejoLocal(ruta)
+        self.indice_pks = IndicePKs(espejo=self.espejo)
+
+    def archivos(self) -> Dict[int, Tuple[str, str]]:
+        return {f['id']: (f['muro'], f['fecha_medicion']) for f in self.espejo.conexion.execute(
+            'SELECT id, muro, fecha_medicion FROM revanchas_archivos')}
+
+    def version_maestro(self) -> Optional[str]:
+        return self.espejo.conexion.execute('SELECT MAX(updated_at) FROM pks_maestro').fetchone()[0]
+
+    def filas(self, archivo_id: int, muro: str) -> Iterator[Dict]:
+        conexion = self.espejo.conexion
+        archivo = conexion.execute('SELECT * FROM revanchas_archivos WHERE id = ?', (archivo_id,)).fetchone()
+        mediciones = self.espejo.mediciones(archivo_id)
+        if not mediciones:
+            return
+        coordenadas = {f['pk']: f for f in conexion.execute(
+            'SELECT pk, lat, lon, utm_x, utm_y FROM pks_maestro WHERE muro = ? AND activo', (muro,))}
+        # Solo se emparejan (por cadenamiento) las filas sin pk_maestro guardado
+        pks = [m['pk'] for m in mediciones if m.get('pk_maestro') is None]
+        emparejados = dict(zip(pks, zip(*self.indice_pks.emparejar_pks(muro, pks)))) if pks else {}
+
+        for medicion in mediciones:
+            if medicion.get('pk_maestro') is not None:
+                pk_maestro, distancia = medicion['pk_maestro'], medicion['distancia_pk']
+            else:
+                pk_maestro, distancia = emparejados[medicion['pk']]
+            punto = coordenadas.get(pk_maestro)
+            if punto is None or punto['lat'] is None or punto['lon'] is None:
+                continue
+            yield {
+                'medicion_id': medicion['id'], 'archivo_id': archivo_id, 'archivo_muro': muro,
+                'sector': medicion['sector'], 'pk': medicion['pk'], 'pk_maestro': pk_maestro,
+                'distancia_pk': None if distancia is None or distancia != distancia else round(float(distancia), 3),
+                'fecha_medicion': archivo['fecha_medicion'],
+                **{c: medicion[c] for c in MEDICIONES},
+                'lat': punto['lat'], 'lon': punto['lon'], 'utm_x': punto['utm_x'], 'utm_y': punto['utm_y'],
+                **colores(medicion),
+                'archivo_nombre': archivo['archivo_nombre'], 'created_at': medicion['created_at'],
+                'usuario_id': archivo['usuario_id'],
+            }
+
+    def cerrar(self) -> None:
+        self.espejo.cerrar()
+
+
+# ============================================
+# ACTUALIZACIÓN INCREMENTAL
+# ============================================
+
+def _agregar_archivo(gpkg: sqlite3.Connection, fuente, archivo_id: int, muro: str, fecha: str) -> int:
+    filas = 0
+    lote = []
+    insertar = (f"INSERT OR REPLACE INTO {TABLA} (fid, geom, {', '.join(COLUMNAS)}) "
+                f"VALUES ({', '.join('?' for _ in range(len(COLUMNAS) + 2))})")
+    for fila in fuente.filas(archivo_id, muro):
+        lote.append((fila['medicion_id'], geometria_punto(float(fila['lon']), float(fila['lat'])),
+                     *(fila.get(c) for c in COLUMNAS)))
+        if len(lote) >= LIMITE_PAGINA:
+            gpkg.executemany(insertar, lote)
+            filas += len(lote)
+            lote = []
+    gpkg.executemany(insertar, lote)
+    filas += len(lote)
+    gpkg.execute('INSERT OR REPLACE INTO _archivos_incluidos VALUES (?, ?, ?, ?)',
+                 (archivo_id, muro, fecha, filas))
+    return filas
+
+
+def _actualizar_extension(gpkg: sqlite3.Connection) -> None:
+    """Rectángulo envolvente de la capa (desde el R-tree) y fecha de modificación."""
+    minx, miny, maxx, maxy = gpkg.execute(
+        f'SELECT MIN(minx), MIN(miny), MAX(maxx), MAX(maxy) FROM {RTREE}').fetchone()
+    gpkg.execute(
+        "UPDATE gpkg_contents SET min_x = ?, min_y = ?, max_x = ?, max_y = ?, "
+        "last_change = strftime('%Y-%m-%dT%H:%M:%fZ', 'now') WHERE table_name = ?",
+        (minx, miny, maxx, maxy, TABLA))
+
+
+def actualizar_geopackage(conexion=None, espejo: Optional[str] = None,
+                          ruta: str = ARCHIVO_GEOPACKAGE) -> Dict[str, int]:
+    """
+    Agrega al GeoPackage los archivos nuevos de la fuente y quita los que ya
+    no están. Fuente: `espejo` (ruta del SQLite local) o `conexion` (Supabase);
+    si no es la misma con la que se construyó el archivo, se reconstruye.
+    Retorna {'archivos_nuevos', 'archivos_eliminados', 'filas_nuevas', 'filas_total'}.
+    """
+    fuente = FuenteEspejo(espejo) if espejo else FuenteBD(conexion)
+    gpkg = abrir_geopackage(ruta)
+    try:
+        version = fuente.version_maestro()
+        # Otra fuente (el espejo puede estar atrasado respecto de la BD, y su
+        # marca del maestro no se compara con la de la BD) o coordenadas / PKs
+        # del maestro modificados: todo se recalcula
+        if fuente.nombre != _metadato(gpkg, 'fuente') or version != _metadato(gpkg, 'version_pks_maestro'):
+            with gpkg:
+                gpkg.execute(f'DELETE FROM {TABLA}')
+                gpkg.execute('DELETE FROM _archivos_incluidos')
+                gpkg.execute("INSERT OR REPLACE INTO _metadatos VALUES ('fuente', ?)", (fuente.nombre,))
+                gpkg.execute("INSERT OR REPLACE INTO _metadatos VALUES ('version_pks_maestro', ?)", (version,))
+
+        en_fuente = fuente.archivos()
+        incluidos = {f['archivo_id'] for f in gpkg.execute('SELECT archivo_id FROM _archivos_incluidos')}
+        eliminados = incluidos - set(en_fuente)
+        nuevos = sorted(set(en_fuente) - incluidos)
+
+        with gpkg:
+            for archivo_id in eliminados:
+                gpkg.execute(f'DELETE FROM {TABLA} WHERE archivo_id = ?', (archivo_id,))
+                gpkg.execute('DELETE FROM _archivos_incluidos WHERE archivo_id = ?', (archivo_id,))
+
+        filas_nuevas = 0
+        for archivo_id in nuevos:
+            muro, fecha = en_fuente[archivo_id]
+            # Un archivo por transacción: si se corta, la próxima corrida sigue desde aquí
+            with gpkg:
+                filas_nuevas += _agregar_archivo(gpkg, fuente, archivo_id, muro, fecha)
+
+        with gpkg:
+            _actualizar_extension(gpkg)
+        return {
+            'archivos_nuevos': len(nuevos),
+            'archivos_eliminados': len(eliminados),
+            'filas_nuevas': filas_nuevas,
+            'filas_total': gpkg.execute(f'SELECT COUNT(*) FROM {TABLA}').fetchone()[0],
+        }
+    finally:
+        gpkg.close()
+        if isinstance(fuente, FuenteEspejo):
+            fuente.cerrar()
+
+
+# ============================================
+# CONSULTAS LOCALES
+# ============================================
+
+def consultar(ruta: str, rectangulo: Tuple[float, float, float, float],
+              desde: str, hasta: str, muro: Optional[str] = None,
+              sector: Optional[str] = None) -> List[Dict]:
+    """
+    Mediciones dentro de `rectangulo` (lon_min, lat_min, lon_max, lat_max)
+    con desde <= fecha_medicion <= hasta, por muro, PK y fecha.
+    """
+    lon_min, lat_min, lon_max, lat_max = rectangulo
+    # El R-tree guarda float32 (redondeado hacia afuera): se confirma con lon/lat exactos
+    condiciones = ['r.minx <= ? AND r.maxx >= ? AND r.miny <= ? AND r.maxy >= ?',
+                   't.lon BETWEEN ? AND ? AND t.lat BETWEEN ? AND ?',
+                   't.fecha_medicion BETWEEN ? AND ?']
+    parametros: list = [lon_max, lon_min, lat_max, lat_min, lon_min, lon_max, lat_min, lat_max, desde, hasta]
+    if muro:
+        condiciones.append('t.archivo_muro = ?')
+        parametros.append(muro)
+    if sector:
+        condiciones.append('t.sector = ?')
+        parametros.append(sector)
+
+    conexion = sqlite3.connect(f"file:{Path(ruta).resolve().as_posix()}?mode=ro", uri=True)
+    conexion.row_factory = sqlite3.Row
+    try:
+        return [dict(f) for f in conexion.execute(
+            f"SELECT {', '.join(f't.{c}' for c in COLUMNAS)} "
+            f'FROM {RTREE} r JOIN {TABLA} t ON t.fid = r.id '
+            f"WHERE {' AND '.join(condiciones)} "
+            'ORDER BY t.archivo_muro, t.pk, t.fecha_medicion', parametros)]
+    finally:
+        conexion.close()
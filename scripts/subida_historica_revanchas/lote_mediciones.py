@@ -0,0 +1,172 @@
+"""
+Lote Compacto de Mediciones
+===========================
+
+Las mediciones de un archivo se guardan por columnas (struct-of-arrays):
+una array('d') de float64 por cada valor numérico (NaN = sin dato) y listas
+de strings internados para sector y PK. Son ~72 bytes por fila en vez de
+los varios cientos de un dict de 10 claves, lo que permite tener en memoria
+lotes de años completos en la VM de carga.
+
+El lote se serializa directo al JSON que espera PostgREST, sin armar un
+dict intermedio por fila.
+
+Si el lote pasó por emparejar_pks.py, cada fila lleva además el PK del
+maestro más cercano (pk_maestro, None si no hay) y su distancia en metros.
+"""
+
+import json
+import math
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+COLUMNAS_NUMERICAS = (
+    'coronamiento', 'revancha', 'lama', 'ancho', 'geomembrana',
+    'dist_geo_lama', 'dist_geo_coronamiento',
+)
+
+NAN = float('nan')
+
+
+def a_float(valor) -> float:
+    """Convierte una celda a float; None o texto no numérico -> NaN."""
+    if valor is None:
+        return NAN
+    try:
+        numero = float(valor)
+    except (ValueError, TypeError):
+        return NAN
+    return numero if math.isfinite(numero) else NAN
+
+
+def _json_float(valor: float) -> str:
+    # repr() da la representación más corta que preserva el valor (JSON válido)
+    return 'null' if valor != valor else repr(valor)
+
+
+class LoteMediciones:
+    """Mediciones de un archivo almacenadas por columnas."""
+
+    __slots__ = ('sector', 'pk', 'columnas', 'pk_maestro', 'distancia_pk')
+
+    def __init__(self):
+        self.sector: List[str] = []
+        self.pk: List[str] = []
+        self.columnas: Dict[str, array] = {c: array('d') for c in COLUMNAS_NUMERICAS}
+        # Vacíos hasta emparejar el lote con pks_maestro
+        self.pk_maestro: List[Optional[str]] = []
+        self.distancia_pk = array('d')
+
+    def agregar(self, sector: str, pk: str, valores: Dict[str, object]) -> None:
+        """Agrega una fila; `valores` son las celdas crudas de cada columna numérica."""
+        self.sector.append(sys.intern(sector))
+        self.pk.append(sys.intern(pk))
+        for nombre, columna in self.columnas.items():
+            columna.append(a_float(valores.get(nombre)))
+
+    def __len__(self) -> int:
+        return len(self.pk)
+
+    def columna(self, nombre: str):
+        """Columna numérica como vector NumPy float64 (sin copiar la memoria)."""
+        import numpy as np
+        return np.frombuffer(self.columnas[nombre], dtype=np.float64)
+
+    @property
+    def emparejado(self) -> bool:
+        """True si cada fila tiene su PK del maestro asignado."""
+        return bool(self.pk) and len(self.pk_maestro) == len(self.pk)
+
+    def asignar_maestro(self, pks_maestro: List[Optional[str]], distancias) -> None:
+        """PK del maestro y distancia (m, NaN si no hay) de cada fila."""
+        self.pk_maestro = [None if p is None else sys.intern(p) for p in pks_maestro]
+        self.distancia_pk = array('d', (a_float(d) for d in distancias))
+
+    def pks_efectivos(self) -> List[str]:
+        """PK del maestro de cada fila si lo tiene; si no, el de la planilla."""
+        if not self.emparejado:
+            return list(self.pk)
+        return [m if m is not None else p for m, p in zip(self.pk_maestro, self.pk)]
+
+    def sectores(self) -> List[str]:
+        """Sectores únicos no vacíos, ordenados."""
+        return sorted(set(s for s in self.sector if s))
+
+    def filas(self, archivo_id: Optional[int] = None) -> Iterator[Dict]:
+        """
+        Itera las filas como dicts (None en vez de NaN). Solo para APIs que
+        necesitan dicts (supabase-py); el modo eficiente usa a_json().
+        """
+        for i in range(len(self)):
+            fila = {} if archivo_id is None else {'archivo_id': archivo_id}
+            fila['sector'] = self.sector[i]
+            fila['pk'] = self.pk[i]
+            if self.emparejado:
+                fila['pk_maestro'] = self.pk_maestro[i]
+                distancia = self.distancia_pk[i]
+                fila['distancia_pk'] = None if distancia != distancia else round(distancia, 3)
+            for nombre, columna in self.columnas.items():
+                valor = columna[i]
+                fila[nombre] = None if valor != valor else valor
+            yield fila
+
+    def a_json(self, archivo_id: Optional[int] = None) -> bytes:
+        """Serializa el lote como array JSON de filas, listo para PostgREST."""
+        # Los strings se escapan una sola vez (sector y PK se repiten mucho)
+        escapados: Dict[str, str] = {}
+
+        def texto(valor: Optional[str]) -> str:
+            if valor is None:
+                return 'null'
+            if valor not in escapados:
+                escapados[valor] = json.dumps(valor, ensure_ascii=False)
+            return escapados[valor]
+
+        prefijo = '{' if archivo_id is None else '{"archivo_id":%d,' % archivo_id
+        nombres = list(self.columnas)
+        columnas = [self.columnas[n] for n in nombres]
+        emparejado = self.emparejado
+        partes = []
+        for i in range(len(self)):
+            valores = ','.join(f'"{n}":{_json_float(c[i])}' for n, c in zip(nombres, columnas))
+            maestro = ''
+            if emparejado:
+                maestro = (f'"pk_maestro":{texto(self.pk_maestro[i])},'
+                           f'"distancia_pk":{_json_float(round(self.distancia_pk[i], 3))},')
+            partes.append(f'{prefijo}"sector":{texto(self.sector[i])},'
+                          f'"pk":{texto(self.pk[i])},{maestro}{valores}}}')
+        return ('[' + ','.join(partes) + ']').encode('utf-8')
+
+    # ----------------------------------------
+    # Formato por columnas (para guardar en disco)
+    # ----------------------------------------
+
+    def a_columnas(self) -> Dict[str, list]:
+        """Dict de listas por columna (JSON-serializable, None en vez de NaN)."""
+        datos = {'sector': list(self.sector), 'pk': list(self.pk)}
+        for nombre, columna in self.columnas.items():
+            datos[nombre] = [None if v != v else v for v in columna]
+        if self.emparejado:
+            datos['pk_maestro'] = list(self.pk_maestro)
+            datos['distancia_pk'] = [None if v != v else v for v in self.distancia_pk]
+        return datos
+
+    @classmethod
+    def desde_columnas(cls, datos: Dict[str, list]) -> 'LoteMediciones':
+        lote = cls()
+        lote.sector = [sys.intern(s) for s in datos['sector']]
+        lote.pk = [sys.intern(p) for p in datos['pk']]
+        for nombre in COLUMNAS_NUMERICAS:
+            lote.columnas[nombre] = array('d', (a_float(v) for v in datos[nombre]))
+        if 'pk_maestro' in datos:
+            lote.asignar_maestro(datos['pk_maestro'], datos['distancia_pk'])
+        return lote
+
+    @classmethod
+    def desde_filas(cls, filas: Iterable[Dict]) -> 'LoteMediciones':
+        """Construye un lote desde dicts de medición (formato antiguo)."""
+        lote = cls()
+        for fila in filas:
+            lote.agregar(fila['sector'], fila['pk'], fila)
+        return lote
@@ -3,87 +3,148 @@ Script para Organizar Archivos Después de la Carga Masiva
 ==========================================================
 
 Este script:
-1. Lee el reporte de carga masiva
-2. Mueve archivos exitosos a carpeta _SUBIDOS
+1. Lee el log de eventos de la carga masiva (JSONL, línea a línea), más
+   el resultado de cada archivo en la cola compartida (`revanchas.py work`,
+   cualquier equipo o carpeta de trabajo)
+2. Mueve archivos exitosos a carpeta _SUBIDOS (un .zip se mueve cuando
+   todas sus planillas se subieron)
 3. Deja solo archivos con errores para revisión manual
 4. Genera reporte de errores detallado
 
 Uso:
     python organizar_archivos.py
+    python revanchas.py organize
 """
 
-import json
 import shutil
+from itertools import chain
 from pathlib import Path
 import os
 
-# Configuración
-CARPETA_BASE = r'E:\TITO\1 Astro\REVANCHAS HISTORICAS'
-REPORTE_JSON = 'reporte_carga_masiva.json'
+from cola_trabajo import abrir_cola, eventos_cola, ruta_por_defecto
+from registro_eventos import ARCHIVO_EVENTOS, EVENTOS_ARCHIVO, leer_eventos
 
-def main():
+# Configuración (mismas variables de entorno que carga_masiva.py)
+CARPETA_BASE = os.getenv('REVANCHAS_CARPETA_BASE', r'E:\TITO\1 Astro\REVANCHAS HISTORICAS')
+MUROS = os.getenv('REVANCHAS_MUROS', 'Oeste,Este,Principal').split(',')
+COLA = os.getenv('REVANCHAS_COLA')
+
+
+def _eventos_cola(ruta: str):
+    conexion = abrir_cola(ruta)
+    try:
+        yield from eventos_cola(conexion)
+    finally:
+        conexion.close()
+
+
+def main(carpeta_base: str = None, muros: list = None, cola: str = None):
+    carpeta_base = carpeta_base or CARPETA_BASE
+    muros = muros or MUROS
+    cola = cola or COLA or ruta_por_defecto(carpeta_base)
+    
     print("=" * 70)
     print("📁 ORGANIZANDO ARCHIVOS POST-CARGA")
     print("=" * 70)
     print()
     
-    # Leer reporte
-    if not os.path.exists(REPORTE_JSON):
-        print(f"❌ Error: No se encontró {REPORTE_JSON}")
+    # Fuentes: el log de la carga normal y la cola compartida de los
+    # trabajadores (los logs por trabajador quedan en el equipo de cada uno)
+    fuentes = []
+    if Path(ARCHIVO_EVENTOS).exists():
+        fuentes.append(leer_eventos(ARCHIVO_EVENTOS, tipos=EVENTOS_ARCHIVO))
+    if Path(cola).exists():
+        print(f"🗂️  Resultados de la cola: {cola}")
+        fuentes.append(_eventos_cola(cola))
+    if not fuentes:
+        print(f"❌ Error: No se encontró {ARCHIVO_EVENTOS} ni la cola {cola}")
         print("   Ejecuta primero carga_masiva.py")
         return
     
-    with open(REPORTE_JSON, 'r', encoding='utf-8') as f:
-        reporte = json.load(f)
-    
-    print(f"📊 Resumen del reporte:")
-    print(f"   ✅ Exitosos: {len(reporte['exitosos'])}")
-    print(f"   ⚠️  Duplicados: {len(reporte['duplicados'])}")
-    print(f"   ❌ Errores: {len(reporte['errores'])}")
-    print()
-    
     # Crear carpetas _SUBIDOS
-    muros = ['Oeste', 'Este', 'Principal']
     for muro in muros:
-        carpeta_muro = Path(CARPETA_BASE) / muro
+        carpeta_muro = Path(carpeta_base) / muro
         if carpeta_muro.exists():
             carpeta_subidos = carpeta_muro / '_SUBIDOS'
             carpeta_subidos.mkdir(exist_ok=True)
     
-    # Mover archivos exitosos
-    print("📦 Moviendo archivos exitosos a _SUBIDOS...")
+    # Recorrer el log de forma perezosa: los archivos se mueven a medida
+    # que se leen los eventos; solo los errores se agrupan para el reporte
+    print("📦 Moviendo archivos exitosos y duplicados a _SUBIDOS...")
+    conteo = {'exitoso': 0, 'duplicado': 0, 'error': 0}
     movidos = 0
-    for item in reporte['exitosos']:
+    duplicados_movidos = 0
+    errores_por_muro = {}
+    resueltos = set()  # (muro, clave) subidos después de un error (replay)
+    contenedores = set()  # (muro, zip) con planillas subidas
+    ignorados_dry_run = 0
+    
+    eventos = chain.from_iterable(fuentes)
+    for item in eventos:
+        # Un dry-run solo valida: ni sus exitosos están en la BD ni su
+        # cuarentena es un error real (no debe retener un .zip)
+        if item.get('dry_run'):
+            ignorados_dry_run += 1
+            continue
+        
+        tipo = item['evento']
+        conteo[tipo] += 1
         archivo = item['archivo']
         muro = item['muro']
+        # Planillas de zips: el mismo nombre puede repetirse en otro zip o carpeta
+        clave = (item.get('contenedor'), item.get('miembro') or archivo)
+        
+        if tipo == 'error':
+            # Si un reintento vuelve a fallar, queda solo el último error
+            errores_por_muro.setdefault(muro, {})[clave] = item
+            continue
+        
+        if item.get('reintento'):
+            resueltos.add((muro, clave))
         
-        origen = Path(CARPETA_BASE) / muro / archivo
-        destino = Path(CARPETA_BASE) / muro / '_SUBIDOS' / archivo
+        # Planilla dentro de un .zip: el zip se mueve al final, si no hubo errores
+        if item.get('contenedor'):
+            contenedores.add((muro, item['contenedor']))
+            continue
+        
+        origen = Path(carpeta_base) / muro / archivo
+        destino = Path(carpeta_base) / muro / '_SUBIDOS' / archivo
         
         if origen.exists():
             shutil.move(str(origen), str(destino))
+            if tipo == 'exitoso':
+                movidos += 1
+                print(f"   ✅ {muro}/{archivo}")
+            else:
+                duplicados_movidos += 1
+                print(f"   ⚠️  {muro}/{archivo}")
+    
+    # Descartar errores que se resolvieron con cola_fallidos.py replay
+    for muro in errores_por_muro:
+        errores_por_muro[muro] = [e for a, e in errores_por_muro[muro].items()
+                                  if (muro, a) not in resueltos]
+    conteo['error'] = sum(len(e) for e in errores_por_muro.values())
+    
+    # Un .zip solo se mueve si ninguna de sus planillas quedó con error
+    con_errores = {(muro, e['contenedor']) for muro, errores in errores_por_muro.items()
+                   for e in errores if e.get('contenedor')}
+    for muro, contenedor in sorted(contenedores - con_errores):
+        origen = Path(carpeta_base) / muro / contenedor
+        if origen.exists():
+            shutil.move(str(origen), str(Path(carpeta_base) / muro / '_SUBIDOS' / contenedor))
             movidos += 1
-            print(f"   ✅ {muro}/{archivo}")
+            print(f"   📦 {muro}/{contenedor}")
     
     print(f"\n✅ {movidos} archivos movidos a _SUBIDOS")
+    print(f"⚠️  {duplicados_movidos} duplicados movidos a _SUBIDOS")
     print()
     
-    # Mover duplicados también
-    print("📦 Moviendo archivos duplicados a _SUBIDOS...")
-    duplicados_movidos = 0
-    for item in reporte['duplicados']:
-        archivo = item['archivo']
-        muro = item['muro']
-        
-        origen = Path(CARPETA_BASE) / muro / archivo
-        destino = Path(CARPETA_BASE) / muro / '_SUBIDOS' / archivo
-        
-        if origen.exists():
-            shutil.move(str(origen), str(destino))
-            duplicados_movidos += 1
-            print(f"   ⚠️  {muro}/{archivo}")
-    
-    print(f"\n⚠️  {duplicados_movidos} duplicados movidos a _SUBIDOS")
+    print(f"📊 Resumen del log de eventos:")
+    print(f"   ✅ Exitosos: {conteo['exitoso']}")
+    print(f"   ⚠️  Duplicados: {conteo['duplicado']}")
+    print(f"   ❌ Errores: {conteo['error']}")
+    if ignorados_dry_run:
+        print(f"   🧪 Eventos de dry-run ignorados: {ignorados_dry_run}")
     print()
     
     # Generar reporte de errores
@@ -93,15 +154,7 @@ def main():
         f.write("=" * 70 + "\n")
         f.write("REPORTE DE ARCHIVOS CON ERRORES\n")
         f.write("=" * 70 + "\n\n")
-        f.write(f"Total de errores: {len(reporte['errores'])}\n\n")
-        
-        # Agrupar por muro
-        errores_por_muro = {}
-        for item in reporte['errores']:
-            muro = item['muro']
-            if muro not in errores_por_muro:
-                errores_por_muro[muro] = []
-            errores_por_muro[muro].append(item)
+        f.write(f"Total de errores: {conteo['error']}\n\n")
         
         for muro, errores in errores_por_muro.items():
             f.write(f"\n{'=' * 70}\n")
@@ -111,7 +164,14 @@ def main():
             for item in errores:
                 f.write(f"Archivo: {item['archivo']}\n")
                 f.write(f"Error:   {item['error']}\n")
-                f.write(f"Ruta:    {CARPETA_BASE}\\{muro}\\{item['archivo']}\n")
+                if item.get('clasificacion'):
+                    datos = f" (datos en {item['fallido']})" if item.get('fallido') else ''
+                    f.write(f"Tipo:    {item['clasificacion']}{datos}\n")
+                if item.get('contenedor'):
+                    f.write(f"Ruta:    {carpeta_base}\\{muro}\\{item['contenedor']} -> "
+                            f"{item.get('miembro') or item['archivo']}\n")
+                else:
+                    f.write(f"Ruta:    {carpeta_base}\\{muro}\\{item['archivo']}\n")
                 f.write("-" * 70 + "\n")
         
         f.write("\n" + "=" * 70 + "\n")
@@ -134,10 +194,10 @@ def main():
     print("📊 RESUMEN FINAL")
     print("=" * 70)
     print()
-    print(f"📁 Archivos organizados en: {CARPETA_BASE}")
+    print(f"📁 Archivos organizados en: {carpeta_base}")
     print()
     for muro in muros:
-        carpeta_muro = Path(CARPETA_BASE) / muro
+        carpeta_muro = Path(carpeta_base) / muro
         if carpeta_muro.exists():
             archivos_restantes = len([f for f in carpeta_muro.glob('*.xlsx') if f.is_file()])
             archivos_subidos = len(list((carpeta_muro / '_SUBIDOS').glob('*.xlsx'))) if (carpeta_muro / '_SUBIDOS').exists() else 0
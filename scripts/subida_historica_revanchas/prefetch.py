@@ -0,0 +1,102 @@
+"""
+Lectura Anticipada de Archivos (Prefetch)
+=========================================
+
+La carpeta base suele ser una unidad de red mapeada: openpyxl hace muchas
+lecturas pequeñas y aleatorias sobre SMB y cada apertura de archivo se
+detiene esperando la red. Este módulo lee por adelantado, en hilos de
+fondo, los bytes de los próximos K archivos del catálogo a buffers en
+memoria, mientras el archivo actual se parsea y se sube. El parser trabaja
+luego sobre un BytesIO, sin tocar la red.
+
+La memoria está acotada: nunca hay más de `max_bytes` entre lecturas en
+vuelo y el buffer entregado al consumidor, que cuenta hasta que pide el
+siguiente archivo (un archivo más grande que el límite se lee solo, cuando
+le toca y no queda nada más en memoria).
+
+Uso:
+    for entrada, fuente in Prefetch(entradas, k=4, max_bytes=256 * 1024 * 1024):
+        datos = procesar_cacheado(entrada, fuente)
+"""
+
+import io
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Iterable, Iterator, Optional, Tuple
+
+from catalogo import EntradaCatalogo
+
+
+class Prefetch:
+    """
+    Itera (entrada, BytesIO) leyendo en segundo plano los próximos `k` archivos.
+    Las entradas para las que `omitir(entrada)` es verdadero (ej: ya están en
+    el cache de parseo) no se leen y se entregan con fuente None.
+    """
+
+    def __init__(self, entradas: Iterable[EntradaCatalogo], k: int = 4,
+                 max_bytes: int = 256 * 1024 * 1024, hilos: int = 2,
+                 omitir: Optional[Callable[[EntradaCatalogo], bool]] = None):
+        self.entradas = iter(entradas)
+        self.k = max(1, k)
+        self.max_bytes = max_bytes
+        self.hilos = max(1, hilos)
+        self.omitir = omitir or (lambda entrada: False)
+        self._en_vuelo: Deque[Tuple[EntradaCatalogo, Optional[Future]]] = deque()
+        # Lecturas en vuelo más el buffer entregado y aún no liberado
+        self._bytes_en_vuelo = 0
+        self._siguiente: Optional[EntradaCatalogo] = None
+        self._agotado = False
+
+    def _proxima_entrada(self) -> Optional[EntradaCatalogo]:
+        if self._siguiente is None and not self._agotado:
+            self._siguiente = next(self.entradas, None)
+            self._agotado = self._siguiente is None
+        return self._siguiente
+
+    def _llenar(self, ejecutor: ThreadPoolExecutor) -> None:
+        """Encola lecturas hasta completar K archivos o el límite de memoria."""
+        while len(self._en_vuelo) < self.k:
+            entrada = self._proxima_entrada()
+            if entrada is None:
+                return
+
+            if self.omitir(entrada):
+                self._en_vuelo.append((entrada, None))
+            else:
+                # Si no cabe, se espera a que se consuma lo ya leído; un archivo
+                # más grande que el límite entra solo cuando no hay nada en memoria
+                if self._bytes_en_vuelo and self._bytes_en_vuelo + entrada.tamano > self.max_bytes:
+                    return
+                self._bytes_en_vuelo += entrada.tamano
+                self._en_vuelo.append((entrada, ejecutor.submit(entrada.leer)))
+            self._siguiente = None
+
+    def __iter__(self) -> Iterator[Tuple[EntradaCatalogo, Optional[io.BytesIO]]]:
+        with ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='prefetch') as ejecutor:
+            try:
+                self._llenar(ejecutor)
+                while self._en_vuelo:
+                    entrada, futuro = self._en_vuelo.popleft()
+                    fuente = None
+                    if futuro is not None:
+                        try:
+                            fuente = io.BytesIO(futuro.result())
+                        except Exception:
+                            # Error de lectura: el parser lo reintenta y lo reporta
+                            fuente = None
+                    # Se piden los siguientes antes de entregar el actual, que
+                    # sigue contando en el límite mientras el consumidor lo usa
+                    self._llenar(ejecutor)
+                    yield entrada, fuente
+                    # El consumidor pidió el siguiente: el buffer entregado se libera
+                    fuente = None
+                    if futuro is not None:
+                        self._bytes_en_vuelo -= entrada.tamano
+                    self._llenar(ejecutor)
+            finally:
+                # Si el consumidor se detiene (Ctrl-C), no seguir leyendo
+                for _, futuro in self._en_vuelo:
+                    if futuro is not None:
+                        futuro.cancel()
+                self._en_vuelo.clear()
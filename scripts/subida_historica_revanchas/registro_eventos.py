@@ -0,0 +1,112 @@
+"""
+Registro de Eventos de la Carga Masiva (JSONL)
+==============================================
+
+Cada resultado de archivo (exitoso, duplicado, error) se agrega como una
+línea JSON al log de eventos en el momento en que ocurre. El resumen
+(contadores por tipo y por muro) se construye de forma incremental, así
+la memoria se mantiene constante aunque se procesen miles de archivos.
+
+Formato de cada línea:
+    {"evento": "exitoso", "ts": "2025-12-22T14:00:01", "archivo": "...",
+     "muro": "Principal", "fecha": "2022-01-15", "registros": 73}
+
+Eventos de control: "inicio", "fin" e "interrumpido" (estos dos últimos
+incluyen el resumen acumulado).
+
+Para seguir el avance en vivo:
+    tail -f eventos_carga_masiva.jsonl
+
+Con la cola de trabajo (`revanchas.py work`) cada trabajador escribe su
+propio log, eventos_carga_masiva.<equipo-pid>.jsonl, solo para seguir su
+avance: organizar_archivos.py lee el resultado de cada archivo desde la
+cola compartida (estados hecho/error), que ven todos los equipos.
+"""
+
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+ARCHIVO_EVENTOS = 'eventos_carga_masiva.jsonl'
+
+# Eventos que representan el resultado de un archivo
+EVENTOS_ARCHIVO = ('exitoso', 'duplicado', 'error')
+
+
+class RegistroEventos:
+    """Escribe eventos en un archivo JSONL y mantiene el resumen incremental."""
+
+    def __init__(self, ruta: str = ARCHIVO_EVENTOS, muros: Optional[List[str]] = None,
+                 continuar: bool = False):
+        self.ruta = Path(ruta)
+        # Se trunca en cada corrida (igual que el antiguo reporte JSON),
+        # salvo que se quiera continuar el log existente (ej: reintentos)
+        self._archivo = open(self.ruta, 'a' if continuar else 'w', encoding='utf-8')
+        self.resumen = {
+            'exitosos': 0,
+            'duplicados': 0,
+            'errores': 0,
+            'estadisticas': {muro: 0 for muro in (muros or [])},
+            'inicio': datetime.now().isoformat(),
+        }
+        # Mensaje del último evento 'error' (la cola lo guarda con el archivo)
+        self.ultimo_error: Optional[str] = None
+        self.registrar('inicio', muros=muros or [])
+
+    def registrar(self, evento: str, **datos) -> None:
+        """Agrega un evento al log y actualiza el resumen."""
+        linea = {'evento': evento, 'ts': datetime.now().isoformat(), **datos}
+        self._archivo.write(json.dumps(linea, ensure_ascii=False) + '\n')
+        # Flush por evento: nada se pierde ante un crash o Ctrl-C
+        self._archivo.flush()
+
+        if evento == 'exitoso':
+            self.resumen['exitosos'] += 1
+            muro = datos.get('muro')
+            if muro and not datos.get('dry_run'):
+                self.resumen['estadisticas'][muro] = self.resumen['estadisticas'].get(muro, 0) + 1
+        elif evento == 'duplicado':
+            self.resumen['duplicados'] += 1
+        elif evento == 'error':
+            self.resumen['errores'] += 1
+            self.ultimo_error = datos.get('error')
+
+    def cerrar(self, evento: str = 'fin') -> Dict:
+        """Escribe el evento de cierre con el resumen y cierra el archivo."""
+        if self._archivo.closed:
+            return self.resumen
+        self.resumen['fin'] = datetime.now().isoformat()
+        self.registrar(evento, resumen=self.resumen)
+        self._archivo.close()
+        return self.resumen
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cerrar('fin' if exc_type is None else 'interrumpido')
+        return False
+
+
+def leer_eventos(ruta: str = ARCHIVO_EVENTOS, tipos: Optional[tuple] = None) -> Iterator[Dict]:
+    """
+    Lee el log de eventos de forma perezosa (una línea a la vez).
+    Ignora una última línea truncada si el proceso murió a mitad de escritura.
+    """
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                evento = json.loads(linea)
+            except json.JSONDecodeError:
+                continue
+            if tipos is None or evento.get('evento') in tipos:
+                yield evento
+
+
+def archivo_eventos_trabajador(trabajador: str) -> str:
+    """Log propio de un trabajador de la cola (no se pisan entre procesos)."""
+    return ARCHIVO_EVENTOS.replace('.jsonl', f'.{trabajador}.jsonl')
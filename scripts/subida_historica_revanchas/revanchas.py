@@ -0,0 +1,304 @@
+"""
+CLI Unificado de Revanchas Históricas
+=====================================
+
+Un solo punto de entrada para todo el flujo de carga:
+
+    catalog     Lista los archivos por muro (sin abrirlos)
+    validate    Parsea todos los archivos y reporta errores (offline)
+    load        Sube los archivos a Supabase (con --dry-run: solo valida, offline)
+    verify      Muestra los archivos cargados (desde el espejo local si existe)
+    organize    Mueve los archivos subidos a _SUBIDOS según el log de eventos y la cola
+    sync        Actualiza el espejo SQLite local de las tablas de revanchas
+    queue       Encola los archivos en la cola compartida (o muestra su avance)
+    work        Toma archivos de la cola y los sube (varios procesos / equipos)
+    export      Libro Excel por muro: PKs x fechas, una hoja por sector
+    geopackage  Actualiza el GeoPackage offline con la historia georreferenciada
+
+Se pueden encadenar varios comandos en un mismo proceso; comparten el
+cache de parseo, así `validate load` lee cada Excel una sola vez:
+
+    python revanchas.py validate load organize
+    python revanchas.py load sync verify
+
+Carga repartida entre varios equipos que ven la misma carpeta base:
+
+    python revanchas.py queue              (una vez)
+    python revanchas.py work               (en cada equipo, las veces que se quiera)
+    python revanchas.py queue --estado
+
+Las librerías pesadas (openpyxl, supabase, numpy) solo se importan si el
+comando las necesita: `catalog` parte en milisegundos.
+
+Configuración: opciones de la línea de comandos, o variables de entorno
+(REVANCHAS_CARPETA_BASE, REVANCHAS_MUROS, REVANCHAS_USUARIO_ID,
+REVANCHAS_DRY_RUN, REVANCHAS_ESPEJO, REVANCHAS_COLA, PUBLIC_SUPABASE_URL, SUPABASE_SERVICE_KEY).
+"""
+
+import argparse
+import sys
+
+COMANDOS = ('catalog', 'validate', 'load', 'verify', 'organize', 'sync', 'queue', 'work', 'export', 'geopackage')
+
+
+def crear_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description='Carga masiva de revanchas históricas',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('comandos', nargs='+', choices=COMANDOS, metavar='comando',
+                        help=f"Uno o más de: {', '.join(COMANDOS)}")
+    parser.add_argument('--carpeta-base', help='Carpeta con una subcarpeta por muro')
+    parser.add_argument('--muros', help='Muros separados por coma (ej: Este,Oeste)')
+    parser.add_argument('--usuario-id', type=int, help='Usuario que sube los archivos')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='load: solo validar, sin conectarse a Supabase')
+    parser.add_argument('--manifest', help='catalog: guardar el catálogo en este JSON')
+    parser.add_argument('--muro', default='Principal', help='verify: muro a revisar')
+    parser.add_argument('--en-vivo', action='store_true',
+                        help='verify: consultar Supabase aunque exista el espejo local')
+    parser.add_argument('--espejo', help='Ruta del espejo SQLite local (sync, verify, load)')
+    parser.add_argument('--omitir-cargados', action='store_true',
+                        help='load: no volver a subir archivos que el espejo ya tiene')
+    parser.add_argument('--cola', help='Ruta de la cola SQLite compartida (queue, work)')
+    parser.add_argument('--estado', action='store_true',
+                        help='queue: solo mostrar el avance de la cola')
+    parser.add_argument('--trabajador', help='work: nombre del trabajador (por defecto equipo-pid)')
+    parser.add_argument('--metrica', default='revancha', choices=('revancha', 'ancho', 'dist_geo_lama'),
+                        help='export: métrica a exportar')
+    parser.add_argument('--desde', help='export: fecha inicial (AAAA-MM-DD)')
+    parser.add_argument('--hasta', help='export: fecha final (AAAA-MM-DD)')
+    parser.add_argument('--fuente', choices=('espejo', 'bd', 'archivos'),
+                        help='export / geopackage: origen de los datos (por defecto el espejo si existe, si no la BD)')
+    parser.add_argument('--geopackage', help='Ruta del GeoPackage offline (default: public/revanchas_historia.gpkg)')
+    parser.add_argument('--salida', default='exportaciones', help='export: carpeta de los libros')
+    parser.add_argument('--prefetch', type=int,
+                        help='Archivos a leer por adelantado en segundo plano (0 = sin prefetch)')
+    return parser
+
+
+def aplicar_configuracion(args) -> dict:
+    """Sobreescribe CONFIG de carga_masiva con las opciones recibidas."""
+    from carga_masiva import CONFIG
+
+    if args.carpeta_base:
+        CONFIG['carpeta_base'] = args.carpeta_base
+    if args.muros:
+        CONFIG['muros'] = [m.strip() for m in args.muros.split(',') if m.strip()]
+    if args.usuario_id is not None:
+        CONFIG['usuario_id'] = args.usuario_id
+    if args.dry_run:
+        CONFIG['dry_run'] = True
+    if args.prefetch is not None:
+        CONFIG['prefetch_archivos'] = args.prefetch
+    if args.espejo:
+        CONFIG['espejo_local'] = args.espejo
+    if args.omitir_cargados:
+        CONFIG['omitir_ya_cargados'] = True
+    if args.cola:
+        CONFIG['cola_trabajo'] = args.cola
+    if args.geopackage:
+        CONFIG['archivo_geopackage'] = args.geopackage
+    return CONFIG
+
+
+def cmd_catalog(config: dict, args) -> None:
+    from catalogo import listar_archivos, escribir_manifest
+
+    entradas = list(listar_archivos(config['carpeta_base'], config['muros']))
+    for muro in config['muros']:
+        del_muro = [e for e in entradas if e.muro == muro]
+        total_mb = sum(e.tamano for e in del_muro) / (1024 * 1024)
+        print(f"📁 {muro}: {len(del_muro)} archivos ({total_mb:.1f} MB)")
+
+    if args.manifest:
+        escribir_manifest(entradas, args.manifest)
+        print(f"\n💾 Catálogo guardado en: {args.manifest}")
+
+
+def cmd_validate(config: dict, args) -> None:
+    from catalogo import listar_archivos, procesar_cacheado
+    from carga_masiva import leer_anticipado
+
+    validos = 0
+    errores = 0
+    for entrada, fuente in leer_anticipado(listar_archivos(config['carpeta_base'], config['muros'])):
+        try:
+            datos = procesar_cacheado(entrada, fuente)
+            validos += 1
+            print(f"✅ {entrada.muro}/{entrada.nombre}: {datos['total_registros']} registros ({datos['fecha']})")
+        except Exception as e:
+            errores += 1
+            print(f"❌ {entrada.muro}/{entrada.nombre}: {e}")
+
+    print(f"\n✅ Válidos: {validos}")
+    print(f"❌ Errores: {errores}")
+
+
+def cmd_load(config: dict, args) -> None:
+    import carga_masiva
+    carga_masiva.main()
+
+
+def cmd_verify(config: dict, args) -> None:
+    import verificar_bd
+    verificar_bd.main(args.muro, None if args.en_vivo else config['espejo_local'])
+
+
+def cmd_organize(config: dict, args) -> None:
+    import organizar_archivos
+    organizar_archivos.main(config['carpeta_base'], config['muros'], ruta_cola(config))
+
+
+def cmd_sync(config: dict, args) -> None:
+    from carga_masiva import crear_conexion
+    from cliente_postgrest import ClientePostgrest
+    from espejo_local import sincronizar
+
+    if not config['supabase_url'] or not config['supabase_key']:
+        print("❌ Error: Faltan credenciales de Supabase en .env")
+        sys.exit(1)
+
+    print(f"🔄 Sincronizando espejo local {config['espejo_local']}...")
+    conexion = crear_conexion()
+    try:
+        resultado = sincronizar(conexion, config['espejo_local'])
+    finally:
+        if isinstance(conexion, ClientePostgrest):
+            conexion.cerrar()
+
+    for tabla, filas in resultado.items():
+        print(f"   {tabla}: {filas}")
+
+
+def ruta_cola(config: dict) -> str:
+    from cola_trabajo import ruta_por_defecto
+    return config['cola_trabajo'] or ruta_por_defecto(config['carpeta_base'])
+
+
+def cmd_queue(config: dict, args) -> None:
+    from catalogo import listar_archivos
+    from cola_trabajo import abrir_cola, encolar, estado_cola
+
+    ruta = ruta_cola(config)
+    conexion = abrir_cola(ruta)
+    try:
+        if not args.estado:
+            resultado = encolar(conexion, listar_archivos(config['carpeta_base'], config['muros']))
+            print(f"📥 Cola {ruta}: {resultado['nuevos']} nuevos, {resultado['cambiados']} modificados")
+
+        for muro, conteo in estado_cola(conexion).items():
+            detalle = ', '.join(f"{estado}: {n}" for estado, n in sorted(conteo.items()))
+            print(f"📁 {muro}: {detalle}")
+    finally:
+        conexion.close()
+
+
+def cmd_work(config: dict, args) -> None:
+    import carga_masiva
+    from cola_trabajo import Trabajador
+
+    with Trabajador(ruta_cola(config), nombre=args.trabajador, muros=config['muros']) as trabajador:
+        carga_masiva.main(trabajador)
+
+
+def cmd_export(config: dict, args) -> None:
+    import os
+    from exportar_excel import exportar
+
+    fuente = args.fuente or ('espejo' if os.path.exists(config['espejo_local']) else 'bd')
+    conexion = None
+    if fuente == 'bd':
+        from carga_masiva import crear_conexion
+
+        if not config['supabase_url'] or not config['supabase_key']:
+            print("❌ Error: Faltan credenciales de Supabase en .env")
+            sys.exit(1)
+        conexion = crear_conexion()
+
+    print(f"📊 Exportando {args.metrica} desde {fuente}...")
+    try:
+        resultados = exportar(
+            config['muros'], args.metrica, args.salida, args.desde, args.hasta,
+            espejo=config['espejo_local'] if fuente == 'espejo' else None,
+            conexion=conexion, carpeta_base=config['carpeta_base'],
+        )
+    finally:
+        from cliente_postgrest import ClientePostgrest
+        if isinstance(conexion, ClientePostgrest):
+            conexion.cerrar()
+
+    for r in resultados:
+        print(f"✅ {r['muro']}: {r['pks']} PKs x {r['fechas']} fechas en {r['hojas']} hojas -> {r['ruta']}")
+
+
+def cmd_geopackage(config: dict, args) -> None:
+    import os
+    from geopackage_revanchas import actualizar_geopackage, fuente_geopackage
+
+    # Por defecto, la fuente con la que se construyó el archivo (cambiarla lo reconstruye)
+    fuente = args.fuente or fuente_geopackage(config['archivo_geopackage']) \
+        or ('espejo' if os.path.exists(config['espejo_local']) else 'bd')
+    if fuente == 'archivos':
+        print("❌ Error: el GeoPackage necesita los IDs y coordenadas de la BD (--fuente espejo o bd)")
+        sys.exit(1)
+    credenciales = bool(config['supabase_url'] and config['supabase_key'])
+    if fuente == 'bd' and not credenciales:
+        print("❌ Error: Faltan credenciales de Supabase en .env")
+        sys.exit(1)
+
+    conexion = None
+    if credenciales:
+        from carga_masiva import crear_conexion
+        conexion = crear_conexion()
+
+    try:
+        if fuente == 'espejo' and conexion is not None:
+            # Un espejo atrasado dejaría el GeoPackage sin los archivos más nuevos
+            from espejo_local import sincronizar
+            print(f"🔄 Sincronizando espejo local {config['espejo_local']}...")
+            sincronizar(conexion, config['espejo_local'])
+        elif fuente == 'espejo':
+            print("⚠️  Sin credenciales: se usa el espejo local tal como está")
+
+        print(f"🧭 Actualizando {config['archivo_geopackage']} desde {fuente}...")
+        resultado = actualizar_geopackage(
+            conexion, espejo=config['espejo_local'] if fuente == 'espejo' else None,
+            ruta=config['archivo_geopackage'])
+    finally:
+        from cliente_postgrest import ClientePostgrest
+        if isinstance(conexion, ClientePostgrest):
+            conexion.cerrar()
+
+    for clave, valor in resultado.items():
+        print(f"   {clave}: {valor}")
+
+
+EJECUTORES = {
+    'catalog': cmd_catalog,
+    'validate': cmd_validate,
+    'load': cmd_load,
+    'verify': cmd_verify,
+    'organize': cmd_organize,
+    'sync': cmd_sync,
+    'queue': cmd_queue,
+    'work': cmd_work,
+    'export': cmd_export,
+    'geopackage': cmd_geopackage,
+}
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    config = aplicar_configuracion(args)
+
+    for comando in args.comandos:
+        EJECUTORES[comando](config, args)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Proceso cancelado por el usuario")
+        sys.exit(1)
@@ -0,0 +1,201 @@
+"""
+Snapshots GeoJSON de las Últimas Revanchas por Muro
+===================================================
+
+Después de cada carga exitosa genera, por muro, un GeoJSON compacto con la
+última medición de cada PK (mismas propiedades que
+/api/revanchas/georreferenciadas?soloUltimas=true&formato=geojson), para
+que el mapa lo sirva como archivo estático en vez de consultar la vista
+vista_ultimas_revanchas_geo en cada carga del mapa.
+
+Salida (por defecto en public/mapbox-gis/revanchas/ del proyecto Astro):
+    Principal.geojson, Este.geojson, Oeste.geojson, todos.geojson
+    manifest.json   -> {"Este": {"archivo": "Este.geojson", "etag": "...", ...}}
+
+El etag es un hash del contenido: si los datos no cambiaron, el archivo
+no se reescribe y el etag se mantiene (el navegador sigue usando su cache).
+
+Cada entrada del manifest trae también la versión de revanchas_archivos
+con la que se generó (total de archivos e id máximo del muro). El
+dashboard la compara con /api/revanchas/version antes de usar el snapshot:
+una carga o eliminación desde la web (o un snapshot aún no publicado)
+cambia la versión y el mapa vuelve a la consulta en vivo.
+
+Uso:
+    python snapshots_geojson.py
+"""
+
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from cliente_postgrest import ClientePostgrest
+from umbrales import colores
+
+VISTA_ULTIMAS = 'vista_ultimas_revanchas_geo'
+
+CARPETA_SNAPSHOTS = Path(__file__).resolve().parents[2] / 'public' / 'mapbox-gis' / 'revanchas'
+
+COLUMNAS = (
+    'medicion_id', 'archivo_id', 'archivo_muro', 'sector', 'pk', 'fecha_medicion',
+    'coronamiento', 'revancha', 'lama', 'ancho', 'geomembrana',
+    'dist_geo_lama', 'dist_geo_coronamiento', 'lat', 'lon', 'archivo_nombre',
+)
+
+MEDICIONES = ('coronamiento', 'revancha', 'lama', 'ancho', 'geomembrana',
+              'dist_geo_lama', 'dist_geo_coronamiento')
+
+
+def _redondear(valor, decimales: int):
+    return None if valor is None else round(float(valor), decimales)
+
+
+def consultar_ultimas(conexion, muro: str) -> List[Dict]:
+    """Última medición georreferenciada de cada PK del muro."""
+    if isinstance(conexion, ClientePostgrest):
+        return conexion.seleccionar(VISTA_ULTIMAS, ','.join(COLUMNAS), archivo_muro=muro)
+    return conexion.table(VISTA_ULTIMAS).select(','.join(COLUMNAS))\
+        .eq('archivo_muro', muro).execute().data
+
+
+def a_feature(fila: Dict) -> Dict:
+    """Convierte una fila de la vista en un Feature GeoJSON."""
+    mediciones = {k: _redondear(fila.get(k), 3) for k in MEDICIONES}
+    return {
+        'type': 'Feature',
+        'geometry': {
+            'type': 'Point',
+            # ~10 cm de precisión es suficiente para el mapa
+            'coordinates': [_redondear(fila['lon'], 6), _redondear(fila['lat'], 6)],
+        },
+        'properties': {
+            'medicion_id': fila['medicion_id'],
+            'archivo_id': fila['archivo_id'],
+            'muro': fila['archivo_muro'],
+            'sector': fila['sector'],
+            'pk': fila['pk'],
+            'fecha_medicion': fila['fecha_medicion'],
+            **mediciones,
+            **colores(mediciones),
+            'archivo_nombre': fila['archivo_nombre'],
+        },
+    }
+
+
+def version_archivos(conexion, muros: List[str]) -> Dict[str, Dict[str, int]]:
+    """
+    {muro: {'total', 'max_id'}} de revanchas_archivos (y 'todos'), el mismo
+    cálculo que /api/revanchas/version. Se pagina solo la columna id.
+    """
+    from espejo_local import LIMITE_PAGINA, _pagina
+
+    versiones = {muro: {'total': 0, 'max_id': 0} for muro in muros}
+    todos = {'total': 0, 'max_id': 0}
+    ultimo = None
+    while True:
+        pagina = _pagina(conexion, 'revanchas_archivos', 'id,muro', 'id', ultimo, inclusivo=False)
+        for fila in pagina:
+            # 'todos' cuenta solo los muros del snapshot: si la BD tiene otro
+            # muro, no coincide con la API y el mapa usa la consulta en vivo
+            if fila['muro'] not in versiones:
+                continue
+            for version in (versiones[fila['muro']], todos):
+                version['total'] += 1
+                version['max_id'] = max(version['max_id'], fila['id'])
+        if len(pagina) < LIMITE_PAGINA:
+            break
+        ultimo = pagina[-1]['id']
+    versiones['todos'] = todos
+    return versiones
+
+
+def serializar(features: List[Dict]) -> bytes:
+    """GeoJSON compacto y determinístico (mismo contenido = mismos bytes)."""
+    features = sorted(features, key=lambda f: (f['properties']['muro'],
+                                               f['properties']['sector'],
+                                               f['properties']['pk']))
+    coleccion = {'type': 'FeatureCollection', 'features': features}
+    return json.dumps(coleccion, ensure_ascii=False, separators=(',', ':'),
+                      sort_keys=True).encode('utf-8')
+
+
+def calcular_etag(contenido: bytes) -> str:
+    return hashlib.sha256(contenido).hexdigest()[:16]
+
+
+def escribir_snapshot(carpeta: Path, nombre: str, contenido: bytes,
+                      anterior: Dict) -> Dict:
+    """Escribe el archivo solo si cambió. Retorna su entrada del manifest."""
+    etag = calcular_etag(contenido)
+    archivo = f"{nombre}.geojson"
+    ruta = carpeta / archivo
+
+    if anterior.get('etag') == etag and ruta.exists():
+        return anterior
+
+    # Escritura atómica: el frontend nunca lee un archivo a medio escribir
+    temporal = ruta.with_suffix('.tmp')
+    temporal.write_bytes(contenido)
+    os.replace(temporal, ruta)
+
+    return {
+        'archivo': archivo,
+        'etag': etag,
+        'bytes': len(contenido),
+        'generado': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def generar_snapshots(conexion, muros: List[str], carpeta=CARPETA_SNAPSHOTS) -> Dict:
+    """Genera los snapshots por muro y el combinado 'todos'. Retorna el manifest."""
+    carpeta = Path(carpeta)
+    carpeta.mkdir(parents=True, exist_ok=True)
+    ruta_manifest = carpeta / 'manifest.json'
+
+    manifest_anterior = {}
+    if ruta_manifest.exists():
+        manifest_anterior = json.loads(ruta_manifest.read_text(encoding='utf-8'))
+
+    # La versión se lee antes que los datos: si alguien escribe entremedio,
+    # el snapshot queda marcado como desactualizado (nunca al revés)
+    versiones = version_archivos(conexion, muros)
+
+    manifest = {}
+    todas = []
+    for muro in muros:
+        features = [a_feature(fila) for fila in consultar_ultimas(conexion, muro)
+                    if fila.get('lat') is not None and fila.get('lon') is not None]
+        todas.extend(features)
+        manifest[muro] = escribir_snapshot(carpeta, muro, serializar(features),
+                                           manifest_anterior.get(muro, {}))
+        manifest[muro]['total'] = len(features)
+        manifest[muro]['version'] = versiones[muro]
+
+    manifest['todos'] = escribir_snapshot(carpeta, 'todos', serializar(todas),
+                                          manifest_anterior.get('todos', {}))
+    manifest['todos']['total'] = len(todas)
+    manifest['todos']['version'] = versiones['todos']
+
+    ruta_manifest.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+    return manifest
+
+
+def main():
+    from carga_masiva import CONFIG, crear_conexion
+
+    if not CONFIG['supabase_url'] or not CONFIG['supabase_key']:
+        print("❌ Error: Faltan credenciales de Supabase en .env")
+        sys.exit(1)
+
+    conexion = crear_conexion()
+    manifest = generar_snapshots(conexion, CONFIG['muros'], CONFIG['carpeta_snapshots'])
+    for nombre, entrada in manifest.items():
+        print(f"🗺️  {nombre}: {entrada['total']} PKs ({entrada['bytes'] / 1024:.1f} KB, etag {entrada['etag']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Los módulos del script se importan por nombre (como en revanchas.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,56 @@
+"""Planillas dentro de .zip: hash por miembro y nombres que se repiten."""
+
+import zipfile
+
+from catalogo import listar_zip
+from cola_fallidos import guardar_fallido
+from lote_mediciones import LoteMediciones
+
+
+def _zip(ruta, miembros):
+    with zipfile.ZipFile(ruta, 'w') as contenedor:
+        for nombre, contenido in miembros.items():
+            contenedor.writestr(nombre, contenido)
+    return ruta
+
+
+def test_hash_por_miembro(tmp_path):
+    ruta = _zip(tmp_path / '2019.zip', {
+        'enero/revanchas.xlsx': b'uno',
+        'febrero/revanchas.xlsx': b'dos',
+        '__MACOSX/enero/._revanchas.xlsx': b'x',
+        'enero/~$revanchas.xlsx': b'x',
+    })
+
+    entradas = list(listar_zip('Este', ruta))
+
+    # Metadatos de macOS y bloqueos de Excel se ignoran
+    assert [e.miembro for e in entradas] == ['enero/revanchas.xlsx', 'febrero/revanchas.xlsx']
+    enero, febrero = entradas
+    assert enero.nombre == febrero.nombre == 'revanchas.xlsx'
+    assert enero.hash == f"{zipfile.crc32(b'uno'):08x}-3"
+    assert enero.hash != febrero.hash
+    assert enero.clave != febrero.clave
+    assert enero.leer() == b'uno'
+    assert enero.origen == {'contenedor': '2019.zip', 'miembro': 'enero/revanchas.xlsx'}
+
+
+def test_hash_cambia_con_el_contenido(tmp_path):
+    antes = next(listar_zip('Este', _zip(tmp_path / 'a.zip', {'r.xlsx': b'uno'})))
+    despues = next(listar_zip('Este', _zip(tmp_path / 'b.zip', {'r.xlsx': b'otro'})))
+
+    assert antes.hash != despues.hash
+    assert antes.clave[1:] != despues.clave[1:]
+
+
+def test_fallidos_de_miembros_con_el_mismo_nombre(tmp_path):
+    enero, febrero = listar_zip('Este', _zip(tmp_path / '2019.zip', {
+        'enero/revanchas.xlsx': b'uno', 'febrero/revanchas.xlsx': b'dos'}))
+    datos = {'fecha': '2019-01-15', 'total_registros': 0, 'mediciones': LoteMediciones()}
+    carpeta = tmp_path / '_fallidos'
+
+    _, ruta_enero = guardar_fallido(datos, enero.nombre, 'Este', 'timeout', carpeta, origen=enero.origen)
+    _, ruta_febrero = guardar_fallido(datos, febrero.nombre, 'Este', 'timeout', carpeta, origen=febrero.origen)
+
+    assert ruta_enero != ruta_febrero
+    assert ruta_enero.exists() and ruta_febrero.exists()
@@ -0,0 +1,102 @@
+"""Cola compartida: leases, retoma de huérfanos y claves (muro, fecha) ocupadas."""
+
+import time
+
+from catalogo import EntradaCatalogo
+from cola_trabajo import MAX_INTENTOS, Trabajador, abrir_cola, encolar, eventos_cola
+
+
+def _cola(tmp_path, *nombres):
+    ruta = str(tmp_path / 'cola.sqlite')
+    conexion = abrir_cola(ruta)
+    encolar(conexion, [EntradaCatalogo('Este', n, tmp_path / n, 10, 0.0) for n in nombres])
+    conexion.close()
+    return ruta
+
+
+def _vencer_lease(ruta, id_trabajo):
+    conexion = abrir_cola(ruta)
+    conexion.execute('UPDATE trabajos SET lease_hasta = ? WHERE id = ?', (time.time() - 1, id_trabajo))
+    conexion.close()
+
+
+def test_lease_excluye_a_otros_trabajadores(tmp_path):
+    ruta = _cola(tmp_path, 'a.xlsx')
+
+    with Trabajador(ruta, 'A') as a, Trabajador(ruta, 'B') as b:
+        id_a, entrada = a.tomar()
+        assert entrada.nombre == 'a.xlsx'
+        assert b.tomar() is None
+        # B espera: el archivo de A sigue en curso
+        assert b.quedan()
+        assert a.completar(id_a, 'exitoso')
+        assert not b.quedan()
+
+
+def test_lease_vencido_se_retoma(tmp_path):
+    ruta = _cola(tmp_path, 'a.xlsx')
+
+    with Trabajador(ruta, 'A') as a, Trabajador(ruta, 'B') as b:
+        id_a, _ = a.tomar()
+        _vencer_lease(ruta, id_a)
+
+        id_b, _ = b.tomar()
+        assert id_b == id_a
+        # A perdió el lease: su resultado no pisa el de B
+        assert not a.completar(id_a, 'error', 'tarde')
+        assert b.completar(id_b, 'error', 'formato inválido')
+
+    conexion = abrir_cola(ruta)
+    fila = conexion.execute('SELECT estado, trabajador, intentos, error FROM trabajos').fetchone()
+    assert tuple(fila) == ('error', 'B', 2, 'formato inválido')
+    assert [e['error'] for e in eventos_cola(conexion)] == ['formato inválido']
+    conexion.close()
+
+
+def test_huerfano_agota_sus_intentos(tmp_path):
+    ruta = _cola(tmp_path, 'a.xlsx')
+
+    with Trabajador(ruta, 'A') as a:
+        for _ in range(MAX_INTENTOS):
+            id_a, _ = a.tomar()
+            _vencer_lease(ruta, id_a)
+        assert a.tomar() is None
+
+    conexion = abrir_cola(ruta)
+    assert conexion.execute('SELECT estado FROM trabajos').fetchone()[0] == 'error'
+    conexion.close()
+
+
+def test_clave_ocupada_vuelve_a_la_cola(tmp_path):
+    ruta = _cola(tmp_path, 'a.xlsx', 'b.xlsx')
+
+    with Trabajador(ruta, 'A') as a, Trabajador(ruta, 'B') as b:
+        id_a, _ = a.tomar()
+        id_b, _ = b.tomar()
+        assert a.asignar_fecha(id_a, '2024-01-15')
+        # Mismo muro y fecha que el archivo en curso de A
+        assert not b.asignar_fecha(id_b, '2024-01-15')
+
+        conexion = abrir_cola(ruta)
+        fila = conexion.execute('SELECT estado, trabajador, intentos FROM trabajos WHERE id = ?',
+                                (id_b,)).fetchone()
+        assert tuple(fila) == ('pendiente', None, 0)
+        conexion.close()
+
+        # No se retoma mientras A tenga la clave; sí cuando la libera
+        assert b.tomar() is None
+        assert a.completar(id_a, 'exitoso')
+        id_retomado, entrada = b.tomar()
+        assert (id_retomado, entrada.nombre) == (id_b, 'b.xlsx')
+        assert b.asignar_fecha(id_b, '2024-01-15')
+
+
+def test_cerrar_devuelve_lo_tomado(tmp_path):
+    ruta = _cola(tmp_path, 'a.xlsx')
+
+    with Trabajador(ruta, 'A') as a:
+        a.tomar()
+
+    with Trabajador(ruta, 'B') as b:
+        _, entrada = b.tomar()
+        assert entrada.ruta == tmp_path / 'a.xlsx'
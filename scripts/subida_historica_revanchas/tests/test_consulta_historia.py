@@ -0,0 +1,58 @@
+"""Historia por fecha leída desde un espejo local de dos archivos."""
+
+from espejo_local import abrir_espejo
+from consulta_historia import HistoriaPKs
+
+
+def _espejo(ruta):
+    espejo = abrir_espejo(str(ruta))
+    with espejo:
+        espejo.executemany(
+            'INSERT INTO revanchas_archivos (id, muro, fecha_medicion, archivo_nombre) VALUES (?, ?, ?, ?)',
+            [(1, 'Este', '2023-01-10', 'enero.xlsx'), (2, 'Este', '2023-03-05', 'marzo.xlsx')])
+        espejo.executemany(
+            'INSERT INTO revanchas_mediciones (id, archivo_id, sector, pk, revancha) VALUES (?, ?, ?, ?, ?)',
+            [(1, 1, 'S1', '0+000', 3.6), (2, 1, 'S1', '0+020', 2.9),
+             (3, 2, 'S1', '0+000', 3.1), (4, 2, 'S1', '0+040', None)])
+    espejo.close()
+    return str(ruta)
+
+
+def test_al_desde_espejo(tmp_path):
+    historia = HistoriaPKs.desde_espejo(_espejo(tmp_path / 'espejo.sqlite'), ['Este'])
+
+    assert len(historia) == 4
+    assert historia.al('2022-12-31') == []
+
+    febrero = {f['pk']: f for f in historia.al('2023-02-01')}
+    assert set(febrero) == {'0+000', '0+020'}
+    assert febrero['0+000']['revancha'] == 3.6
+    assert febrero['0+000']['archivo_nombre'] == 'enero.xlsx'
+
+    marzo = {f['pk']: f for f in historia.al('2023-03-05')}
+    assert marzo['0+000']['revancha'] == 3.1
+    assert marzo['0+020']['fecha_medicion'] == '2023-01-10'
+    assert marzo['0+040']['revancha'] is None
+
+
+def test_entre_desde_espejo(tmp_path):
+    historia = HistoriaPKs.desde_espejo(_espejo(tmp_path / 'espejo.sqlite'), ['Este'])
+
+    filas = historia.entre('2023-01-01', '2023-02-28')
+    assert [(f['pk'], f['fecha_medicion']) for f in filas] == [('0+000', '2023-01-10'), ('0+020', '2023-01-10')]
+    assert historia.entre('2023-01-01', '2023-12-31', muro='Oeste') == []
+
+
+def test_agrupa_por_pk_maestro(tmp_path):
+    ruta = _espejo(tmp_path / 'espejo.sqlite')
+    espejo = abrir_espejo(ruta)
+    with espejo:
+        espejo.execute('INSERT INTO revanchas_archivos (id, muro, fecha_medicion, archivo_nombre) '
+                       "VALUES (3, 'Este', '2023-04-02', 'abril.xlsx')")
+        espejo.execute('INSERT INTO revanchas_mediciones (id, archivo_id, sector, pk, revancha, pk_maestro, distancia_pk) '
+                       "VALUES (5, 3, 'S1', '0.0199999', 2.7, '0+020', 0.0)")
+    espejo.close()
+
+    abril = {f['pk']: f for f in HistoriaPKs.desde_espejo(ruta, ['Este']).al('2023-04-30')}
+    assert set(abril) == {'0+000', '0+020', '0+040'}
+    assert abril['0+020']['revancha'] == 2.7
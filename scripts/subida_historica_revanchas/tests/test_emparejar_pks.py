@@ -0,0 +1,81 @@
+"""PKs fuera de formato ubicados en el maestro por cadenamiento (m o km)."""
+
+import math
+
+import numpy as np
+
+from emparejar_pks import IndicePKs, MaestroMuro, cadenamiento
+from espejo_local import EspejoLocal, abrir_espejo
+from lote_mediciones import LoteMediciones
+
+
+def _espejo(tmp_path):
+    ruta = str(tmp_path / 'espejo.sqlite')
+    conexion = abrir_espejo(ruta)
+    conexion.executemany(
+        'INSERT INTO pks_maestro (muro, pk, activo) VALUES (?, ?, ?)',
+        [('Este', pk, 1) for pk in ('0+000', '0+020', '0+060', '0+740', '1+000', 'P-12')]
+        # Un PK desactivado y uno de otro muro no cuentan
+        + [('Este', '0+736', 0), ('Oeste', '0+736', 1)],
+    )
+    conexion.commit()
+    conexion.close()
+    return EspejoLocal(ruta)
+
+
+def test_cadenamiento():
+    assert cadenamiento('1+234.5') == (1234.5, True)
+    assert cadenamiento(' 0 + 550,8 ') == (550.8, True)
+    assert cadenamiento('736.45') == (736.45, False)
+    assert cadenamiento('12') == (12.0, False)
+    valor, estandar = cadenamiento('P-12')
+    assert math.isnan(valor) and not estandar
+
+
+def test_mas_cercano():
+    maestro = MaestroMuro(['1+000', '0+000', '0+500', 'P-12'])
+    assert maestro.pks == ['0+000', '0+500', '1+000']
+
+    indices, distancias = maestro.mas_cercano(np.array([-3.0, 240.0, 260.0, 1200.0, np.nan]))
+    assert [maestro.pks[i] for i in indices[:4]] == ['0+000', '0+000', '0+500', '1+000']
+    np.testing.assert_allclose(distancias, [3.0, 240.0, 240.0, 200.0, np.inf])
+
+    # Maestro de un solo PK y maestro vacío
+    _, distancias = MaestroMuro(['0+100']).mas_cercano(np.array([90.0]))
+    assert distancias.tolist() == [10.0]
+    _, distancias = MaestroMuro([]).mas_cercano(np.array([1.0, 2.0]))
+    assert np.isinf(distancias).all()
+
+
+def test_emparejar_metros_y_kilometros(tmp_path):
+    indice = IndicePKs(espejo=_espejo(tmp_path))
+
+    pks, distancias = indice.emparejar_pks(
+        'Este', ['0+020', '0.05999999999994543', '736.45', '2.75', '500', 'P-7', '736.45'])
+
+    # "0.0599..." en km es 0+060; "736.45" en metros cae a 3.55 m de 0+740
+    assert pks == ['0+020', '0+060', '0+740', '0+000', None, None, '0+740']
+    np.testing.assert_allclose(distancias[:4], [0.0, 0.0, 3.55, 2.75], atol=1e-6)
+    assert np.isnan(distancias[4:6]).all()
+
+
+def test_emparejar_con_tolerancia(tmp_path):
+    indice = IndicePKs(espejo=_espejo(tmp_path), tolerancia=1)
+
+    pks, _ = indice.emparejar_pks('Este', ['736.45', '2.75', '0.06', '0+020.5'])
+
+    assert pks == [None, None, '0+060', '0+020']
+
+
+def test_emparejar_lote(tmp_path):
+    indice = IndicePKs(espejo=_espejo(tmp_path))
+    lote = LoteMediciones()
+    for pk in ('0+020', '736.45', '500'):
+        lote.agregar('S1', pk, {'revancha': 1.0})
+
+    resumen = indice.emparejar('Este', lote)
+
+    assert resumen == {'pks_rescatados': 1, 'pks_sin_maestro': 1}
+    assert lote.pk_maestro == ['0+020', '0+740', None]
+    # Sin maestro para el muro: el lote queda como estaba
+    assert indice.emparejar('Norte', LoteMediciones()) == {}
@@ -0,0 +1,43 @@
+"""Sectores en celdas combinadas resueltos con el índice de intervalos."""
+
+from openpyxl import Workbook
+
+from carga_masiva import IndiceIntervalos, indice_celdas_combinadas
+
+
+def test_buscar_intervalos():
+    # Desordenados a propósito: el índice los ordena por inicio
+    indice = IndiceIntervalos([(20, 25, 'B'), (5, 10, 'A'), (30, 30, 'C')])
+
+    assert indice.buscar(5) == 'A'
+    assert indice.buscar(10) == 'A'
+    assert indice.buscar(22) == 'B'
+    assert indice.buscar(30) == 'C'
+    # Antes del primero, entre rangos y después del último
+    assert indice.buscar(4) is None
+    assert indice.buscar(11, por_defecto='-') == '-'
+    assert indice.buscar(31) is None
+
+
+def test_celdas_combinadas_del_sector():
+    hoja = Workbook().active
+    hoja['B8'] = 1
+    hoja.merge_cells('B8:B12')
+    hoja['B13'] = 2
+    hoja.merge_cells('B13:B20')
+    # Combinada en otra columna: no cuenta para la B
+    hoja['D8'] = 'otro'
+    hoja.merge_cells('D8:E30')
+
+    indice = indice_celdas_combinadas(hoja, 'B')
+
+    # Solo el ancla tiene valor; las demás filas del rango leen None
+    assert hoja['B10'].value is None
+    assert indice.buscar(10) == 1
+    assert indice.buscar(12) == 1
+    assert indice.buscar(13) == 2
+    assert indice.buscar(20) == 2
+    assert indice.buscar(21) is None
+
+    # Un rango que abarca varias columnas también cruza las intermedias
+    assert indice_celdas_combinadas(hoja, 'e').buscar(29) == 'otro'
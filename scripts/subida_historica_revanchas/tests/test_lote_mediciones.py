@@ -0,0 +1,50 @@
+"""Serialización del lote por columnas al JSON de PostgREST."""
+
+import json
+import math
+
+from lote_mediciones import COLUMNAS_NUMERICAS, LoteMediciones
+
+
+def _lote():
+    lote = LoteMediciones()
+    lote.agregar('S1', '0+000', {'revancha': 3.25, 'ancho': '18,5', 'lama': 'n/a'})
+    lote.agregar('S1', '0+020', {'revancha': 0.1 + 0.2, 'coronamiento': float('inf')})
+    # Comillas, barra invertida y acentos en los strings
+    lote.agregar('Sección "2"', 'PK\\ñ', {'geomembrana': -1e-7})
+    return lote
+
+
+def test_a_json_igual_a_filas():
+    lote = _lote()
+
+    assert json.loads(lote.a_json()) == list(lote.filas())
+    assert json.loads(lote.a_json(archivo_id=42)) == list(lote.filas(42))
+
+
+def test_a_json_ida_y_vuelta():
+    lote = _lote()
+    filas = json.loads(lote.a_json())
+
+    # Sin dato (NaN, texto, infinito) viaja como null; los floats sin pérdida
+    assert filas[0]['revancha'] == 3.25
+    assert filas[0]['ancho'] is None and filas[0]['lama'] is None
+    assert filas[1]['revancha'] == 0.1 + 0.2
+    assert filas[1]['coronamiento'] is None
+    assert filas[2]['sector'] == 'Sección "2"' and filas[2]['pk'] == 'PK\\ñ'
+
+    copia = LoteMediciones.desde_filas(filas)
+    assert copia.sector == lote.sector and copia.pk == lote.pk
+    for nombre in COLUMNAS_NUMERICAS:
+        for original, leido in zip(lote.columnas[nombre], copia.columnas[nombre]):
+            assert original == leido or (math.isnan(original) and math.isnan(leido))
+
+
+def test_a_json_con_pk_maestro():
+    lote = _lote()
+    lote.asignar_maestro(['0+000', '0+020', None], [0.0, 1.23456, None])
+    filas = json.loads(lote.a_json(7))
+
+    assert [f['pk_maestro'] for f in filas] == ['0+000', '0+020', None]
+    assert [f['distancia_pk'] for f in filas] == [0.0, 1.235, None]
+    assert filas == list(lote.filas(7))
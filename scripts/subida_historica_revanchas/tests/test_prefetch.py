@@ -0,0 +1,70 @@
+"""Lectura anticipada con memoria acotada."""
+
+import threading
+from pathlib import Path
+
+from catalogo import EntradaCatalogo
+from prefetch import Prefetch
+
+_candado = threading.Lock()
+_leidos = []  # tamaños leídos, en orden de lectura
+_memoria = {'liberados': 0, 'picos': []}
+
+
+class _Entrada(EntradaCatalogo):
+    def leer(self) -> bytes:
+        with _candado:
+            _leidos.append(self.tamano)
+            # Leídos y aún no liberados por el consumidor, al empezar esta lectura
+            _memoria['picos'].append(sum(_leidos) - _memoria['liberados'])
+        return b'x' * self.tamano
+
+
+def _entradas(tamanos):
+    return [_Entrada('Este', f'{i}.xlsx', Path(f'{i}.xlsx'), tamano, 0.0)
+            for i, tamano in enumerate(tamanos)]
+
+
+def _recorrer(prefetch):
+    """Archivos entregados y memoria ocupada al iniciar cada lectura."""
+    _leidos.clear()
+    _memoria.update(liberados=0, picos=[])
+    entregados = []
+    for entrada, fuente in prefetch:
+        entregados.append((entrada.nombre, fuente))
+        if fuente is not None:
+            assert len(fuente.getvalue()) == entrada.tamano
+            # Al pedir el siguiente, el consumidor ya soltó este buffer
+            with _candado:
+                _memoria['liberados'] += entrada.tamano
+    return entregados, _memoria['picos']
+
+
+def test_limite_incluye_el_buffer_entregado():
+    entradas = _entradas([40, 40, 40, 150, 40])
+
+    entregados, picos = _recorrer(Prefetch(entradas, k=4, max_bytes=100))
+
+    assert [nombre for nombre, _ in entregados] == [e.nombre for e in entradas]
+    # Cabrían tres de 40 en vuelo, pero el entregado sigue contando
+    assert len(picos) == 5
+    assert all(pico <= 80 for pico, tamano in zip(picos, _leidos) if tamano == 40)
+    # El archivo de 150 (mayor que el límite) se lee solo
+    assert picos[_leidos.index(150)] == 150
+
+
+def test_k_acota_los_archivos_adelantados():
+    _, picos = _recorrer(Prefetch(_entradas([10] * 6), k=2, max_bytes=1000))
+
+    # K adelantados más el que usa el consumidor
+    assert max(picos) <= (2 + 1) * 10
+
+
+def test_omitidos_no_se_leen():
+    entradas = _entradas([10, 20, 30])
+
+    entregados, _ = _recorrer(Prefetch(entradas, omitir=lambda e: e.tamano == 20))
+
+    assert [nombre for nombre, _ in entregados] == ['0.xlsx', '1.xlsx', '2.xlsx']
+    assert entregados[1][1] is None
+    assert sorted(_leidos) == [10, 30]
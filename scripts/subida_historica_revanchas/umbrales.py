@@ -0,0 +1,48 @@
+"""
+Umbrales de Revanchas (mismos que las vistas SQL)
+=================================================
+
+Replica en Python las clases de color de vista_revanchas_georreferenciadas
+(ver CORREGIR_VISTAS_REVANCHAS.sql) para que los archivos generados por
+los scripts usen exactamente la misma clasificación que el mapa.
+
+    revancha:      >= 3.5 verde | >= 3.0 amarillo | < 3.0 rojo
+    ancho:         >= 18  verde | >= 15  amarillo | < 15  rojo
+    dist_geo_lama: >= 1.0 verde | >= 0.5 amarillo | < 0.5 rojo
+"""
+
+from typing import Optional
+
+# (límite verde, límite amarillo) por métrica
+UMBRALES = {
+    'revancha': (3.5, 3.0),
+    'ancho': (18.0, 15.0),
+    'dist_geo_lama': (1.0, 0.5),
+}
+
+# Columna de color de la vista SQL para cada métrica
+COLUMNAS_COLOR = {
+    'revancha': 'color_revancha',
+    'ancho': 'color_ancho',
+    'dist_geo_lama': 'color_dist_geo',
+}
+
+
+def clasificar(metrica: str, valor: Optional[float]) -> Optional[str]:
+    """Retorna 'verde', 'amarillo', 'rojo' o None (sin valor)."""
+    if valor is None:
+        return None
+    verde, amarillo = UMBRALES[metrica]
+    if valor >= verde:
+        return 'verde'
+    if valor >= amarillo:
+        return 'amarillo'
+    return 'rojo'
+
+
+def colores(medicion: dict) -> dict:
+    """Agrega las columnas color_* de la vista SQL a partir de una medición."""
+    return {
+        columna: clasificar(metrica, medicion.get(metrica))
+        for metrica, columna in COLUMNAS_COLOR.items()
+    }
@@ -1,31 +1,73 @@
-from supabase import create_client
-from dotenv import load_dotenv
+"""
+Verificación rápida de los archivos de revanchas cargados en Supabase.
+
+Si existe el espejo local (`python revanchas.py sync`) se lee desde ahí,
+sin consultar Supabase; con `--en-vivo` se consulta la BD directamente.
+
+Uso:
+    python verificar_bd.py
+    python revanchas.py verify --muro Este
+    python revanchas.py sync verify --muro Este
+    python revanchas.py verify --muro Este --en-vivo
+"""
+
 import os
+from pathlib import Path
+from typing import Optional
+
+
+def _consultar_supabase(muro: str):
+    from supabase import create_client
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    supabase = create_client(
+        os.getenv('PUBLIC_SUPABASE_URL'),
+        os.getenv('SUPABASE_SERVICE_KEY')
+    )
+
+    archivos = supabase.table('revanchas_archivos').select('*').eq('muro', muro).execute().data
+    mediciones = supabase.table('revanchas_mediciones').select('pk').limit(5).execute().data
+    return archivos, [m['pk'] for m in mediciones]
+
+
+def _consultar_espejo(muro: str, ruta: str):
+    from espejo_local import EspejoLocal
+
+    espejo = EspejoLocal(ruta)
+    try:
+        print(f"🗄️  Leyendo espejo local {ruta} (sincronizado {espejo.ultima_sincronizacion()})")
+        return espejo.archivos(muro), espejo.ejemplos_pk()
+    finally:
+        espejo.cerrar()
+
+
+def main(muro: str = 'Principal', espejo: Optional[str] = None):
+    if espejo and Path(espejo).exists():
+        archivos, pks = _consultar_espejo(muro, espejo)
+        origen = 'ESPEJO LOCAL'
+    else:
+        archivos, pks = _consultar_supabase(muro)
+        origen = 'SUPABASE'
+
+    # Verificar archivos del muro
+    print(f"\n📊 ARCHIVOS DE {muro.upper()} EN {origen}: {len(archivos)}\n")
+
+    if archivos:
+        print("Primeros 20 archivos:")
+        for r in archivos[:20]:
+            print(f"  {r['id']}: {r['fecha_medicion']} - {r['archivo_nombre']}")
+        
+        print(f"\n... y {len(archivos) - 20} más") if len(archivos) > 20 else None
+    else:
+        print(f"✅ No hay archivos de {muro} en la BD")
+
+    # Verificar constraint del campo pk
+    print("\n🔍 VERIFICANDO CONSTRAINT DE PK...")
+    for pk in pks:
+        print(f"  PK ejemplo: '{pk}' (longitud: {len(pk)})")
+
 
-load_dotenv()
-
-supabase = create_client(
-    os.getenv('PUBLIC_SUPABASE_URL'),
-    os.getenv('SUPABASE_SERVICE_KEY')
-)
-
-# Verificar archivos de Principal
-result = supabase.table('revanchas_archivos').select('*').eq('muro', 'Principal').execute()
-
-print(f"\n📊 ARCHIVOS DE PRINCIPAL EN SUPABASE: {len(result.data)}\n")
-
-if result.data:
-    print("Primeros 20 archivos:")
-    for r in result.data[:20]:
-        print(f"  {r['id']}: {r['fecha_medicion']} - {r['archivo_nombre']}")
-    
-    print(f"\n... y {len(result.data) - 20} más") if len(result.data) > 20 else None
-else:
-    print("✅ No hay archivos de Principal en la BD")
-
-# Verificar constraint del campo pk
-print("\n🔍 VERIFICANDO CONSTRAINT DE PK...")
-mediciones = supabase.table('revanchas_mediciones').select('pk').limit(5).execute()
-if mediciones.data:
-    for m in mediciones.data:
-        print(f"  PK ejemplo: '{m['pk']}' (longitud: {len(m['pk'])})")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+// =====================================================
+// API ENDPOINT: Versión de los Archivos de Revanchas
+// GET /api/revanchas/version - Total e ID máximo de revanchas_archivos
+// =====================================================
+
+import type { APIRoute } from 'astro';
+import { supabase } from '../../../lib/supabase';
+
+/**
+ * GET /api/revanchas/version
+ * Query params:
+ *   - muro: 'Principal' | 'Este' | 'Oeste' (opcional, sin muro = todos)
+ *
+ * El dashboard compara esta versión con la del manifest de los snapshots
+ * GeoJSON: cualquier carga o eliminación de archivos la cambia, y entonces
+ * el mapa usa la consulta en vivo en vez del snapshot.
+ */
+export const GET: APIRoute = async ({ url }) => {
+  try {
+    const muro = url.searchParams.get('muro');
+
+    let query = supabase
+      .from('revanchas_archivos')
+      .select('id', { count: 'exact' })
+      .order('id', { ascending: false })
+      .limit(1);
+
+    if (muro) {
+      query = query.eq('muro', muro);
+    }
+
+    const { data, count, error } = await query;
+
+    if (error) {
+      console.error('❌ Error al consultar la versión de revanchas:', error);
+      return new Response(
+        JSON.stringify({
+          error: 'Error al consultar la versión',
+          detalles: error.message,
+        }),
+        { status: 500, headers: { 'Content-Type': 'application/json' } }
+      );
+    }
+
+    return new Response(
+      JSON.stringify({ total: count ?? 0, max_id: data?.[0]?.id ?? 0 }),
+      {
+        status: 200,
+        headers: { 'Content-Type': 'application/json', 'Cache-Control': 'no-store' },
+      }
+    );
+  } catch (error) {
+    console.error('❌ Error inesperado en GET /api/revanchas/version:', error);
+    return new Response(
+      JSON.stringify({
+        error: 'Error interno del servidor',
+        detalles: error instanceof Error ? error.message : String(error),
+      }),
+      { status: 500, headers: { 'Content-Type': 'application/json' } }
+    );
+  }
+};